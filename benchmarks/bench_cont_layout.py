@@ -0,0 +1,94 @@
+"""Benchmark reading random trial windows from CONT groups with different chunk layouts.
+
+Run with `python benchmarks/bench_cont_layout.py [--seconds 600] [--channels 64]`.
+Each read fetches a window of `--window` seconds from all channels of a
+multi-channel CONT group, with the file opened anew to avoid HDF5's chunk cache.
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import h5py
+import numpy as np
+from dh5io.create import create_dh_file
+from dhspec.cont import create_empty_index_array
+
+from oecon.storage import ChunkLayout, create_cont_group_from_data
+
+SAMPLE_RATE = 1000  # LFP
+
+
+def write_file(path: Path, data: np.ndarray, layout: ChunkLayout | None) -> float:
+    start = time.perf_counter()
+    dh5file = create_dh_file(path, overwrite=True, validate=False)
+    create_cont_group_from_data(
+        dh5file._file,
+        2001,
+        data=data,
+        index=create_empty_index_array(1),
+        sample_period_ns=np.int32(1e9 / SAMPLE_RATE),
+        chunk_layout=layout,
+    )
+    dh5file._file.close()
+    return time.perf_counter() - start
+
+
+def read_windows(path: Path, window_starts: np.ndarray, window: int) -> list[float]:
+    latencies = []
+    for window_start in window_starts:
+        start = time.perf_counter()
+        with h5py.File(path, "r") as file:
+            file["CONT2001/DATA"][window_start : window_start + window]
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seconds", type=float, default=600.0)
+    parser.add_argument("--channels", type=int, default=64)
+    parser.add_argument("--window", type=float, default=2.0)
+    parser.add_argument("--reads", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    n_samples = int(args.seconds * SAMPLE_RATE)
+    data = rng.integers(-2000, 2000, size=(n_samples, args.channels), dtype=np.int16)
+    window = int(args.window * SAMPLE_RATE)
+    window_starts = rng.integers(0, n_samples - window, size=args.reads)
+
+    layouts = {
+        "contiguous": None,
+        "h5py guess": ChunkLayout("auto"),
+        "fixed 4096 x 1 channel": ChunkLayout(
+            "fixed", chunk_samples=4096, chunk_channels=1
+        ),
+        "time window 1 s": ChunkLayout("time_window", window_s=1.0),
+        f"auto for {args.window} s reads": ChunkLayout(
+            "auto", expected_read_s=args.window
+        ),
+    }
+
+    print(
+        f"Reading {args.reads} random {args.window} s windows from "
+        f"{args.seconds} s x {args.channels} channels at {SAMPLE_RATE} Hz"
+    )
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, layout in layouts.items():
+            path = Path(tmpdir) / "layout.dh5"
+            write_s = write_file(path, data, layout)
+            latencies = read_windows(path, window_starts, window)
+            with h5py.File(path, "r") as file:
+                chunks = file["CONT2001/DATA"].chunks
+            print(
+                f"{name:>28}: chunks {str(chunks):>12}, write {write_s:6.2f} s, "
+                f"read median {1e3 * statistics.median(latencies):7.2f} ms, "
+                f"p95 {1e3 * np.percentile(latencies, 95):7.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Benchmark the decimation engines on a synthetic 30 kHz recording.
+
+Run with `python benchmarks/bench_decimation.py [--seconds 60] [--channels 4]`.
+"""
+
+import argparse
+import timeit
+
+import numpy as np
+import scipy.signal as signal
+
+from oecon.decimation import (
+    decimate_np_array,
+    design_decimation_fir,
+    plan_decimation_stages,
+)
+
+SAMPLE_RATE = 30000
+DOWNSAMPLING_FACTOR = 30
+FILTER_ORDER = 600
+
+
+def full_rate_fir(data: np.ndarray) -> np.ndarray:
+    """FIR filtering at the full rate, then discarding all but every q-th sample."""
+    b = design_decimation_fir(DOWNSAMPLING_FACTOR, FILTER_ORDER)
+    delay = (len(b) - 1) // 2
+    padded = np.concatenate((data, np.zeros((delay,) + data.shape[1:])), axis=0)
+    filtered = signal.lfilter(b, 1.0, padded, axis=0)
+    return filtered[delay::DOWNSAMPLING_FACTOR]
+
+
+def decimate_with(filter_type: str, multistage: bool = False):
+    stages = (
+        plan_decimation_stages(DOWNSAMPLING_FACTOR, FILTER_ORDER) if multistage else None
+    )
+
+    def run(data: np.ndarray) -> np.ndarray:
+        return decimate_np_array(
+            data=data,
+            downsampling_factor=DOWNSAMPLING_FACTOR,
+            filter_order=FILTER_ORDER,
+            filter_type=filter_type,
+            axis=0,
+            zero_phase=True,
+            stages=stages,
+        )
+
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seconds", type=float, default=60.0)
+    parser.add_argument("--channels", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    data = rng.normal(size=(int(args.seconds * SAMPLE_RATE), args.channels))
+
+    engines = {
+        "full-rate lfilter + [::q]": full_rate_fir,
+        "fir (scipy.signal.decimate)": decimate_with("fir"),
+        "polyphase": decimate_with("polyphase"),
+        "polyphase, multistage": decimate_with("polyphase", multistage=True),
+    }
+
+    print(
+        f"Decimating {args.seconds} s x {args.channels} channels at {SAMPLE_RATE} Hz "
+        f"by {DOWNSAMPLING_FACTOR} (n={FILTER_ORDER})"
+    )
+    timings = {}
+    for name, engine in engines.items():
+        timings[name] = min(
+            timeit.repeat(lambda: engine(data), number=1, repeat=args.repeat)
+        )
+
+    reference = timings["full-rate lfilter + [::q]"]
+    for name, seconds in timings.items():
+        print(f"{name:>30}: {seconds:8.3f} s ({reference / seconds:6.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
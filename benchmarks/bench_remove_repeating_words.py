@@ -0,0 +1,64 @@
+"""Benchmark removing repeated full words of simultaneous network events.
+
+Run with `python benchmarks/bench_remove_repeating_words.py [--events 10000000]`.
+Each sample sets a random number of lines, which the Network Events plugin
+records as one event per changed line.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from oecon.events import Event, EventMetadata, remove_repeating_simultaneous_words
+
+
+def create_event(n_events: int, max_lines: int, rng: np.random.Generator) -> Event:
+    lines_per_sample = rng.integers(1, max_lines + 1, n_events)
+    n_samples = np.searchsorted(np.cumsum(lines_per_sample), n_events) + 1
+    lines_per_sample = lines_per_sample[:n_samples]
+    sample_numbers = np.repeat(np.arange(n_samples) * 30, lines_per_sample)[:n_events]
+    full_words = np.repeat(
+        rng.integers(0, 2**16, n_samples, dtype=np.uint64), lines_per_sample
+    )[:n_events]
+    return Event(
+        metadata=EventMetadata(
+            channel_name="",
+            folder_name="",
+            identifier="",
+            sample_rate=30000.0,
+            stream_name="",
+            type="",
+            description="",
+            source_processor="Network Events",
+        ),
+        full_words=full_words,
+        timestamps=sample_numbers / 30000.0,
+        states=np.ones(n_events, dtype=np.int16),
+        sample_numbers=sample_numbers,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=10_000_000)
+    parser.add_argument("--max-lines", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    event = create_event(args.events, args.max_lines, np.random.default_rng(42))
+    durations = []
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        full_word_data = remove_repeating_simultaneous_words(event)
+        durations.append(time.perf_counter() - start)
+
+    best = min(durations)
+    print(
+        f"{len(event)} events -> {len(full_word_data)} full words: "
+        f"best {1e3 * best:.1f} ms ({len(event) / best / 1e6:.0f} M events/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
 import argparse
+import h5py
 from oecon import convert_open_ephys_recording_to_dh5
 from oecon.config import load_config_from_file
+from oecon.filters import default_cache_dir, set_filter_cache_dir
+from oecon.raw import is_linked_to_external_raw_data, materialize_external_raw_data
 from pathlib import Path
 from open_ephys.analysis.session import Session
 import tkinter as tk
@@ -95,6 +98,14 @@ def main():
         "--config", type=str, help="Path to the configuration JSON file."
     )
     parser.add_argument("--tdr", type=str, help="Path to the TDR file.")
+    parser.add_argument(
+        "--filter-cache-dir",
+        type=str,
+        nargs="?",
+        const=str(default_cache_dir()),
+        default=None,
+        help="Persist filter designs in this directory, the per-user cache directory if no path is given.",
+    )
 
     # If oe_session is not provided, open a file dialog to pick it
     args, unknown = parser.parse_known_args()
@@ -103,6 +114,9 @@ def main():
     if args.oe_session is None:
         return
 
+    if args.filter_cache_dir is not None:
+        set_filter_cache_dir(args.filter_cache_dir)
+
     # attempt to load config from path if present
     if args.config:
         config = load_config_from_file(args.config)
@@ -138,6 +152,47 @@ def main():
             recording_index += 1
 
 
+def materialize_main():
+    # oecon-materialize <dh5-file> [<dh5-file> ...]
+    parser = argparse.ArgumentParser(
+        description="Copy raw data linked to Open Ephys files into DH5 files, making them self-contained."
+    )
+    parser.add_argument("dh5_files", type=str, nargs="+", help="Path to DH5 file(s).")
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=2**16,
+        help="Number of samples copied at once.",
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        default=None,
+        help="Configuration JSON file whose raw_config sets the chunk layout and compression. Defaults to the <dh5-file>.config.json written by the conversion.",
+    )
+    args = parser.parse_args()
+
+    for dh5_file in args.dh5_files:
+        # store the raw data as the conversion would have copied it
+        config_path = Path(dh5_file).with_suffix(".config.json")
+        raw_config = None
+        if args.config:
+            raw_config = load_config_from_file(args.config).raw_config
+        elif config_path.exists():
+            raw_config = load_config_from_file(config_path).raw_config
+        with h5py.File(dh5_file, "r+") as file:
+            if not is_linked_to_external_raw_data(file):
+                logger.info(f"{dh5_file} contains no linked raw data")
+                continue
+            logger.info(f"Materializing linked raw data in {dh5_file}")
+            materialize_external_raw_data(
+                file,
+                chunk_size=args.chunk_size,
+                chunk_layout=raw_config.chunk_layout if raw_config else None,
+                compression=raw_config.compression if raw_config else None,
+            )
+
+
 if __name__ == "__main__":
     try:
         main()
@@ -2,17 +2,22 @@ import logging
 import os
 from dataclasses import dataclass, field
 from os import PathLike
+from typing import TypeVar
 
 from oecon.decimation import DecimationConfig
-from oecon.events import EventPreprocessingConfig
+from oecon.events import EventPreprocessingConfig, EventSource
 from oecon.raw import RawConfig
 from oecon.trialmap import TrialMapConfig
-from oecon.mua import ContinuousMuaConfig
+from oecon.mua import ContinuousMuaConfig, FilterConfigBA, MuaBand
+from oecon.storage import ChunkLayout, Compression
+import oecon.default_mappings as default
 
 VERSION = 1
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 
 @dataclass
 class SpikeCuttingConfig:
@@ -27,6 +32,8 @@ class OpenEphysToDhConfig:
     trialmap_config: TrialMapConfig | None
     spike_cutting_config: SpikeCuttingConfig | None
     continuous_mua_config: ContinuousMuaConfig | None
+    # compression of the CONT groups of each range, e.g. storage.DEFAULT_COMPRESSION_POLICY
+    compression_policy: dict[default.ContGroups, Compression] | None = None
     config_version: int = VERSION
     oecon_version: str = field(
         default_factory=lambda: __import__(
@@ -53,6 +60,52 @@ def save_config_to_file(config_filename: PathLike, config: OpenEphysToDhConfig)
         config_file.write(jsonstringconf)
 
 
+def apply_compression_policy(config: OpenEphysToDhConfig) -> None:
+    """Set the compression of each stage from `config.compression_policy`.
+
+    Compression set explicitly in a stage config is kept.
+    """
+    policy = config.compression_policy
+    if policy is None:
+        return
+    if config.raw_config is not None and config.raw_config.compression is None:
+        config.raw_config.compression = policy.get(default.ContGroups.RAW)
+    if (
+        config.decimation_config is not None
+        and config.decimation_config.compression is None
+    ):
+        config.decimation_config.compression = policy.get(default.ContGroups.LFP)
+    if (
+        config.continuous_mua_config is not None
+        and config.continuous_mua_config.compression is None
+    ):
+        config.continuous_mua_config.compression = policy.get(default.ContGroups.ESA)
+
+
+def _load_compression_policy(
+    policy: dict[str, dict] | None,
+) -> dict[default.ContGroups, Compression] | None:
+    if policy is None:
+        return None
+    return {
+        default.ContGroups(cont_group): Compression(**compression)
+        for cont_group, compression in policy.items()
+    }
+
+
+def _load_dataclass(cls: type[T], data: dict | None) -> T | None:
+    return cls(**data) if data is not None else None
+
+
+def _load_storage_options(config_data: dict) -> dict:
+    """`config_data` with its chunk layout and compression as dataclasses."""
+    return {
+        **config_data,
+        "chunk_layout": _load_dataclass(ChunkLayout, config_data.get("chunk_layout")),
+        "compression": _load_dataclass(Compression, config_data.get("compression")),
+    }
+
+
 def load_config_from_file(config_path: PathLike) -> OpenEphysToDhConfig:
     if not os.path.exists(config_path):
         raise FileNotFoundError(f"Configuration file not found: {config_path}")
@@ -74,16 +127,31 @@ def load_config_from_file(config_path: PathLike) -> OpenEphysToDhConfig:
             f"Configuration file version {config_data['config_version']} is newer than supported version {VERSION}."
         )
 
-    raw_config = config_data.get("raw_config", None)
-    if raw_config is not None:
-        raw_config = RawConfig(**raw_config)
+    raw_config = None
+    raw_config_data = config_data.get("raw_config", None)
+    if raw_config_data is not None:
+        raw_config = RawConfig(**_load_storage_options(raw_config_data))
+
+    decimation_config = None
+    decimation_config_data = config_data.get("decimation_config", None)
+    if decimation_config_data is not None:
+        decimation_config = DecimationConfig(
+            **_load_storage_options(decimation_config_data)
+        )
+
+    event_config = None
+    event_config_data = config_data.get("event_config", None)
+    if event_config_data is not None:
+        sources = event_config_data.get("sources", None)
+        event_config = EventPreprocessingConfig(
+            **{
+                **event_config_data,
+                "sources": [EventSource(**source) for source in sources]
+                if sources is not None
+                else None,
+            }
+        )
 
-    decimation_config = config_data.get("decimation_config", None)
-    if decimation_config is not None:
-        decimation_config = DecimationConfig(**decimation_config)
-    event_config = config_data.get("event_config", None)
-    if event_config is not None:
-        event_config = EventPreprocessingConfig(**event_config)
     trialmap_config = config_data.get("trialmap_config", None)
     if trialmap_config is not None:
         trialmap_config = TrialMapConfig(**trialmap_config)
@@ -91,9 +159,22 @@ def load_config_from_file(config_path: PathLike) -> OpenEphysToDhConfig:
     if spike_cutting_config is not None:
         spike_cutting_config = SpikeCuttingConfig(**spike_cutting_config)
 
-    continuous_mua_config = config_data.get("continuous_mua_config", None)
-    if continuous_mua_config is not None:
-        continuous_mua_config = ContinuousMuaConfig(**continuous_mua_config)
+    continuous_mua_config = None
+    continuous_mua_config_data = config_data.get("continuous_mua_config", None)
+    if continuous_mua_config_data is not None:
+        bands = continuous_mua_config_data.get("bands", None)
+        continuous_mua_config = ContinuousMuaConfig(
+            **{
+                **_load_storage_options(continuous_mua_config_data),
+                "filter_coecfficients_b_a": _load_dataclass(
+                    FilterConfigBA,
+                    continuous_mua_config_data.get("filter_coecfficients_b_a"),
+                ),
+                "bands": [MuaBand(**band) for band in bands]
+                if bands is not None
+                else None,
+            }
+        )
 
     # TODO: properly handle enums in dicts
 
@@ -104,4 +185,7 @@ def load_config_from_file(config_path: PathLike) -> OpenEphysToDhConfig:
         trialmap_config=trialmap_config,
         spike_cutting_config=spike_cutting_config,
         continuous_mua_config=continuous_mua_config,
+        compression_policy=_load_compression_policy(
+            config_data.get("compression_policy", None)
+        ),
     )
@@ -13,13 +13,14 @@ from oecon.config import (
     SpikeCuttingConfig,
     TrialMapConfig,
     ContinuousMuaConfig,
+    apply_compression_policy,
     save_config_to_file,
 )
 from oecon.decimation import decimate_raw_data
 from oecon.events import process_oe_events
 from oecon.raw import process_oe_raw_data
 from oecon.trialmap import process_oe_trialmap
-from oecon.mua import extract_continuous_mua
+from oecon.mua import extract_continuous_mua, extract_lfp_and_mua, validate_mua_config
 
 # Configure logging
 logging.basicConfig(
@@ -68,6 +69,11 @@ def convert_open_ephys_recording_to_dh5(
             spike_cutting_config=SpikeCuttingConfig(),
         )
 
+    apply_compression_policy(config)
+    if config.continuous_mua_config is not None:
+        # fail before the earlier stages are written
+        validate_mua_config(config.continuous_mua_config, recording)
+
     if config.raw_config is not None:
         config.raw_config = process_oe_raw_data(config.raw_config, recording, dh5file)
 
@@ -81,12 +87,30 @@ def convert_open_ephys_recording_to_dh5(
             config.trialmap_config, recording=recording, dh5file=dh5file
         )
 
-    if config.decimation_config is not None:
+    # the fused stage reads whole channels, chunked stages keep their memory bound
+    fuse_lfp_and_mua = (
+        config.decimation_config is not None
+        and config.continuous_mua_config is not None
+        and config.decimation_config.chunk_size is None
+        and config.continuous_mua_config.chunk_size is None
+    )
+    if fuse_lfp_and_mua:
+        # read each raw channel once for both LFP and MUA
+        assert config.decimation_config is not None
+        assert config.continuous_mua_config is not None
+        config.decimation_config, config.continuous_mua_config = extract_lfp_and_mua(
+            decimation_config=config.decimation_config,
+            mua_config=config.continuous_mua_config,
+            recording=recording,
+            dh5file=dh5file,
+        )
+
+    if config.decimation_config is not None and not fuse_lfp_and_mua:
         config.decimation_config = decimate_raw_data(
             config.decimation_config, recording=recording, dh5file=dh5file
         )
 
-    if config.continuous_mua_config is not None:
+    if config.continuous_mua_config is not None and not fuse_lfp_and_mua:
         decimation_config = config.decimation_config
         if decimation_config is None:
             decimation_config = DecimationConfig()
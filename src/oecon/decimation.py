@@ -1,48 +1,884 @@
 import logging
+import math
+import os
+import tempfile
+import time
+from collections.abc import Iterator
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
 from dataclasses import dataclass
+from typing import TypeVar
 
 import dh5io
-import dh5io.cont
 import dh5io.operations
 import dhspec
+import h5py
 import numpy as np
 import scipy.signal as signal
 from dh5io import DH5File
-from open_ephys.analysis.recording import Recording
+from open_ephys.analysis.recording import Continuous, ContinuousMetadata, Recording
 
 import oecon.version
-from oecon.scaling import scale_to_16_bit_range
+from oecon.filters import FilterSpec, design_filter
+from oecon.scaling import (
+    quantize_to_int16,
+    scale_chunks_to_16_bit_range,
+    scale_to_16_bit_range,
+)
+from oecon.storage import (
+    ChunkLayout,
+    Compression,
+    create_cont_group_from_data,
+    create_empty_cont_group,
+    create_start_index,
+    report_compression,
+)
 
 logger = logging.getLogger(__name__)
 
+# number of samples per channel clipped to the int16 range during quantization
+SATURATED_SAMPLES_ATTRIBUTE = "SaturatedSamples"
+
 
 @dataclass
 class DecimationConfig:
     downsampling_factor: int = 30
-    ftype: str = "fir"
+    ftype: str = "fir"  # "fir", "iir" or "polyphase"
     zero_phase: bool = True
     filter_order: int | None = 600
     included_channel_names: list[str] | None = None  # doall if None
     start_block_id: int = 2001
     scale_max_abs_to: np.int16 | None = None
+    scale_quantile: float | None = None  # with scale_max_abs_to: scale this quantile of |x|, not the max
+    chunk_size: int | None = None  # raw samples per chunk, whole recording if None
+    batch_channels: bool = False  # read and filter all channels of a stream together
+    n_workers: int = 1  # worker processes for filtering, 1 for serial processing
+    multistage: bool = False  # split downsampling_factor into cascaded stages
+    stage_factors: list[int] | None = None  # chosen automatically if None
+    stage_filter_orders: list[int] | None = None  # designed automatically if None
+    precision: str = "float64"  # "float64" or "float32" for filtering in single precision
+    chunk_layout: ChunkLayout | None = None  # HDF5 chunks of the LFP, contiguous if None
+    compression: Compression | None = None  # uncompressed if None
+
+
+PRECISIONS: dict[str, type[np.floating]] = {
+    "float64": np.float64,
+    "float32": np.float32,
+}
+
+
+def get_compute_dtype(precision: str) -> type[np.floating]:
+    """Floating point type in which samples are filtered at `precision`."""
+    if precision not in PRECISIONS:
+        raise ValueError(
+            f"Invalid precision '{precision}', expected one of {list(PRECISIONS)}"
+        )
+    return PRECISIONS[precision]
+
+
+def iter_sample_chunks(n_samples: int, chunk_size: int) -> Iterator[tuple[int, int]]:
+    """Yield consecutive (start, stop) sample ranges covering `n_samples`."""
+    if chunk_size <= 0:
+        raise ValueError(f"Chunk size must be positive, got {chunk_size}")
+    for start in range(0, n_samples, chunk_size):
+        yield start, min(start + chunk_size, n_samples)
+
+
+def read_raw_counts(
+    oe_cont: Continuous,
+    start_sample_index: int,
+    end_sample_index: int | None,
+    channel_indices: list[int],
+    dtype: type[np.number] = np.float64,
+) -> np.ndarray:
+    """Raw ADC counts of `channel_indices` (samples x channels) as `dtype`.
+
+    In contrast to `Continuous.get_samples`, the int16 samples are not scaled
+    to microvolts. Multiply by `bit_volts` to get microvolts.
+    """
+    first, last = channel_indices[0], channel_indices[-1]
+    channels: slice | list[int] = (
+        slice(first, last + 1)
+        if channel_indices == list(range(first, last + 1))
+        else channel_indices
+    )
+    samples = oe_cont.samples[start_sample_index:end_sample_index, channels]
+    return np.asarray(samples).astype(dtype, copy=False)
+
+
+def design_decimation_fir(
+    downsampling_factor: int, filter_order: int | None
+) -> np.ndarray:
+    """FIR anti-aliasing filter as designed by `scipy.signal.decimate`."""
+    if filter_order is None:
+        filter_order = 20 * downsampling_factor
+    (b,) = design_filter(
+        FilterSpec(
+            ftype="fir",
+            order=filter_order,
+            band_edges=(1.0 / downsampling_factor,),
+            downsampling_factor=downsampling_factor,
+        )
+    )
+    return b
+
+
+def design_decimation_iir(
+    downsampling_factor: int, filter_order: int | None
+) -> np.ndarray:
+    """Chebyshev type I anti-aliasing filter (SOS) as designed by `scipy.signal.decimate`."""
+    if filter_order is None:
+        filter_order = 8
+    (sos,) = design_filter(
+        FilterSpec(
+            ftype="iir",
+            order=filter_order,
+            band_edges=(0.8 / downsampling_factor,),
+            downsampling_factor=downsampling_factor,
+        )
+    )
+    return sos
+
+
+# transition width (in cycles per sample) times the number of taps of a
+# Hamming-windowed FIR filter
+HAMMING_TRANSITION_WIDTH = 3.3
+
+
+@dataclass
+class DecimationStage:
+    factor: int
+    filter_order: int
+    cutoff: float  # relative to the Nyquist frequency of the stage input
+
+    def design_fir(self) -> np.ndarray:
+        (b,) = design_filter(
+            FilterSpec(
+                ftype="fir",
+                order=self.filter_order,
+                band_edges=(self.cutoff,),
+                downsampling_factor=self.factor,
+            )
+        )
+        return b
+
+
+def _ordered_factorizations(n: int, max_factors: int) -> Iterator[tuple[int, ...]]:
+    if n == 1:
+        yield ()
+        return
+    if max_factors == 0:
+        return
+    for factor in range(2, n + 1):
+        if n % factor == 0:
+            for rest in _ordered_factorizations(n // factor, max_factors - 1):
+                yield (factor,) + rest
+
+
+def _design_stages(
+    downsampling_factor: int, filter_order: int, stage_factors: list[int]
+) -> list[DecimationStage]:
+    """Design a cascade with the pass- and stopband edges of the single-stage filter."""
+    if len(stage_factors) == 1:
+        return [DecimationStage(downsampling_factor, filter_order, 1.0 / downsampling_factor)]
+
+    # band edges of the single-stage filter in cycles per input sample
+    half_transition = 0.5 * HAMMING_TRANSITION_WIDTH / (filter_order + 1)
+    passband_edge = 0.5 / downsampling_factor - half_transition
+    stopband_edge = 0.5 / downsampling_factor + half_transition
+
+    stages = []
+    input_rate = 1.0
+    for i_stage, factor in enumerate(stage_factors):
+        output_rate = input_rate / factor
+        if i_stage == len(stage_factors) - 1:
+            stage_stopband_edge = stopband_edge
+        else:
+            # only what would alias below the final stopband edge must be removed
+            stage_stopband_edge = output_rate - stopband_edge
+        if stage_stopband_edge <= passband_edge:
+            raise ValueError(
+                f"Decimation stages {stage_factors} cannot meet the passband of a "
+                f"single-stage filter of order {filter_order}"
+            )
+        n_taps = math.ceil(
+            HAMMING_TRANSITION_WIDTH * input_rate / (stage_stopband_edge - passband_edge)
+            - 1e-9
+        )
+        n_taps += 1 - n_taps % 2  # odd length for an integer group delay
+        stages.append(
+            DecimationStage(
+                factor=factor,
+                filter_order=n_taps - 1,
+                cutoff=(passband_edge + stage_stopband_edge) / input_rate,
+            )
+        )
+        input_rate = output_rate
+    return stages
+
+
+def decimation_cost(stages: list[DecimationStage]) -> int:
+    """Multiply-adds per output sample of a polyphase decimation cascade."""
+    cost = 0
+    outputs_per_final_output = math.prod(stage.factor for stage in stages)
+    for stage in stages:
+        outputs_per_final_output //= stage.factor
+        cost += (stage.filter_order + 1) * outputs_per_final_output
+    return cost
+
+
+def plan_decimation_stages(
+    downsampling_factor: int,
+    filter_order: int | None,
+    stage_factors: list[int] | None = None,
+    stage_filter_orders: list[int] | None = None,
+    max_stages: int = 3,
+) -> list[DecimationStage]:
+    """Split the decimation into cascaded stages with short anti-aliasing filters.
+
+    If `stage_factors` is None, the ordered factorization of `downsampling_factor`
+    with the fewest multiply-adds per output sample is selected. A single stage
+    is kept if no cascade is cheaper (e.g. for prime factors).
+    """
+    if filter_order is None:
+        filter_order = 20 * downsampling_factor
+
+    if stage_factors is None:
+        candidates = [
+            _design_stages(downsampling_factor, filter_order, list(factors))
+            for factors in _ordered_factorizations(downsampling_factor, max_stages)
+        ]
+        stages = min(candidates, key=lambda c: (decimation_cost(c), len(c)))
+    else:
+        if math.prod(stage_factors) != downsampling_factor:
+            raise ValueError(
+                f"Product of decimation stages {stage_factors} does not match the downsampling factor {downsampling_factor}"
+            )
+        stages = _design_stages(downsampling_factor, filter_order, stage_factors)
+
+    if stage_filter_orders is not None:
+        if len(stage_filter_orders) != len(stages):
+            raise ValueError(
+                f"Got {len(stage_filter_orders)} filter orders for {len(stages)} decimation stages"
+            )
+        for stage, stage_filter_order in zip(stages, stage_filter_orders):
+            stage.filter_order = stage_filter_order
+    return stages
+
+
+def get_decimation_stages(config: DecimationConfig) -> list[DecimationStage] | None:
+    """Decimation stages of a multistage config, None for single-stage decimation."""
+    if not config.multistage:
+        return None
+    return plan_decimation_stages(
+        downsampling_factor=config.downsampling_factor,
+        filter_order=config.filter_order,
+        stage_factors=config.stage_factors,
+        stage_filter_orders=config.stage_filter_orders,
+    )
+
+
+class StreamingFirDecimator:
+    """FIR decimation of a signal that is pushed in consecutive chunks along axis 0.
+
+    The concatenated output is identical to `scipy.signal.decimate(x, ftype="fir")`
+    on the whole signal: the signal is zero-padded at both ends and, for
+    `zero_phase=True`, output sample k is centered on input sample k * q. Only
+    the last few hundred input samples are kept between calls, so memory does
+    not grow with the length of the signal.
+    """
+
+    def __init__(self, b: np.ndarray, downsampling_factor: int, zero_phase: bool):
+        self.b = np.asarray(b)
+        self.downsampling_factor = downsampling_factor
+        n_taps = self.b.shape[0]
+        self._delay = (n_taps - 1) // 2 if zero_phase else 0
+        # number of leading outputs of upfirdn that precede the requested ones
+        self._n_lead = math.ceil((n_taps - 1) / downsampling_factor)
+        # absolute input index of the first buffered sample (< 0: zero-padding)
+        self._buffer_start = self._delay - self._n_lead * downsampling_factor
+        self._buffer: np.ndarray | None = None
+        self._n_in = 0
+        self._n_out = 0
+
+    def push(self, chunk: np.ndarray) -> np.ndarray:
+        """Add the next input chunk and return all outputs that can be computed."""
+        chunk = np.asarray(chunk)
+        if self._buffer is None:
+            dtype = chunk.dtype if np.issubdtype(chunk.dtype, np.floating) else np.float64
+            self.b = self.b.astype(dtype)
+            self._buffer = np.zeros((-self._buffer_start,) + chunk.shape[1:], dtype)
+        self._buffer = np.concatenate((self._buffer, chunk), axis=0)
+        self._n_in += chunk.shape[0]
+
+        # output k needs input up to index k * q + delay
+        available_end = self._buffer_start + self._buffer.shape[0]
+        n_computable = (available_end - 1 - self._delay) // self.downsampling_factor + 1
+        return self._emit(max(n_computable, self._n_out))
+
+    def flush(self) -> np.ndarray:
+        """Return the remaining outputs, zero-padding the end of the signal."""
+        if self._buffer is None:
+            raise ValueError("No data has been pushed to the decimator")
+        q = self.downsampling_factor
+        n_out_total = self._n_in // q + bool(self._n_in % q)
+        padding = np.zeros(
+            (self._delay + q,) + self._buffer.shape[1:], self._buffer.dtype
+        )
+        self._buffer = np.concatenate((self._buffer, padding), axis=0)
+        return self._emit(n_out_total)
+
+    def _emit(self, stop: int) -> np.ndarray:
+        assert self._buffer is not None
+        q = self.downsampling_factor
+        start = self._n_out
+        n_new = stop - start
+
+        segment_start = start * q + self._delay - self._n_lead * q
+        segment_stop = (stop - 1) * q + self._delay + 1
+        segment = self._buffer[
+            segment_start - self._buffer_start : max(segment_stop - self._buffer_start, 0)
+        ]
+        if n_new > 0:
+            y = signal.upfirdn(self.b, segment, up=1, down=q, axis=0)
+            y = y[self._n_lead : self._n_lead + n_new]
+        else:
+            y = np.zeros((0,) + self._buffer.shape[1:], self._buffer.dtype)
+
+        # drop input that is not needed for any further output
+        next_segment_start = stop * q + self._delay - self._n_lead * q
+        self._buffer = self._buffer[next_segment_start - self._buffer_start :]
+        self._buffer_start = next_segment_start
+        self._n_out = stop
+        return y
+
+
+def polyphase_decimate(
+    data: np.ndarray, b: np.ndarray, downsampling_factor: int, axis: int = 0
+) -> np.ndarray:
+    """Zero-phase decimation with the linear-phase FIR filter `b`.
+
+    The filter is applied in polyphase form, i.e. only the output samples that
+    are kept are computed. The group delay of (len(b) - 1) // 2 samples is
+    compensated, so output sample k is centered on input sample
+    k * downsampling_factor. The signal is zero-padded at both ends.
+    """
+    q = downsampling_factor
+    n_in = data.shape[axis]
+    delay = (len(b) - 1) // 2
+    # delay the filter so that the group delay is a multiple of q
+    n_pre_pad = -delay % q
+    h = np.concatenate((np.zeros(n_pre_pad, dtype=b.dtype), b))
+    if np.issubdtype(data.dtype, np.floating):
+        h = h.astype(data.dtype)
+
+    y = signal.upfirdn(h, data, up=1, down=q, axis=axis)
+
+    first = (delay + n_pre_pad) // q
+    return _slice_axis(y, slice(first, first + n_in // q + bool(n_in % q)), axis)
+
+
+def _slice_axis(data: np.ndarray, index: slice, axis: int) -> np.ndarray:
+    keep = [slice(None)] * data.ndim
+    keep[axis] = index
+    return data[tuple(keep)]
+
+
+class CascadedFirDecimator:
+    """Chain of `StreamingFirDecimator` stages with the interface of a single one."""
+
+    def __init__(self, stages: list[StreamingFirDecimator]):
+        self.stages = stages
+
+    def push(self, chunk: np.ndarray) -> np.ndarray:
+        for stage in self.stages:
+            chunk = stage.push(chunk)
+        return chunk
+
+    def flush(self) -> np.ndarray:
+        decimated = self.stages[0].flush()
+        for stage in self.stages[1:]:
+            decimated = np.concatenate((stage.push(decimated), stage.flush()), axis=0)
+        return decimated
+
+
+def create_streaming_decimator(
+    config: DecimationConfig,
+) -> StreamingFirDecimator | CascadedFirDecimator:
+    zero_phase = config.zero_phase or config.ftype == "polyphase"
+    stages = get_decimation_stages(config)
+    if stages is None:
+        return StreamingFirDecimator(
+            b=design_decimation_fir(config.downsampling_factor, config.filter_order),
+            downsampling_factor=config.downsampling_factor,
+            zero_phase=zero_phase,
+        )
+    return CascadedFirDecimator(
+        [
+            StreamingFirDecimator(
+                b=stage.design_fir(),
+                downsampling_factor=stage.factor,
+                zero_phase=zero_phase,
+            )
+            for stage in stages
+        ]
+    )
+
+
+def decimate_in_stages(
+    data: np.ndarray, stages: list[DecimationStage], axis: int, zero_phase: bool
+) -> np.ndarray:
+    for stage in stages:
+        b = stage.design_fir()
+        if np.issubdtype(data.dtype, np.floating):
+            b = b.astype(data.dtype)
+        if zero_phase:
+            data = polyphase_decimate(data, b, stage.factor, axis=axis)
+        else:
+            n_out = data.shape[axis] // stage.factor + bool(data.shape[axis] % stage.factor)
+            data = signal.upfirdn(b, data, up=1, down=stage.factor, axis=axis)
+            data = _slice_axis(data, slice(None, n_out), axis)
+    return data
 
 
 def decimate_np_array(
-    data, downsampling_factor, filter_order, filter_type, axis, zero_phase: bool
+    data,
+    downsampling_factor,
+    filter_order,
+    filter_type,
+    axis,
+    zero_phase: bool,
+    stages: list[DecimationStage] | None = None,
 ):
-    return signal.decimate(
-        x=data,
-        q=downsampling_factor,
-        n=filter_order,
-        ftype=filter_type,
-        axis=axis,
-        zero_phase=zero_phase,
+    if stages is not None:
+        if filter_type not in ("fir", "polyphase"):
+            raise ValueError(
+                f"Multistage decimation requires ftype='fir' or 'polyphase', got ftype='{filter_type}'"
+            )
+        return decimate_in_stages(
+            data, stages, axis=axis, zero_phase=zero_phase or filter_type == "polyphase"
+        )
+
+    if filter_type == "polyphase":
+        # always zero-phase, the group delay is compensated
+        return polyphase_decimate(
+            data=data,
+            b=design_decimation_fir(downsampling_factor, filter_order),
+            downsampling_factor=downsampling_factor,
+            axis=axis,
+        )
+
+    # same as scipy.signal.decimate, but with cached filter designs
+    q = downsampling_factor
+    data = np.asarray(data)
+    result_type = data.dtype
+    if not np.issubdtype(result_type, np.inexact) or result_type == np.float16:
+        result_type = np.float64
+
+    match filter_type:
+        case "fir":
+            b = design_decimation_fir(q, filter_order).astype(result_type)
+            if zero_phase:
+                # FIR coefficients as window are missing from scipy-stubs
+                return signal.resample_poly(data, 1, q, axis=axis, window=b)  # type: ignore[call-overload]
+            n_out = data.shape[axis] // q + bool(data.shape[axis] % q)
+            y = signal.upfirdn(b, data, up=1, down=q, axis=axis)
+            return _slice_axis(y, slice(None, n_out), axis)
+        case "iir":
+            sos = design_decimation_iir(q, filter_order).astype(result_type)
+            if zero_phase:
+                y = signal.sosfiltfilt(sos, data, axis=axis)
+            else:
+                y = signal.sosfilt(sos, data, axis=axis)
+            return _slice_axis(y, slice(None, None, q), axis)
+        case _:
+            raise ValueError(f"Invalid filter type: {filter_type}")
+
+
+@dataclass
+class OutputChannel:
+    """A raw channel and the CONT group its processed signal is written to."""
+
+    channel_index: int
+    channel_name: str
+    cont_group_id: int
+    channel_info: np.ndarray
+
+
+ChannelT = TypeVar("ChannelT")
+
+
+def group_output_channels(
+    channels: list[ChannelT], batch_channels: bool, n_groups: int = 1
+) -> list[list[ChannelT]]:
+    """Split channels into groups that are filtered together.
+
+    Without batching every channel is its own group. With batching the channels
+    are split into at most `n_groups` contiguous groups.
+    """
+    if not batch_channels:
+        return [[channel] for channel in channels]
+    n_groups = max(min(n_groups, len(channels)), 1)
+    group_size, remainder = divmod(len(channels), n_groups)
+    groups: list[list[ChannelT]] = []
+    start = 0
+    for i_group in range(n_groups):
+        stop = start + group_size + (i_group < remainder)
+        if stop > start:
+            groups.append(channels[start:stop])
+        start = stop
+    return groups
+
+
+class InlineExecutor(Executor):
+    """Executor that runs each task immediately in the calling thread."""
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        future: Future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+def _split_columns(
+    block: np.ndarray, channel_groups: list[list[OutputChannel]]
+) -> list[np.ndarray]:
+    group_ends = np.cumsum([len(group) for group in channel_groups])
+    return np.split(block, group_ends[:-1], axis=1)
+
+
+def _push_to_decimator(
+    decimator: StreamingFirDecimator | CascadedFirDecimator, samples: np.ndarray
+) -> tuple[StreamingFirDecimator | CascadedFirDecimator, np.ndarray]:
+    # the decimator is returned, as it is a copy when run in a worker process
+    decimated = decimator.push(samples)
+    return decimator, decimated
+
+
+def _flush_decimator(
+    decimator: StreamingFirDecimator | CascadedFirDecimator,
+) -> tuple[StreamingFirDecimator | CascadedFirDecimator, np.ndarray]:
+    decimated = decimator.flush()
+    return decimator, decimated
+
+
+def _decimate_channel_groups(
+    config: DecimationConfig,
+    oe_cont: Continuous,
+    channel_groups: list[list[OutputChannel]],
+    dh5file: DH5File,
+    sample_period_ns: np.int32,
+    region_index: np.ndarray,
+    executor: Executor,
+) -> None:
+    """Decimate the whole recording of several channel groups at once.
+
+    The samples of all groups are read together, each group is decimated as
+    one task of `executor` and the results are written in channel order.
+    """
+    oe_metadata = oe_cont.metadata
+    samples = read_raw_counts(
+        oe_cont,
+        start_sample_index=0,
+        end_sample_index=None,
+        channel_indices=[
+            channel.channel_index for group in channel_groups for channel in group
+        ],
+        dtype=get_compute_dtype(config.precision),
     )
+    logger.debug(f"Data range: {np.min(samples)} - {np.max(samples)}")
+    # samples x channels
+    futures = [
+        executor.submit(
+            decimate_np_array,
+            data=group_samples,
+            downsampling_factor=config.downsampling_factor,
+            filter_order=config.filter_order,
+            filter_type=config.ftype,
+            axis=0,
+            zero_phase=config.zero_phase,
+            stages=get_decimation_stages(config),
+        )
+        for group_samples in _split_columns(samples, channel_groups)
+    ]
+    del samples
 
+    for channel_group, future in zip(channel_groups, futures):
+        write_lfp_channels(
+            config=config,
+            oe_metadata=oe_metadata,
+            channels=channel_group,
+            decimated_block=future.result(),
+            dh5file=dh5file,
+            sample_period_ns=sample_period_ns,
+            region_index=region_index,
+        )
 
-def decimate_raw_data(
-    config: DecimationConfig, recording: Recording, dh5file: DH5File
-) -> DecimationConfig:
+
+def write_lfp_channels(
+    config: DecimationConfig,
+    oe_metadata: ContinuousMetadata,
+    channels: list[OutputChannel],
+    decimated_block: np.ndarray,
+    dh5file: DH5File,
+    sample_period_ns: np.int32,
+    region_index: np.ndarray,
+) -> None:
+    """Quantize the decimated columns of `channels` and write one CONT group each.
+
+    `decimated_block` is in raw ADC counts.
+    """
+    bit_volts = np.array(
+        [oe_metadata.bit_volts[channel.channel_index] for channel in channels]
+    )
+    if config.scale_max_abs_to is not None and config.scale_quantile is None:
+        # one factor per channel, the maximum is not clipped
+        quantized_block, counts_per_bit = scale_to_16_bit_range(
+            decimated_block, scale_abs_max_to=int(config.scale_max_abs_to), axis=0
+        )
+        n_saturated = np.zeros(len(channels), dtype=np.int64)
+        scaling_factors = counts_per_bit * bit_volts
+    elif config.scale_max_abs_to is not None:
+        # one factor per channel, values above the quantile are clipped
+        quantized_block = np.empty(decimated_block.shape, dtype=np.int16)
+        counts_per_bit, n_saturated = scale_chunks_to_16_bit_range(
+            lambda: [decimated_block],
+            quantized_block,
+            scale_abs_max_to=int(config.scale_max_abs_to),
+            quantile=config.scale_quantile,
+        )
+        scaling_factors = counts_per_bit * bit_volts
+    else:
+        # use original scaling factor (bit_volts)
+        quantized_block, n_saturated = quantize_to_int16(decimated_block)
+        scaling_factors = bit_volts
+
+    for column, channel in enumerate(channels):
+        cont_group = create_cont_group_from_data(
+            file=dh5file._file,
+            cont_group_id=channel.cont_group_id,
+            data=quantized_block[:, column : column + 1],
+            index=region_index,
+            sample_period_ns=sample_period_ns,
+            chunk_layout=config.chunk_layout,
+            compression=config.compression,
+            name=f"{oe_metadata.stream_name}/{channel.channel_name}/LFP",
+            channels=channel.channel_info,
+            calibration=np.array(np.float64(scaling_factors[column])),
+        )
+        store_saturation_counts(cont_group, n_saturated[column : column + 1])
+
+
+def store_saturation_counts(cont_group: h5py.Group, n_saturated: np.ndarray) -> None:
+    """Store the number of clipped samples per channel as CONT group attribute."""
+    cont_group.attrs[SATURATED_SAMPLES_ATTRIBUTE] = n_saturated
+    if np.any(n_saturated):
+        logger.warning(
+            f"{np.sum(n_saturated)} samples of {cont_group.attrs['Name']} were clipped to the int16 range"
+        )
+
+
+def _decimate_channel_groups_in_chunks(
+    config: DecimationConfig,
+    oe_cont: Continuous,
+    channel_groups: list[list[OutputChannel]],
+    dh5file: DH5File,
+    sample_period_ns: np.int32,
+    region_index: np.ndarray,
+    executor: Executor,
+) -> None:
+    """Decimate several channel groups chunk by chunk into new CONT groups.
+
+    Each chunk is read once for all groups. Every group has its own
+    `StreamingFirDecimator`, which is passed to `executor` together with the
+    group's samples and handed back with the decimated chunk.
+    """
+    chunk_size = config.chunk_size
+    assert chunk_size is not None
+    oe_metadata = oe_cont.metadata
+    channels = [channel for group in channel_groups for channel in group]
+    n_samples = oe_cont.samples.shape[0]
+    q = config.downsampling_factor
+    scaling_factors = np.array(
+        [oe_metadata.bit_volts[channel.channel_index] for channel in channels]
+    )
+
+    cont_groups = []
+    for channel, scaling_factor in zip(channels, scaling_factors):
+        cont_group = create_empty_cont_group(
+            dh5file._file,
+            channel.cont_group_id,
+            n_samples=n_samples // q + bool(n_samples % q),
+            n_channels=1,
+            sample_period_ns=sample_period_ns,
+            chunk_layout=config.chunk_layout,
+            compression=config.compression,
+            calibration=np.array(np.float64(scaling_factor)),
+            channels=channel.channel_info,
+            name=f"{oe_metadata.stream_name}/{channel.channel_name}/LFP",
+        )
+        cont_group["INDEX"][:] = region_index
+        cont_groups.append(cont_group)
+
+    decimators = [create_streaming_decimator(config) for _ in channel_groups]
+    compute_dtype = get_compute_dtype(config.precision)
+
+    def decimated_chunks() -> Iterator[np.ndarray]:
+        nonlocal decimators
+        for start, stop in iter_sample_chunks(n_samples, chunk_size):
+            samples = read_raw_counts(
+                oe_cont,
+                start_sample_index=start,
+                end_sample_index=stop,
+                channel_indices=[channel.channel_index for channel in channels],
+                dtype=compute_dtype,
+            )
+            futures = [
+                executor.submit(_push_to_decimator, decimator, group_samples)
+                for decimator, group_samples in zip(
+                    decimators, _split_columns(samples, channel_groups)
+                )
+            ]
+            del samples
+            decimators, decimated = zip(*(future.result() for future in futures))
+            yield np.concatenate(decimated, axis=1)
+        futures = [
+            executor.submit(_flush_decimator, decimator) for decimator in decimators
+        ]
+        decimators, decimated = zip(*(future.result() for future in futures))
+        yield np.concatenate(decimated, axis=1)
+
+    out = _ContGroupColumns(cont_groups)
+    if config.scale_max_abs_to is None:
+        offset = 0
+        n_saturated = np.zeros(len(channels), dtype=np.int64)
+        for decimated_block in decimated_chunks():
+            # raw counts, calibrated with the original scaling factor (bit_volts)
+            quantized_block, n_saturated_in_block = quantize_to_int16(decimated_block)
+            n_saturated += n_saturated_in_block
+            n_decimated = quantized_block.shape[0]
+            out[offset : offset + n_decimated] = quantized_block
+            offset += n_decimated
+    else:
+        n_saturated = _scale_decimated_chunks(
+            config, decimated_chunks(), out, scaling_factors
+        )
+    out.report_compression()
+
+    for column, cont_group in enumerate(cont_groups):
+        store_saturation_counts(cont_group, n_saturated[column : column + 1])
+
+
+class _ContGroupColumns:
+    """Writes the columns of samples x channels blocks to one CONT group each."""
+
+    def __init__(self, cont_groups: list[h5py.Group]):
+        self.cont_groups = cont_groups
+        self.shape = (cont_groups[0]["DATA"].shape[0], len(cont_groups))
+        self.encode_s = np.zeros(len(cont_groups))
+
+    def __setitem__(self, index: slice, block: np.ndarray) -> None:
+        for column, cont_group in enumerate(self.cont_groups):
+            start = time.perf_counter()
+            cont_group["DATA"][index] = block[:, column : column + 1]
+            self.encode_s[column] += time.perf_counter() - start
+
+    def report_compression(self) -> None:
+        for cont_group, encode_s in zip(self.cont_groups, self.encode_s):
+            report_compression(cont_group, encode_s)
+
+
+def _scale_decimated_chunks(
+    config: DecimationConfig,
+    decimated_chunks: Iterator[np.ndarray],
+    out: _ContGroupColumns,
+    bit_volts: np.ndarray,
+) -> np.ndarray:
+    """Scale each channel of a chunked decimation to the int16 range.
+
+    The scaling depends on the whole signal, so the decimated chunks are
+    spooled to a temporary file. All channels are scaled together, with one
+    factor per channel, in two passes over the spool.
+    """
+    chunk_size = config.chunk_size
+    assert chunk_size is not None and config.scale_max_abs_to is not None
+    n_out = out.shape[0]
+    with tempfile.TemporaryDirectory(prefix="oecon_") as spool_dir:
+        spool = np.lib.format.open_memmap(
+            os.path.join(spool_dir, "decimated.npy"),
+            mode="w+",
+            dtype=get_compute_dtype(config.precision),
+            shape=out.shape,
+        )
+        offset = 0
+        for decimated_block in decimated_chunks:
+            spool[offset : offset + decimated_block.shape[0]] = decimated_block
+            offset += decimated_block.shape[0]
+
+        counts_per_bit, n_saturated = scale_chunks_to_16_bit_range(
+            lambda: (
+                spool[start:stop]
+                for start, stop in iter_sample_chunks(n_out, chunk_size)
+            ),
+            out,
+            scale_abs_max_to=int(config.scale_max_abs_to),
+            quantile=config.scale_quantile,
+        )
+        del spool
+    for column, cont_group in enumerate(out.cont_groups):
+        cont_group.attrs["Calibration"] = np.array(
+            np.float64(counts_per_bit[column] * bit_volts[column])
+        )
+    return n_saturated
+
+
+def validate_decimation_config(config: DecimationConfig) -> None:
+    """Check `config` before any data is processed.
+
+    For multistage decimation, the planned stages are stored in the config.
+    """
+    if config.chunk_size is not None:
+        if config.ftype not in ("fir", "polyphase"):
+            raise ValueError(
+                f"Chunked decimation requires ftype='fir' or 'polyphase', got ftype='{config.ftype}'"
+            )
+    if config.n_workers < 1:
+        raise ValueError(f"Number of workers must be positive, got {config.n_workers}")
+    if config.scale_quantile is not None and not 0 < config.scale_quantile <= 1:
+        raise ValueError(f"Quantile must be within (0, 1], got {config.scale_quantile}")
+    get_compute_dtype(config.precision)
+
+    stages = get_decimation_stages(config)
+    if stages is not None:
+        if config.ftype not in ("fir", "polyphase"):
+            raise ValueError(
+                f"Multistage decimation requires ftype='fir' or 'polyphase', got ftype='{config.ftype}'"
+            )
+        config.stage_factors = [stage.factor for stage in stages]
+        config.stage_filter_orders = [stage.filter_order for stage in stages]
+        logger.info(
+            f"Decimating by {config.downsampling_factor} in {len(stages)} stage(s): "
+            + " x ".join(f"{stage.factor} (n={stage.filter_order})" for stage in stages)
+            + f", {decimation_cost(stages)} multiply-adds per output sample"
+        )
+
+
+def create_executor(n_workers: int) -> Executor:
+    """Process pool with `n_workers` processes, or inline execution for one worker."""
+    if n_workers > 1:
+        return ProcessPoolExecutor(max_workers=n_workers)
+    return InlineExecutor()
+
+
+def plan_lfp_channels(
+    config: DecimationConfig, recording: Recording
+) -> list[tuple[Continuous, list[OutputChannel]]]:
+    """LFP output channels of every continuous stream of `recording`.
+
+    Block IDs are assigned consecutively from `config.start_block_id` over all
+    streams. The names of all included channels are stored in the config.
+    """
     assert recording.continuous is not None, (
         "No continuous data found in the recording."
     )
@@ -50,6 +886,7 @@ def decimate_raw_data(
     global_channel_index = 0
     dh5_cont_id = config.start_block_id
     included_channel_names: list[str] = []
+    plan: list[tuple[Continuous, list[OutputChannel]]] = []
 
     for oe_cont in recording.continuous:
         oe_metadata = oe_cont.metadata
@@ -64,31 +901,12 @@ def decimate_raw_data(
         else:
             included_channel_names.extend(config.included_channel_names)
 
-        # TODO: Use chunks of channels in parallel
-        logger.info(
-            f"Decimating ({oe_metadata.sample_rate} -> {oe_metadata.sample_rate / config.downsampling_factor} Hz) {oe_metadata.num_channels} channels continuous data from {oe_metadata.source_node_name} ({oe_metadata.source_node_id})"
-        )
+        channels: list[OutputChannel] = []
         for channel_index, channel_name in enumerate(oe_metadata.channel_names):
             # skip channel if not in included channels
             if channel_name not in included_channel_names:
                 continue
 
-            samples = oe_cont.get_samples(
-                start_sample_index=0,
-                end_sample_index=-1,
-                selected_channels=None,
-                selected_channel_names=[channel_name],
-            )
-            # samples x channels
-            decimated_samples = decimate_np_array(
-                data=samples,
-                downsampling_factor=config.downsampling_factor,
-                filter_order=config.filter_order,
-                filter_type=config.ftype,
-                axis=0,
-                zero_phase=config.zero_phase,
-            )
-
             channel_info = dhspec.cont.create_channel_info(
                 GlobalChanNumber=global_channel_index,
                 BoardChanNo=channel_index,
@@ -97,37 +915,61 @@ def decimate_raw_data(
                 MinVoltageRange=10.0,
                 AmplifChan0=0,
             )
-
-            logger.debug(f"Data range: {np.min(samples)} - {np.max(samples)}")
-            if config.scale_max_abs_to is not None:
-                decimated_samples, scaling_factor = scale_to_16_bit_range(
-                    decimated_samples
+            channels.append(
+                OutputChannel(
+                    channel_index=channel_index,
+                    channel_name=channel_name,
+                    cont_group_id=dh5_cont_id,
+                    channel_info=channel_info,
                 )
-            else:
-                # use original scaling factor (bit_volts)
-                scaling_factor = oe_cont.metadata.bit_volts[channel_index]
-                decimated_samples /= scaling_factor
-                decimated_samples = decimated_samples.astype(np.int16)
-
-            region_index = dhspec.cont.create_empty_index_array(1)
-            region_index[0]["time"] = np.int64(oe_cont.timestamps[0] * 1e9)
-            region_index[0]["offset"] = 0
-
-            dh5io.cont.create_cont_group_from_data_in_file(
-                file=dh5file._file,
-                cont_group_id=dh5_cont_id,
-                data=decimated_samples,
-                index=region_index,
-                sample_period_ns=np.int32(
-                    1.0 / oe_metadata.sample_rate * 1e9 * config.downsampling_factor
-                ),
-                name=f"{oe_metadata.stream_name}/{channel_name}/LFP",
-                channels=channel_info,
-                calibration=np.array(np.float64(scaling_factor)),
             )
 
             dh5_cont_id += 1
             global_channel_index += 1
+        plan.append((oe_cont, channels))
+
+    config.included_channel_names = included_channel_names
+    return plan
+
+
+def decimate_raw_data(
+    config: DecimationConfig, recording: Recording, dh5file: DH5File
+) -> DecimationConfig:
+    validate_decimation_config(config)
+    plan = plan_lfp_channels(config, recording)
+
+    # all results are written by this process in block-ID order
+    with create_executor(config.n_workers) as executor:
+        for oe_cont, channels in plan:
+            oe_metadata = oe_cont.metadata
+            logger.info(
+                f"Decimating ({oe_metadata.sample_rate} -> {oe_metadata.sample_rate / config.downsampling_factor} Hz) {oe_metadata.num_channels} channels continuous data from {oe_metadata.source_node_name} ({oe_metadata.source_node_id}) using {config.n_workers} worker(s)"
+            )
+
+            region_index = create_start_index(oe_cont)
+
+            sample_period_ns = np.int32(
+                1.0 / oe_metadata.sample_rate * 1e9 * config.downsampling_factor
+            )
+            decimate_channel_groups = (
+                _decimate_channel_groups
+                if config.chunk_size is None
+                else _decimate_channel_groups_in_chunks
+            )
+            # groups of one wave are processed in parallel, one task per group
+            channel_groups = group_output_channels(
+                channels, config.batch_channels, n_groups=config.n_workers
+            )
+            for i_wave in range(0, len(channel_groups), config.n_workers):
+                decimate_channel_groups(
+                    config=config,
+                    oe_cont=oe_cont,
+                    channel_groups=channel_groups[i_wave : i_wave + config.n_workers],
+                    dh5file=dh5file,
+                    sample_period_ns=sample_period_ns,
+                    region_index=region_index,
+                    executor=executor,
+                )
 
     dh5io.operations.add_operation_to_file(
         dh5file._file,
@@ -135,5 +977,4 @@ def decimate_raw_data(
         f"oecon_v{oecon.version.get_version_from_pyproject()}",
     )
 
-    config.included_channel_names = included_channel_names
     return config
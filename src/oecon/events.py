@@ -2,8 +2,12 @@ import logging
 import os
 import pprint
 import warnings
+import weakref
+from collections import defaultdict
+from collections.abc import Sequence
 from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Literal
 
 import dh5io
 import dh5io.event_triggers
@@ -19,6 +23,22 @@ import oecon.version
 
 logger = logging.getLogger(__name__)
 
+# memory-map modes of np.load, None reads the whole file
+MmapMode = Literal["r+", "r", "w+", "c"] | None
+
+
+@dataclass
+class EventSource:
+    """Event source of a recording whose events are written to EV02.
+
+    TTL edges are written as +line/-line, network events as their full
+    words, both shifted by `code_offset`.
+    """
+
+    source_processor: str  # e.g. "NI-DAQmx" or "Network Events"
+    stream_name: str | None = None  # all streams of the processor if None
+    code_offset: int = 0
+
 
 @dataclass
 class EventPreprocessingConfig:
@@ -26,7 +46,17 @@ class EventPreprocessingConfig:
     network_events_code_name_map: dict[str, int] | None = field(
         default_factory=lambda: VStimEventCode.asdict()
     )
-    ttl_line_names: dict[str, int] | None = None
+    ttl_line_names: dict[str, int] | None = None  # name: line number, starting at 1
+    # TTL of the PXIe-6341 NI-DAQmx stream and all Network Events if None
+    sources: list[EventSource] | None = None
+
+    def event_sources(self) -> list[EventSource]:
+        if self.sources is not None:
+            return self.sources
+        return [
+            EventSource("NI-DAQmx", "PXIe-6341"),
+            EventSource("Network Events", code_offset=self.network_events_offset),
+        ]
 
 
 @dataclass
@@ -42,6 +72,17 @@ class EventMetadata:
     initial_state: int = 0
 
 
+def load_event_column(
+    full_event_folder_path: str | Path, name: str, mmap_mode: MmapMode = "r"
+) -> np.ndarray:
+    """Load `name`.npy of an event folder.
+
+    With `mmap_mode`, the file is memory-mapped and only read from disk
+    where the array is accessed.
+    """
+    return np.load(Path(full_event_folder_path) / f"{name}.npy", mmap_mode=mmap_mode)
+
+
 @dataclass
 class Messages:
     metadata: EventMetadata
@@ -68,14 +109,20 @@ class Messages:
         )
 
     @staticmethod
-    def from_folder(full_event_folder_path: str | Path, metadata: EventMetadata):
+    def from_folder(
+        full_event_folder_path: str | Path,
+        metadata: EventMetadata,
+        mmap_mode: MmapMode = "r",
+    ):
         return Messages(
             metadata=metadata,
-            text=np.load(os.path.join(full_event_folder_path, "text.npy")),
-            sample_numbers=np.load(
-                os.path.join(full_event_folder_path, "sample_numbers.npy")
+            text=load_event_column(full_event_folder_path, "text", mmap_mode),
+            sample_numbers=load_event_column(
+                full_event_folder_path, "sample_numbers", mmap_mode
+            ),
+            timestamps=load_event_column(
+                full_event_folder_path, "timestamps", mmap_mode
             ),
-            timestamps=np.load(os.path.join(full_event_folder_path, "timestamps.npy")),
         )
 
 
@@ -99,14 +146,22 @@ class Event:
         return len(self.full_words)
 
     @staticmethod
-    def from_folder(full_event_folder_path: str | Path, metadata: EventMetadata):
+    def from_folder(
+        full_event_folder_path: str | Path,
+        metadata: EventMetadata,
+        mmap_mode: MmapMode = "r",
+    ):
         return Event(
             metadata=metadata,
-            full_words=np.load(os.path.join(full_event_folder_path, "full_words.npy")),
-            timestamps=np.load(os.path.join(full_event_folder_path, "timestamps.npy")),
-            states=np.load(os.path.join(full_event_folder_path, "states.npy")),
-            sample_numbers=np.load(
-                os.path.join(full_event_folder_path, "sample_numbers.npy")
+            full_words=load_event_column(
+                full_event_folder_path, "full_words", mmap_mode
+            ),
+            timestamps=load_event_column(
+                full_event_folder_path, "timestamps", mmap_mode
+            ),
+            states=load_event_column(full_event_folder_path, "states", mmap_mode),
+            sample_numbers=load_event_column(
+                full_event_folder_path, "sample_numbers", mmap_mode
             ),
         )
 
@@ -153,24 +208,107 @@ class FullWordEvent:
         return len(self.full_words)
 
 
+@dataclass
+class TtlEdges:
+    """Rising and falling edges of TTL lines, one entry per edge."""
+
+    timestamps: np.ndarray
+    sample_numbers: np.ndarray
+    lines: np.ndarray  # starting at 0
+    rising: np.ndarray  # False for falling edges
+    initial_state: int = 0  # state of all lines before the first edge
+
+    def __len__(self):
+        return len(self.lines)
+
+    def words(self) -> np.ndarray:
+        """State of all lines after each edge, bit i for line i."""
+        return reconstruct_ttl_words(self.lines, self.rising, self.initial_state)
+
+    def event_codes(self) -> np.ndarray:
+        """Open Ephys codes of the edges: +line for rising, -line for falling
+        edges with lines starting at 1."""
+        line_numbers = self.lines.astype(np.int32) + 1
+        return np.where(self.rising, line_numbers, -line_numbers)
+
+    def line(self, line: int) -> "TtlEdges":
+        """Edges of a single line."""
+        is_line = self.lines == line
+        return TtlEdges(
+            timestamps=self.timestamps[is_line],
+            sample_numbers=self.sample_numbers[is_line],
+            lines=self.lines[is_line],
+            rising=self.rising[is_line],
+            initial_state=self.initial_state & (1 << line),
+        )
+
+
+# highest line that fits into the int64 words
+MAX_TTL_LINE = 62
+
+
+def reconstruct_ttl_words(
+    lines: np.ndarray, rising: np.ndarray, initial_state: int = 0
+) -> np.ndarray:
+    """State of all lines after each edge, starting from `initial_state`.
+
+    Repeated edges in the same direction do not change the state.
+    """
+    words = np.full(len(lines), initial_state, dtype=np.int64)
+    if len(lines) == 0:
+        return words
+
+    # edges of each line in time order, to compare them with the previous edge
+    order = np.argsort(lines, kind="stable")
+    sorted_lines = lines[order].astype(np.int64)
+    sorted_states = rising[order].astype(np.int64)
+    previous_states = np.empty_like(sorted_states)
+    previous_states[1:] = sorted_states[:-1]
+    is_first_edge = np.ones(len(order), dtype=bool)
+    is_first_edge[1:] = sorted_lines[1:] != sorted_lines[:-1]
+    previous_states[is_first_edge] = (initial_state >> sorted_lines[is_first_edge]) & 1
+
+    changes = np.empty(len(order), dtype=np.int64)
+    changes[order] = (sorted_states - previous_states) << sorted_lines
+    return words + np.cumsum(changes)
+
+
+def decode_ttl_edges(event: Event) -> TtlEdges:
+    """Decode the signed line numbers in `event.states` into edges of each line."""
+    states = np.asarray(event.states)
+    if np.any(states == 0):
+        raise ValueError("TTL states must be non-zero line numbers")
+    lines = (np.abs(states) - 1).astype(np.uint8)
+    if len(lines) and lines.max() > MAX_TTL_LINE:
+        raise ValueError(f"TTL lines above {MAX_TTL_LINE + 1} are not supported")
+    return TtlEdges(
+        timestamps=np.asarray(event.timestamps),
+        sample_numbers=np.asarray(event.sample_numbers),
+        lines=lines,
+        rising=states > 0,
+        initial_state=event.metadata.initial_state,
+    )
+
+
 def remove_repeating_simultaneous_words(event: Event) -> FullWordEvent:
-    """Convert event data to contain only changing words.
+    """Convert event data to contain only one full word per sample.
 
     The Network Events plugin can send full words, which causes
     multiple lines to change in the same sample. This function
-    removes the mulitple event entries for each bit and removes
-    the state attribute.
-
+    keeps only the last event of each sample, whose full word contains
+    all changes of that sample, and removes the state attribute.
+    Events are expected in the order of their sample numbers.
     """
-
-    # TODO: This does not work. Write a test that verifies it does.
-    unique_indices = np.where(np.diff(event.full_words, prepend=np.nan) != 0)[0]
+    sample_numbers = np.asarray(event.sample_numbers)
+    # last event of each run of equal sample numbers
+    is_last_in_sample = np.ones(len(sample_numbers), dtype=bool)
+    np.not_equal(sample_numbers[1:], sample_numbers[:-1], out=is_last_in_sample[:-1])
 
     return FullWordEvent(
         metadata=event.metadata,
-        full_words=event.full_words[unique_indices],
-        timestamps=event.timestamps[unique_indices],
-        sample_numbers=event.sample_numbers[unique_indices],
+        full_words=np.asarray(event.full_words)[is_last_in_sample],
+        timestamps=np.asarray(event.timestamps)[is_last_in_sample],
+        sample_numbers=sample_numbers[is_last_in_sample],
     )
 
 
@@ -203,21 +341,131 @@ def event_from_eventfolder(
             return Event.from_folder(full_event_folder_path, metadata)
 
 
-def find_ev02_source(oeinfo: dict):
-    for event in oeinfo["events"]:
-        if (
-            event["source_processor"] == "NI-DAQmx"
-            and event["stream_name"] == "PXIe-6341"
-        ):
-            return EventMetadata(**event)
-    return None
+# timestamps in ns and event codes of one event source
+EventStream = tuple[np.ndarray, np.ndarray]
+
+
+def is_monotonic(values: np.ndarray) -> bool:
+    """True if `values` never decrease."""
+    return bool(np.all(values[1:] >= values[:-1]))
+
+
+def merge_event_streams(streams: Sequence[EventStream]) -> EventStream:
+    """Merge event streams sorted by time into a single sorted stream.
+
+    The streams are concatenated and sorted with a stable sort, which
+    detects the already sorted runs and merges them in linear passes instead
+    of sorting all events from scratch. Simultaneous events keep the order
+    of `streams`. Streams do not need to be sorted, but then take longer.
+    """
+    if not streams:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int32)
+    timestamps_ns = np.concatenate([np.asarray(t, dtype=np.int64) for t, _ in streams])
+    event_codes = np.concatenate([np.asarray(c, dtype=np.int32) for _, c in streams])
+    if is_monotonic(timestamps_ns):
+        return timestamps_ns, event_codes
+    order = np.argsort(timestamps_ns, kind="stable")
+    return timestamps_ns[order], event_codes[order]
+
+
+class EventSourceIndex:
+    """Event sources of a recording, keyed by source processor and stream name."""
+
+    def __init__(self, oeinfo: dict):
+        self._sources: dict[tuple[str, str], list[EventMetadata]] = defaultdict(list)
+        self._processor_streams: dict[str, list[str]] = defaultdict(list)
+        for event in oeinfo["events"]:
+            metadata = EventMetadata(**event)
+            key = (metadata.source_processor, metadata.stream_name)
+            if key not in self._sources:
+                self._processor_streams[metadata.source_processor].append(
+                    metadata.stream_name
+                )
+            self._sources[key].append(metadata)
+
+    def find(
+        self, source_processor: str, stream_name: str | None = None
+    ) -> list[EventMetadata]:
+        """Sources of `source_processor`, of all streams if `stream_name` is None."""
+        if stream_name is not None:
+            return list(self._sources.get((source_processor, stream_name), []))
+        return [
+            metadata
+            for stream in self._processor_streams.get(source_processor, [])
+            for metadata in self._sources[(source_processor, stream)]
+        ]
+
+    def get(
+        self, source_processor: str, stream_name: str | None = None
+    ) -> EventMetadata | None:
+        """First source of `source_processor`, None if there is none."""
+        sources = self.find(source_processor, stream_name)
+        return sources[0] if sources else None
+
+
+_event_source_indices: weakref.WeakKeyDictionary[BinaryRecording, EventSourceIndex] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_event_sources(recording: BinaryRecording) -> EventSourceIndex:
+    """Index of the event sources of `recording`, built once per recording."""
+    index = _event_source_indices.get(recording)
+    if index is None:
+        index = EventSourceIndex(recording.info)
+        _event_source_indices[recording] = index
+    return index
+
+
+def find_ev02_source(oeinfo: dict) -> EventMetadata | None:
+    """Deprecated, use `get_event_sources(recording).get("NI-DAQmx", "PXIe-6341")`."""
+    warnings.warn(
+        "find_ev02_source is deprecated, use get_event_sources(recording).get(...)",
+        DeprecationWarning,
+        stacklevel=2,
+    )
+    return EventSourceIndex(oeinfo).get("NI-DAQmx", "PXIe-6341")
+
+
+def find_marker_source(oeinfo: dict) -> EventMetadata | None:
+    """Deprecated, use `get_event_sources(recording).get("Network Events")`."""
+    warnings.warn(
+        "find_marker_source is deprecated, use get_event_sources(recording).get(...)",
+        DeprecationWarning,
+        stacklevel=2,
+    )
+    return EventSourceIndex(oeinfo).get("Network Events")
+
+
+def _read_event_stream(
+    recording: Recording, metadata: EventMetadata, code_offset: int
+) -> EventStream:
+    events = event_from_eventfolder(
+        recording_directory=recording.directory, metadata=metadata
+    )
+    match events:
+        case FullWordEvent():
+            timestamps, event_codes = events.timestamps, events.full_words
+        case Event():
+            ttl_edges = decode_ttl_edges(events)
+            timestamps, event_codes = ttl_edges.timestamps, ttl_edges.event_codes()
+        case _:
+            raise ValueError(
+                f"Events of {metadata.source_processor} ({metadata.stream_name}) cannot be written to {EV_DATASET_NAME}"
+            )
+    return (
+        np.round(timestamps * 1e9).astype(np.int64),
+        event_codes.astype(np.int64) + code_offset,
+    )
 
 
-def find_marker_source(oeinfo: dict):
-    """Network Events for Markers"""
-    for event in oeinfo["events"]:
-        if event["source_processor"] == "Network Events":
-            return EventMetadata(**event)
+def _add_code_names(
+    ev02_dataset, codes: dict[str, int], metadata: EventMetadata, n_sources: int
+):
+    # names are prefixed with the stream name if there are several sources of a kind
+    prefix = f"{metadata.stream_name}/" if n_sources > 1 else ""
+    for name, code in codes.items():
+        ev02_dataset.attrs[f"{prefix}{name}"] = np.int32(code)
 
 
 def process_oe_events(
@@ -225,84 +473,71 @@ def process_oe_events(
 ):
     logger.info(f"Processing events in {dh5file._file.filename}")
 
-    timestamps_ns = np.array([], dtype=np.int64)
-    event_codes = np.array([], dtype=np.int32)
-
     assert isinstance(recording, BinaryRecording), (
         "Recording must be a BinaryRecording to process events."
     )
 
-    # TTL
-    ev02_source_metadata = find_ev02_source(recording.info)
-    if ev02_source_metadata is not None:
-        logging.info(
-            f"Processing TTL triggers from {ev02_source_metadata.stream_name} stream"
-        )
-        network_events_words = event_from_eventfolder(
-            recording_directory=recording.directory,
-            metadata=ev02_source_metadata,
-        )
-        assert isinstance(network_events_words, Event)
-
-        timestamps_ns = np.array(
-            np.int64(np.round(network_events_words.timestamps * 1e9)), dtype=np.int64
+    sources = get_event_sources(recording)
+    # (source, route) of the TTL and network events written to EV02
+    routed_sources: list[tuple[EventMetadata, EventSource]] = []
+    for route in event_config.event_sources():
+        found = sources.find(route.source_processor, route.stream_name)
+        if not found:
+            logger.warning(
+                f"No event source {route.source_processor} ({route.stream_name or 'any stream'}) in recording"
+            )
+        routed_sources += [(metadata, route) for metadata in found]
+    network_sources = [
+        (metadata, route)
+        for metadata, route in routed_sources
+        if metadata.source_processor == "Network Events"
+    ]
+    ttl_sources = [
+        (metadata, route)
+        for metadata, route in routed_sources
+        if metadata.source_processor != "Network Events"
+    ]
+
+    # line N of every TTL source is written as +/-N shifted by its offset
+    ttl_offsets = [route.code_offset for _, route in ttl_sources]
+    if len(set(ttl_offsets)) < len(ttl_offsets):
+        raise ValueError(
+            f"TTL sources {[metadata.stream_name for metadata, _ in ttl_sources]} share code offsets {ttl_offsets}, give each its own code_offset in the event sources"
         )
-        event_codes = network_events_words.states
 
-    # Network Events
-    network_events_source = find_marker_source(recording.info)
-    network_events_offset = event_config.network_events_offset
-    if network_events_source is not None:
+    event_streams: list[EventStream] = []
+    for metadata, route in routed_sources:
         logger.info(
-            f"Processing Network Events from {network_events_source.stream_name} stream"
-        )
-        network_events_words = event_from_eventfolder(
-            recording_directory=recording.directory,
-            metadata=network_events_source,
+            f"Processing {metadata.source_processor} events from {metadata.stream_name} stream with code offset {route.code_offset}"
         )
-        assert isinstance(network_events_words, FullWordEvent)
-
-        # append to timesatamps_ns and event_codes
-        timestamps_ns = np.concatenate(
-            (timestamps_ns, np.int64(np.round(network_events_words.timestamps * 1e9)))
-        ).astype(np.int64)
-        event_codes = np.concatenate(
-            (event_codes, network_events_words.full_words + network_events_offset)
-        ).astype(np.int32)
-
-    # sort event_codes and timesamps_ns according to timestamps_ns
-    sort_indices = np.argsort(timestamps_ns)
-    timestamps_ns = timestamps_ns[sort_indices]
-    event_codes = event_codes[sort_indices]
+        event_streams.append(_read_event_stream(recording, metadata, route.code_offset))
 
-    assert all(np.diff(timestamps_ns) >= 0)
+    timestamps_ns, event_codes = merge_event_streams(event_streams)
+    assert is_monotonic(timestamps_ns)
 
     dh5io.event_triggers.add_event_triggers_to_file(
         dh5file._file, timestamps_ns=timestamps_ns, event_codes=event_codes
     )
 
-    # add names of event codes as attributes to filed
+    # add names of event codes as attributes to dataset
+    ev02_dataset = dh5file._file[EV_DATASET_NAME]
     if event_config.ttl_line_names is not None:
-        ev02_dataset = dh5file._file[EV_DATASET_NAME]
-        for event_name, event_code in event_config.ttl_line_names.items():
-            ev02_dataset.attrs[str(event_name)] = np.int32(
-                event_code + network_events_offset
+        for metadata, route in ttl_sources:
+            ttl_codes = {}
+            for line_name, line_number in event_config.ttl_line_names.items():
+                ttl_codes[line_name] = line_number + route.code_offset
+                ttl_codes[f"{line_name}_falling"] = -line_number + route.code_offset
+            _add_code_names(ev02_dataset, ttl_codes, metadata, len(ttl_sources))
+    if event_config.network_events_code_name_map is not None:
+        for metadata, route in network_sources:
+            logging.debug(
+                f"Adding network events code names to dataset {EV_DATASET_NAME} with offset {route.code_offset}"
             )
-
-    if network_events_source is not None:
-        # add names of events as attributes to dataset
-        logging.debug(
-            f"Adding network events code names to dataset {EV_DATASET_NAME} with offset {network_events_offset}"
-        )
-        ev02_dataset = dh5file._file[EV_DATASET_NAME]
-        if event_config.network_events_code_name_map is not None:
-            for (
-                event_name,
-                event_code,
-            ) in event_config.network_events_code_name_map.items():
-                ev02_dataset.attrs[str(event_name)] = np.int32(
-                    event_code + network_events_offset
-                )
+            network_codes = {
+                name: code + route.code_offset
+                for name, code in event_config.network_events_code_name_map.items()
+            }
+            _add_code_names(ev02_dataset, network_codes, metadata, len(network_sources))
 
     # add operation to dh5 file
     dh5io.operations.add_operation_to_file(
@@ -0,0 +1,287 @@
+import hashlib
+import logging
+import os
+import sys
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Literal
+
+import numpy as np
+import scipy
+import scipy.signal as signal
+
+logger = logging.getLogger(__name__)
+
+FILTER_CACHE_DIR_ENV = "OECON_FILTER_CACHE_DIR"
+
+
+@dataclass(frozen=True)
+class FilterSpec:
+    """Everything that determines the coefficients of a filter design."""
+
+    ftype: str  # "fir" (Hamming window), "iir" (Chebyshev I) or "butter"
+    order: int
+    band_edges: tuple[float, ...]  # relative to Nyquist if sample_rate is None
+    sample_rate: float | None = None
+    downsampling_factor: int | None = None
+    btype: Literal["lowpass", "highpass", "bandpass", "bandstop"] = "lowpass"
+    output: Literal["ba", "sos"] = "ba"  # for IIR filters
+
+    def design(self) -> tuple[np.ndarray, ...]:
+        band_edges = (
+            self.band_edges[0] if len(self.band_edges) == 1 else list(self.band_edges)
+        )
+        match self.ftype:
+            case "fir":
+                return (
+                    signal.firwin(
+                        self.order + 1,
+                        band_edges,
+                        window="hamming",
+                        pass_zero=self.btype,
+                        fs=self.sample_rate,
+                    ),
+                )
+            case "iir":
+                # anti-aliasing filter of scipy.signal.decimate
+                return (
+                    signal.cheby1(
+                        self.order,
+                        0.05,
+                        band_edges,
+                        btype=self.btype,
+                        output="sos",
+                        fs=self.sample_rate,
+                    ),
+                )
+            case "butter":
+                if self.output == "sos":
+                    sos = signal.butter(
+                        N=self.order,
+                        Wn=band_edges,
+                        btype=self.btype,
+                        output="sos",
+                        fs=self.sample_rate,
+                    )
+                    return (sos,)
+                b, a = signal.butter(
+                    N=self.order,
+                    Wn=band_edges,
+                    btype=self.btype,
+                    output="ba",
+                    fs=self.sample_rate,
+                )
+                return (b, a)
+            case _:
+                raise ValueError(f"Unknown filter type: {self.ftype}")
+
+    def cache_key(self) -> str:
+        # designs may change between scipy versions
+        description = f"{self!r} scipy={scipy.__version__}"
+        return hashlib.sha256(description.encode()).hexdigest()[:32]
+
+
+def default_cache_dir() -> Path:
+    """Per-user cache directory for filter designs."""
+    if sys.platform == "win32":
+        base = Path(os.environ.get("LOCALAPPDATA", Path.home() / "AppData" / "Local"))
+    elif sys.platform == "darwin":
+        base = Path.home() / "Library" / "Caches"
+    else:
+        base = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+    return base / "oecon" / "filters"
+
+
+class FilterDesignCache:
+    """LRU cache of filter coefficients, optionally persisted to `cache_dir`.
+
+    Returned coefficient arrays are read-only and shared between callers.
+    """
+
+    def __init__(self, maxsize: int = 64, cache_dir: str | Path | None = None):
+        self.maxsize = maxsize
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self._designs: OrderedDict[FilterSpec, tuple[np.ndarray, ...]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, spec: FilterSpec) -> tuple[np.ndarray, ...]:
+        if spec in self._designs:
+            self._designs.move_to_end(spec)
+            self.hits += 1
+            return self._designs[spec]
+
+        self.misses += 1
+        coefficients = self._load(spec)
+        if coefficients is None:
+            logger.debug(f"Designing filter {spec}")
+            coefficients = spec.design()
+            self._save(spec, coefficients)
+
+        for array in coefficients:
+            array.flags.writeable = False
+        self._designs[spec] = coefficients
+        if len(self._designs) > self.maxsize:
+            self._designs.popitem(last=False)
+        return coefficients
+
+    def clear(self) -> None:
+        """Clear the in-memory cache. Files in `cache_dir` are kept."""
+        self._designs.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, spec: FilterSpec) -> Path:
+        assert self.cache_dir is not None
+        return self.cache_dir / f"{spec.cache_key()}.npz"
+
+    def _load(self, spec: FilterSpec) -> tuple[np.ndarray, ...] | None:
+        if self.cache_dir is None or not self._path(spec).exists():
+            return None
+        try:
+            with np.load(self._path(spec)) as stored:
+                if str(stored["spec"]) != repr(spec):
+                    return None
+                return tuple(
+                    stored[f"coefficients_{i}"] for i in range(len(stored.files) - 1)
+                )
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable filter cache file {self._path(spec)}: {e}")
+            return None
+
+    def _save(self, spec: FilterSpec, coefficients: tuple[np.ndarray, ...]) -> None:
+        if self.cache_dir is None:
+            return
+        path = self._path(spec)
+        temp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            arrays: dict[str, Any] = {
+                f"coefficients_{i}": c for i, c in enumerate(coefficients)
+            }
+            with open(temp_path, "wb") as f:
+                np.savez(f, spec=np.array(repr(spec)), **arrays)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write filter cache file {path}: {e}")
+
+
+def cache_dir_from_environment() -> Path | None:
+    """`OECON_FILTER_CACHE_DIR`, None if it is not set or empty."""
+    cache_dir = os.environ.get(FILTER_CACHE_DIR_ENV)
+    return Path(cache_dir) if cache_dir else None
+
+
+# in memory only unless OECON_FILTER_CACHE_DIR or set_filter_cache_dir opts in
+filter_design_cache = FilterDesignCache(cache_dir=cache_dir_from_environment())
+
+
+def set_filter_cache_dir(cache_dir: str | Path | None) -> None:
+    """Persist filter designs in `cache_dir`, e.g. `default_cache_dir()`.
+
+    With None, designs are only kept in memory.
+    """
+    filter_design_cache.cache_dir = Path(cache_dir) if cache_dir is not None else None
+
+
+def design_filter(spec: FilterSpec) -> tuple[np.ndarray, ...]:
+    """Coefficients for `spec`, designed once and then served from the cache."""
+    return filter_design_cache.get(spec)
+
+
+def impulse_response_length(sos: np.ndarray, tolerance: float = 1e-10) -> int:
+    """Samples after which the impulse response of `sos` has decayed below `tolerance`.
+
+    Estimated from the pole with the largest magnitude.
+    """
+    _, poles, _ = signal.sos2zpk(sos)
+    max_pole_magnitude = np.max(np.abs(poles), initial=0.0)
+    if max_pole_magnitude == 0:
+        # FIR sections
+        return 2 * np.asarray(sos).shape[0] + 1
+    if max_pole_magnitude >= 1:
+        raise ValueError("Filter is not stable")
+    return int(np.ceil(np.log(tolerance) / np.log(max_pole_magnitude)))
+
+
+class StreamingSosFiltFilt:
+    """Zero-phase IIR filtering of a signal pushed in chunks along axis 0.
+
+    Equivalent to `scipy.signal.sosfiltfilt` on the whole signal, including
+    its odd extension by `padlen` samples at both ends. The forward pass is
+    exact. The backward pass of each chunk starts `overlap` samples after its
+    end, so outputs are returned with a delay of `overlap` samples and differ
+    from `sosfiltfilt` by the impulse response after `overlap` samples.
+    """
+
+    def __init__(
+        self, sos: np.ndarray, overlap: int | None = None, padlen: int | None = None
+    ):
+        self.sos = np.asarray(sos)
+        if padlen is None:
+            # default of scipy.signal.sosfiltfilt
+            n_sections = self.sos.shape[0]
+            padlen = 3 * (
+                2 * n_sections
+                + 1
+                - min((self.sos[:, 2] == 0).sum(), (self.sos[:, 5] == 0).sum())
+            )
+        self.padlen = padlen
+        self.overlap = overlap if overlap is not None else impulse_response_length(sos)
+        self._zi: np.ndarray | None = None
+        self._pending: np.ndarray | None = None  # forward-filtered, not yet returned
+        self._tail: np.ndarray | None = None  # last input samples for the end extension
+
+    def _initial_state(self, x0: np.ndarray) -> np.ndarray:
+        zi = signal.sosfilt_zi(self.sos)
+        return zi.reshape(zi.shape + (1,) * (x0.ndim - 1)) * x0
+
+    def push(self, chunk: np.ndarray) -> np.ndarray:
+        """Add the next input chunk and return all outputs that can be computed."""
+        chunk = np.asarray(chunk)
+        if self._zi is None:
+            if chunk.shape[0] <= self.padlen:
+                raise ValueError(
+                    f"The first chunk must be longer than padlen={self.padlen} samples"
+                )
+            if np.issubdtype(chunk.dtype, np.floating):
+                self.sos = self.sos.astype(chunk.dtype)
+            left_extension = 2 * chunk[:1] - chunk[self.padlen : 0 : -1]
+            _, self._zi = signal.sosfilt(
+                self.sos,
+                left_extension,
+                axis=0,
+                zi=self._initial_state(left_extension[:1]),
+            )
+            self._pending = np.zeros((0,) + chunk.shape[1:], self.sos.dtype)
+            self._tail = chunk[:0]
+        assert self._pending is not None and self._tail is not None
+
+        forward, self._zi = signal.sosfilt(self.sos, chunk, axis=0, zi=self._zi)
+        self._pending = np.concatenate((self._pending, forward), axis=0)
+        self._tail = np.concatenate((self._tail, chunk), axis=0)[-(self.padlen + 1) :]
+
+        n_ready = self._pending.shape[0] - self.overlap
+        if n_ready <= 0:
+            return self._pending[:0].copy()
+        # backward pass starting from zero state `overlap` samples later
+        backward = signal.sosfilt(self.sos, self._pending[::-1], axis=0)[::-1]
+        self._pending = self._pending[n_ready:]
+        return backward[:n_ready]
+
+    def flush(self) -> np.ndarray:
+        """Return the remaining outputs, with the end of the signal extended."""
+        if self._zi is None:
+            raise ValueError("No data has been pushed to the filter")
+        assert self._pending is not None and self._tail is not None
+        right_extension = 2 * self._tail[-1:] - self._tail[-2 : -(self.padlen + 2) : -1]
+        forward, _ = signal.sosfilt(self.sos, right_extension, axis=0, zi=self._zi)
+        extended = np.concatenate((self._pending, forward), axis=0)
+        backward, _ = signal.sosfilt(
+            self.sos,
+            extended[::-1],
+            axis=0,
+            zi=self._initial_state(extended[-1:]),
+        )
+        return backward[::-1][: self._pending.shape[0]]
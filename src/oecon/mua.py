@@ -1,18 +1,46 @@
 import logging
-from dataclasses import dataclass
+from collections.abc import Iterable
+from concurrent.futures import Executor, Future
+from dataclasses import dataclass, replace
+from itertools import pairwise
+from typing import Any, Literal
 
 import dh5io
-import dh5io.cont
 import dh5io.operations
 import numpy as np
 import numpy.typing as npt
 import scipy.signal as signal
 from dh5io import DH5File
-from dhspec.cont import create_channel_info, create_empty_index_array
+from dhspec.cont import create_channel_info
+from open_ephys.analysis.recording import Continuous, ContinuousMetadata
 from open_ephys.analysis.recording import Recording as OERecording
 
 import oecon.default_mappings as default
-from oecon.decimation import DecimationConfig, decimate_np_array
+import oecon.version
+from oecon.decimation import (
+    DecimationConfig,
+    OutputChannel,
+    create_executor,
+    create_streaming_decimator,
+    decimate_np_array,
+    get_compute_dtype,
+    get_decimation_stages,
+    group_output_channels,
+    iter_sample_chunks,
+    plan_lfp_channels,
+    read_raw_counts,
+    store_saturation_counts,
+    validate_decimation_config,
+    write_lfp_channels,
+)
+from oecon.filters import FilterSpec, StreamingSosFiltFilt, design_filter
+from oecon.scaling import quantize_to_int16
+from oecon.storage import (
+    ChunkLayout,
+    Compression,
+    create_cont_group_from_data,
+    create_start_index,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -23,26 +51,474 @@ class FilterConfigBA:
     a: list[float] | None | npt.NDArray[np.float64]
 
 
+@dataclass
+class MuaBand:
+    """Band of a filter bank whose rectified envelope is written per channel."""
+
+    name: str  # last part of the CONT group names, e.g. "MUA" or "gamma"
+    low_cutoff_hz: float | None  # None for a low-pass
+    high_cutoff_hz: float | None = None  # None for a high-pass
+    order: int = 4  # Butterworth order
+    start_block_id: int | None = None  # after the previous band if None
+
+    def filter_spec(self, sample_rate: float) -> FilterSpec:
+        if self.low_cutoff_hz is None and self.high_cutoff_hz is None:
+            raise ValueError(f"Band '{self.name}' has neither a low nor a high cutoff")
+        band_edges: tuple[float, ...]
+        btype: Literal["lowpass", "highpass", "bandpass"]
+        if self.high_cutoff_hz is None:
+            assert self.low_cutoff_hz is not None
+            band_edges, btype = (self.low_cutoff_hz,), "highpass"
+        elif self.low_cutoff_hz is None:
+            band_edges, btype = (self.high_cutoff_hz,), "lowpass"
+        else:
+            band_edges, btype = (self.low_cutoff_hz, self.high_cutoff_hz), "bandpass"
+        return FilterSpec(
+            ftype="butter",
+            order=self.order,
+            band_edges=band_edges,
+            sample_rate=sample_rate,
+            btype=btype,
+            output="sos",
+        )
+
+
 @dataclass
 class ContinuousMuaConfig:
     highpass_cutoff_hz: float = 300.0
     filter_coecfficients_b_a: FilterConfigBA | None = None
     included_channel_names: list[str] | None = None  # None for all
     start_block_id: int = default.DEFAULT_CONT_GROUP_RANGES[default.ContGroups.ESA][0]
+    batch_channels: bool = False  # read and filter all channels of a stream together
+    precision: str = "float64"  # "float64" or "float32" for filtering in single precision
+    chunk_size: int | None = None  # raw samples per high-pass chunk, whole recording if None
+    bands: list[MuaBand] | None = None  # filter bank instead of the single high-pass
+    chunk_layout: ChunkLayout | None = None  # HDF5 chunks of the MUA, contiguous if None
+    compression: Compression | None = None  # uncompressed if None
 
 
-def extract_continuous_mua(
+def _highpass_spec(
     config: ContinuousMuaConfig,
+    sample_rate: float,
+    output: Literal["ba", "sos"] = "ba",
+) -> FilterSpec:
+    return FilterSpec(
+        ftype="butter",
+        order=4,
+        band_edges=(config.highpass_cutoff_hz,),
+        sample_rate=sample_rate,
+        btype="highpass",
+        output=output,
+    )
+
+
+def _get_highpass_coefficients(
+    config: ContinuousMuaConfig, sample_rate: float
+) -> tuple[np.ndarray, np.ndarray]:
+    # designed for the first stream and stored in the config
+    if config.filter_coecfficients_b_a is None:
+        b, a = design_filter(_highpass_spec(config, sample_rate))
+        config.filter_coecfficients_b_a = FilterConfigBA(b=b, a=a)
+    return (
+        np.array(config.filter_coecfficients_b_a.b),
+        np.array(config.filter_coecfficients_b_a.a),
+    )
+
+
+def _get_highpass_sos(config: ContinuousMuaConfig, sample_rate: float) -> np.ndarray:
+    """Second-order sections of the high-pass of `_get_highpass_coefficients`.
+
+    Designed as sections unless the config holds other coefficients, e.g.
+    given by the user or designed for another sample rate.
+    """
+    b, a = _get_highpass_coefficients(config, sample_rate)
+    designed_b, designed_a = design_filter(_highpass_spec(config, sample_rate))
+    if np.array_equal(b, designed_b) and np.array_equal(a, designed_a):
+        return design_filter(_highpass_spec(config, sample_rate, output="sos"))[0]
+    return signal.tf2sos(b, a)
+
+
+def design_band_filters(
+    config: ContinuousMuaConfig, sample_rate: float
+) -> list[np.ndarray]:
+    """Second-order sections of every band of `config.bands`."""
+    assert config.bands is not None
+    return [design_filter(band.filter_spec(sample_rate))[0] for band in config.bands]
+
+
+def _design_sos_per_band(
+    config: ContinuousMuaConfig, sample_rate: float
+) -> list[np.ndarray]:
+    if config.bands is None:
+        return [_get_highpass_sos(config, sample_rate)]
+    return design_band_filters(config, sample_rate)
+
+
+def validate_mua_config(config: ContinuousMuaConfig, recording: OERecording) -> None:
+    """Check `config` against the streams of `recording` before any data is processed.
+
+    Chunks must be longer than the padding and the overlap of the streaming
+    zero-phase filters, see `StreamingSosFiltFilt`.
+    """
+    get_compute_dtype(config.precision)
+    if config.chunk_size is None:
+        return
+    assert recording.continuous is not None, (
+        "No continuous data found in the recording."
+    )
+    band_names = (
+        ["MUA"] if config.bands is None else [band.name for band in config.bands]
+    )
+    for oe_cont in recording.continuous:
+        sample_rate = oe_cont.metadata.sample_rate
+        for name, sos in zip(band_names, _design_sos_per_band(config, sample_rate)):
+            highpass = StreamingSosFiltFilt(sos)
+            min_chunk_size = max(highpass.padlen, highpass.overlap)
+            if config.chunk_size <= min_chunk_size:
+                raise ValueError(
+                    f"MUA chunk size must be larger than {min_chunk_size} samples, the padding and overlap of the '{name}' filter at {sample_rate} Hz, got {config.chunk_size}"
+                )
+
+
+def get_band_block_id_offsets(config: ContinuousMuaConfig, n_channels: int) -> list[int]:
+    """Offset of the block IDs of each band relative to `config.start_block_id`.
+
+    Each band takes `n_channels` consecutive block IDs. Bands without a
+    `start_block_id` follow the previous band.
+    """
+    assert config.bands is not None
+    start_block_ids = []
+    next_start_block_id = config.start_block_id
+    for band in config.bands:
+        if band.start_block_id is not None:
+            next_start_block_id = band.start_block_id
+        start_block_ids.append(next_start_block_id)
+        next_start_block_id += n_channels
+
+    ranges = sorted(zip(start_block_ids, [band.name for band in config.bands]))
+    for (start, name), (next_start, next_name) in pairwise(ranges):
+        if next_start < start + n_channels:
+            raise ValueError(
+                f"Block IDs of bands '{name}' ({start}-{start + n_channels - 1}) and '{next_name}' ({next_start}-{next_start + n_channels - 1}) overlap"
+            )
+    esa_start, esa_end = default.DEFAULT_CONT_GROUP_RANGES[default.ContGroups.ESA]
+    for start, name in ranges:
+        if start < esa_start or start + n_channels - 1 > esa_end:
+            logger.warning(
+                f"Block IDs of band '{name}' ({start}-{start + n_channels - 1}) are outside of the ESA range {esa_start}-{esa_end}"
+            )
+    return [start - config.start_block_id for start in start_block_ids]
+
+
+def _rectify(filtered: np.ndarray) -> np.ndarray:
+    return np.abs(filtered, out=filtered)
+
+
+def compute_mua_bands_in_chunks(
+    chunks: Iterable[np.ndarray],
+    sos_per_band: list[np.ndarray],
     decimation_config: DecimationConfig,
-    recording: OERecording,
+    n_samples: int,
+) -> list[np.ndarray]:
+    """Envelopes of several bands of a signal of `n_samples` read in chunks.
+
+    Every chunk is zero-phase filtered with each of `sos_per_band`, rectified
+    in place and decimated. With FIR or polyphase decimation, the envelopes
+    are decimated as soon as they are filtered, so no full-rate array is
+    allocated. IIR decimation needs the whole envelope of each band.
+    """
+    highpasses = [StreamingSosFiltFilt(sos) for sos in sos_per_band]
+
+    if decimation_config.ftype in ("fir", "polyphase"):
+        decimators = [create_streaming_decimator(decimation_config) for _ in highpasses]
+        decimated: list[list[np.ndarray]] = [[] for _ in highpasses]
+        for chunk in chunks:
+            for highpass, decimator, blocks in zip(highpasses, decimators, decimated):
+                blocks.append(decimator.push(_rectify(highpass.push(chunk))))
+        for highpass, decimator, blocks in zip(highpasses, decimators, decimated):
+            blocks.append(decimator.push(_rectify(highpass.flush())))
+            blocks.append(decimator.flush())
+        return [np.concatenate(blocks, axis=0) for blocks in decimated]
+
+    envelopes: list[np.ndarray] = []
+    offsets = [0] * len(highpasses)
+
+    def store(i_band: int, rectified: np.ndarray) -> None:
+        if len(envelopes) <= i_band:
+            envelopes.append(
+                np.empty((n_samples,) + rectified.shape[1:], dtype=rectified.dtype)
+            )
+        offset = offsets[i_band]
+        envelopes[i_band][offset : offset + rectified.shape[0]] = rectified
+        offsets[i_band] += rectified.shape[0]
+
+    for chunk in chunks:
+        for i_band, highpass in enumerate(highpasses):
+            store(i_band, _rectify(highpass.push(chunk)))
+    for i_band, highpass in enumerate(highpasses):
+        store(i_band, _rectify(highpass.flush()))
+    assert offsets == [n_samples] * len(highpasses)
+    return [_decimate_mua(envelope, decimation_config) for envelope in envelopes]
+
+
+def compute_mua_in_chunks(
+    chunks: Iterable[np.ndarray],
+    sos: np.ndarray,
+    decimation_config: DecimationConfig,
+    n_samples: int,
+) -> np.ndarray:
+    """High-pass filter, rectify and decimate a signal of `n_samples` read in chunks."""
+    return compute_mua_bands_in_chunks(chunks, [sos], decimation_config, n_samples)[0]
+
+
+def compute_mua_bands(
+    samples: np.ndarray,
+    sos_per_band: list[np.ndarray],
+    decimation_config: DecimationConfig,
+) -> list[np.ndarray]:
+    """Envelopes of `samples` (samples x channels) in each band of a filter bank.
+
+    The bands are filtered one after another from the same samples. For
+    samples read in chunks, see `compute_mua_bands_in_chunks`.
+    """
+    envelopes = []
+    for sos in sos_per_band:
+        rectified = _rectify(
+            signal.sosfiltfilt(sos.astype(samples.dtype), samples, axis=0)
+        )
+        envelopes.append(_decimate_mua(rectified, decimation_config))
+        del rectified
+    return envelopes
+
+
+def compute_mua(
+    samples: np.ndarray,
+    b: np.ndarray,
+    a: np.ndarray,
+    decimation_config: DecimationConfig,
+) -> np.ndarray:
+    """High-pass filter, rectify and decimate `samples` (samples x channels).
+
+    Filters in double precision. Transfer function coefficients are too
+    inaccurate in single precision, use `compute_mua_bands` with second-order
+    sections instead.
+
+    Equivalent to `scipy.signal.filtfilt`, but at most two full-length arrays
+    are alive at a time. Pass `samples` without keeping a reference to them to
+    have them freed once they are padded.
+    """
+    # High-pass filter with the odd extension of filtfilt
+    padlen = 3 * max(len(a), len(b))
+    if samples.shape[0] <= padlen:
+        raise ValueError(
+            f"MUA needs more than {padlen} samples, got {samples.shape[0]}"
+        )
+    extended = np.concatenate(
+        (
+            2 * samples[:1] - samples[padlen:0:-1],
+            samples,
+            2 * samples[-1:] - samples[-2 : -(padlen + 2) : -1],
+        ),
+        axis=0,
+    )
+    del samples
+    zi = signal.lfilter_zi(b, a)
+    zi = zi.reshape(zi.shape + (1,) * (extended.ndim - 1))
+    forward, _ = signal.lfilter(b, a, extended, axis=0, zi=zi * extended[:1])
+    del extended
+    backward, _ = signal.lfilter(b, a, forward[::-1], axis=0, zi=zi * forward[-1:])
+    del forward
+    filtered = backward[::-1][padlen:-padlen]
+    del backward
+
+    # Rectify in place
+    rectified = _rectify(filtered)
+    del filtered
+
+    return _decimate_mua(rectified, decimation_config)
+
+
+def _decimate_mua(
+    rectified: np.ndarray, decimation_config: DecimationConfig
+) -> np.ndarray:
+    return decimate_np_array(
+        data=rectified,
+        downsampling_factor=decimation_config.downsampling_factor,
+        filter_order=decimation_config.filter_order,
+        filter_type=decimation_config.ftype,
+        axis=0,
+        zero_phase=decimation_config.zero_phase,
+        stages=get_decimation_stages(decimation_config),
+    )
+
+
+def _write_mua_channels(
+    oe_metadata: ContinuousMetadata,
+    channels: list[OutputChannel],
+    decimated_block: np.ndarray,
     dh5file: DH5File,
-) -> ContinuousMuaConfig:
+    sample_period_ns: np.int32,
+    index: np.ndarray,
+    band_name: str = "MUA",
+    chunk_layout: ChunkLayout | None = None,
+    compression: Compression | None = None,
+) -> None:
+    # decimated_block is in raw ADC counts, calibrated with one factor per channel
+    scaling_factors = [
+        oe_metadata.bit_volts[channel.channel_index] for channel in channels
+    ]
+    quantized_block, n_saturated = quantize_to_int16(decimated_block)
+    for column, channel in enumerate(channels):
+        cont_group = create_cont_group_from_data(
+            file=dh5file._file,
+            cont_group_id=channel.cont_group_id,
+            data=quantized_block[:, column : column + 1],
+            index=index,
+            sample_period_ns=sample_period_ns,
+            chunk_layout=chunk_layout,
+            compression=compression,
+            name=f"{oe_metadata.stream_name}/{channel.channel_name}/{band_name}",
+            channels=channel.channel_info,
+            calibration=np.array(scaling_factors[column]),
+        )
+        store_saturation_counts(cont_group, n_saturated[column : column + 1])
+
+
+def _write_mua_bands(
+    bands: list[MuaBand],
+    band_block_id_offsets: list[int],
+    oe_metadata: ContinuousMetadata,
+    channels: list[OutputChannel],
+    envelopes: list[np.ndarray],
+    dh5file: DH5File,
+    sample_period_ns: np.int32,
+    index: np.ndarray,
+    chunk_layout: ChunkLayout | None = None,
+    compression: Compression | None = None,
+) -> None:
+    for band, block_id_offset, envelope in zip(bands, band_block_id_offsets, envelopes):
+        _write_mua_channels(
+            oe_metadata=oe_metadata,
+            channels=[
+                replace(channel, cont_group_id=channel.cont_group_id + block_id_offset)
+                for channel in channels
+            ],
+            decimated_block=envelope,
+            dh5file=dh5file,
+            sample_period_ns=sample_period_ns,
+            index=index,
+            band_name=band.name,
+            chunk_layout=chunk_layout,
+            compression=compression,
+        )
+
+
+def _extract_mua_from_channel_group(
+    config: ContinuousMuaConfig,
+    decimation_config: DecimationConfig,
+    oe_cont: Continuous,
+    channels: list[OutputChannel],
+    dh5file: DH5File,
+    sample_period_ns: np.int32,
+    index: np.ndarray,
+    band_block_id_offsets: list[int] | None = None,
+) -> None:
+    oe_metadata = oe_cont.metadata
+    channel_indices = [channel.channel_index for channel in channels]
+    dtype = get_compute_dtype(config.precision)
+    # transfer function only for the double-precision high-pass of whole channels
+    filtfilt_b_a = (
+        config.bands is None and config.chunk_size is None and dtype == np.float64
+    )
+    if filtfilt_b_a:
+        b, a = _get_highpass_coefficients(config, oe_metadata.sample_rate)
+    else:
+        sos_per_band = _design_sos_per_band(config, oe_metadata.sample_rate)
+
+    if config.chunk_size is None and filtfilt_b_a:
+        # the raw samples are not bound to a name here, so compute_mua frees
+        # them as soon as they are padded
+        envelopes = [
+            compute_mua(
+                read_raw_counts(
+                    oe_cont,
+                    start_sample_index=0,
+                    end_sample_index=None,
+                    channel_indices=channel_indices,
+                    dtype=dtype,
+                ),
+                b,
+                a,
+                decimation_config,
+            )
+        ]
+    elif config.chunk_size is None:
+        samples = read_raw_counts(
+            oe_cont,
+            start_sample_index=0,
+            end_sample_index=None,
+            channel_indices=channel_indices,
+            dtype=dtype,
+        )
+        envelopes = compute_mua_bands(samples, sos_per_band, decimation_config)
+        del samples
+    else:
+        # every chunk is read once and filtered in all bands
+        n_samples = oe_cont.samples.shape[0]
+        envelopes = compute_mua_bands_in_chunks(
+            (
+                read_raw_counts(oe_cont, start, stop, channel_indices, dtype)
+                for start, stop in iter_sample_chunks(n_samples, config.chunk_size)
+            ),
+            sos_per_band,
+            decimation_config,
+            n_samples=n_samples,
+        )
+
+    if config.bands is None:
+        _write_mua_channels(
+            oe_metadata=oe_metadata,
+            channels=channels,
+            decimated_block=envelopes[0],
+            dh5file=dh5file,
+            sample_period_ns=sample_period_ns,
+            index=index,
+            chunk_layout=config.chunk_layout,
+            compression=config.compression,
+        )
+    else:
+        assert band_block_id_offsets is not None
+        _write_mua_bands(
+            bands=config.bands,
+            band_block_id_offsets=band_block_id_offsets,
+            oe_metadata=oe_metadata,
+            channels=channels,
+            envelopes=envelopes,
+            dh5file=dh5file,
+            sample_period_ns=sample_period_ns,
+            index=index,
+            chunk_layout=config.chunk_layout,
+            compression=config.compression,
+        )
+
+
+def plan_mua_channels(
+    config: ContinuousMuaConfig,
+    decimation_config: DecimationConfig,
+    recording: OERecording,
+) -> list[tuple[Continuous, list[OutputChannel]]]:
+    """MUA output channels of every continuous stream of `recording`.
+
+    Block IDs are assigned consecutively from `config.start_block_id` over all
+    streams.
+    """
     assert recording.continuous is not None, (
         "No continuous data found in the recording."
     )
 
     global_channel_index = 0
     dh5_cont_id = config.start_block_id
+    plan: list[tuple[Continuous, list[OutputChannel]]] = []
 
     for oe_cont in recording.continuous:
         oe_metadata = oe_cont.metadata
@@ -56,88 +532,294 @@ def extract_continuous_mua(
 
         decimation_config.included_channel_names = config.included_channel_names
 
-        logger.info(
-            f"Extracting continuous MUA from {oe_metadata.num_channels} channels continuous data from {oe_metadata.source_node_name} (source_node={oe_metadata.source_node_id})"
-        )
+        channels: list[OutputChannel] = []
         for channel_index, channel_name in enumerate(oe_metadata.channel_names):
             if channel_name not in config.included_channel_names:
                 continue
 
-            samples = oe_cont.get_samples(
-                start_sample_index=0,
-                end_sample_index=-1,
-                selected_channels=None,
-                selected_channel_names=[channel_name],
+            channel_info = create_channel_info(
+                GlobalChanNumber=global_channel_index,
+                BoardChanNo=channel_index,
+                ADCBitWidth=16,
+                MaxVoltageRange=10.0,
+                MinVoltageRange=10.0,
+                AmplifChan0=0,
             )
-
-            # High-pass filter
-            if config.filter_coecfficients_b_a is None:
-                b, a = signal.butter(
-                    N=4,
-                    Wn=config.highpass_cutoff_hz,
-                    btype="highpass",
-                    fs=oe_metadata.sample_rate,
+            channels.append(
+                OutputChannel(
+                    channel_index=channel_index,
+                    channel_name=channel_name,
+                    cont_group_id=dh5_cont_id,
+                    channel_info=channel_info,
                 )
-                config.filter_coecfficients_b_a = FilterConfigBA(b=b, a=a)
-            filtered = signal.filtfilt(
-                b=np.array(config.filter_coecfficients_b_a.b),
-                a=np.array(config.filter_coecfficients_b_a.a),
-                x=samples,
-                axis=0,
             )
 
-            # Rectify
-            rectified = np.abs(filtered)
+            dh5_cont_id += 1
+            global_channel_index += 1
+        plan.append((oe_cont, channels))
+
+    return plan
 
-            # Decimate
-            decimated_samples = decimate_np_array(
-                data=rectified,
+
+def _plan_band_block_id_offsets(
+    config: ContinuousMuaConfig, plan: list[tuple[Continuous, list[OutputChannel]]]
+) -> list[int] | None:
+    if config.bands is None:
+        return None
+    n_channels = sum(len(channels) for _, channels in plan)
+    return get_band_block_id_offsets(config, n_channels)
+
+
+def extract_continuous_mua(
+    config: ContinuousMuaConfig,
+    decimation_config: DecimationConfig,
+    recording: OERecording,
+    dh5file: DH5File,
+) -> ContinuousMuaConfig:
+    """Write the rectified, decimated high-pass signal of every included channel.
+
+    With `config.bands`, the envelope of every band is written to its own
+    range of block IDs, computed from a single read of the raw data.
+    """
+    validate_mua_config(config, recording)
+    plan = plan_mua_channels(config, decimation_config, recording)
+    band_block_id_offsets = _plan_band_block_id_offsets(config, plan)
+    for oe_cont, channels in plan:
+        oe_metadata = oe_cont.metadata
+        logger.info(
+            f"Extracting continuous MUA from {oe_metadata.num_channels} channels continuous data from {oe_metadata.source_node_name} (source_node={oe_metadata.source_node_id})"
+        )
+
+        index = create_start_index(oe_cont)
+
+        sample_period_ns = np.int32(
+            1.0 / oe_metadata.sample_rate * 1e9 * decimation_config.downsampling_factor
+        )
+        for channel_group in group_output_channels(channels, config.batch_channels):
+            _extract_mua_from_channel_group(
+                config=config,
+                decimation_config=decimation_config,
+                oe_cont=oe_cont,
+                channels=channel_group,
+                dh5file=dh5file,
+                sample_period_ns=sample_period_ns,
+                index=index,
+                band_block_id_offsets=band_block_id_offsets,
+            )
+
+    dh5io.operations.add_operation_to_file(
+        dh5file._file,
+        "extract_continuous_mua",
+        "oecon_mua_extraction",
+    )
+
+    return config
+
+
+def _select_columns(samples: np.ndarray, columns: list[int]) -> np.ndarray:
+    # a view for consecutive columns, otherwise a copy
+    if columns == list(range(columns[0], columns[0] + len(columns))):
+        return samples[:, columns[0] : columns[0] + len(columns)]
+    return samples[:, columns]
+
+
+def _extract_lfp_and_mua_from_channel_groups(
+    decimation_config: DecimationConfig,
+    mua_config: ContinuousMuaConfig,
+    oe_cont: Continuous,
+    raw_channel_groups: list[list[int]],
+    lfp_channels: list[OutputChannel],
+    mua_channels: list[OutputChannel],
+    dh5file: DH5File,
+    sample_period_ns: np.int32,
+    index: np.ndarray,
+    executor: Executor,
+    band_block_id_offsets: list[int] | None = None,
+) -> None:
+    """Read the raw channels of several groups once and write their LFP and MUA.
+
+    Each group is decimated and MUA-filtered as separate tasks of `executor`.
+    """
+    lfp_dtype = get_compute_dtype(decimation_config.precision)
+    mua_dtype = get_compute_dtype(mua_config.precision)
+    oe_metadata = oe_cont.metadata
+    raw_channel_indices = [i for group in raw_channel_groups for i in group]
+    # read in the finer of both precisions, cast per branch below
+    samples = read_raw_counts(
+        oe_cont,
+        start_sample_index=0,
+        end_sample_index=None,
+        channel_indices=raw_channel_indices,
+        dtype=np.result_type(lfp_dtype, mua_dtype).type,
+    )
+    column_of_channel = {
+        channel_index: column for column, channel_index in enumerate(raw_channel_indices)
+    }
+    filtfilt_b_a = mua_config.bands is None and mua_dtype == np.float64
+    if filtfilt_b_a:
+        b, a = _get_highpass_coefficients(mua_config, oe_metadata.sample_rate)
+    else:
+        sos_per_band = _design_sos_per_band(mua_config, oe_metadata.sample_rate)
+
+    tasks = []
+    for raw_channel_group in raw_channel_groups:
+        lfp_group = [c for c in lfp_channels if c.channel_index in raw_channel_group]
+        mua_group = [c for c in mua_channels if c.channel_index in raw_channel_group]
+        lfp_future: Future[np.ndarray] | None = None
+        # an array for the high-pass, a list of envelopes for a filter bank
+        mua_future: Future[Any] | None = None
+        if lfp_group:
+            lfp_samples = _select_columns(
+                samples, [column_of_channel[c.channel_index] for c in lfp_group]
+            )
+            lfp_future = executor.submit(
+                decimate_np_array,
+                data=lfp_samples.astype(lfp_dtype, copy=False),
                 downsampling_factor=decimation_config.downsampling_factor,
                 filter_order=decimation_config.filter_order,
                 filter_type=decimation_config.ftype,
                 axis=0,
                 zero_phase=decimation_config.zero_phase,
+                stages=get_decimation_stages(decimation_config),
+            )
+        if mua_group:
+            mua_samples = _select_columns(
+                samples, [column_of_channel[c.channel_index] for c in mua_group]
             )
+            if filtfilt_b_a:
+                mua_future = executor.submit(
+                    compute_mua,
+                    mua_samples.astype(mua_dtype, copy=False),
+                    b,
+                    a,
+                    decimation_config,
+                )
+            else:
+                mua_future = executor.submit(
+                    compute_mua_bands,
+                    mua_samples.astype(mua_dtype, copy=False),
+                    sos_per_band,
+                    decimation_config,
+                )
+        tasks.append((lfp_group, lfp_future, mua_group, mua_future))
+    del samples
 
-            channel_info = create_channel_info(
-                GlobalChanNumber=global_channel_index,
-                BoardChanNo=channel_index,
-                ADCBitWidth=16,
-                MaxVoltageRange=10.0,
-                MinVoltageRange=10.0,
-                AmplifChan0=0,
+    for lfp_group, lfp_future, mua_group, mua_future in tasks:
+        if lfp_future is not None:
+            write_lfp_channels(
+                config=decimation_config,
+                oe_metadata=oe_metadata,
+                channels=lfp_group,
+                decimated_block=lfp_future.result(),
+                dh5file=dh5file,
+                sample_period_ns=sample_period_ns,
+                region_index=index,
+            )
+        if mua_future is not None and mua_config.bands is None:
+            # the envelope of the high-pass, or a filter bank of just that band
+            envelope = mua_future.result() if filtfilt_b_a else mua_future.result()[0]
+            _write_mua_channels(
+                oe_metadata=oe_metadata,
+                channels=mua_group,
+                decimated_block=envelope,
+                dh5file=dh5file,
+                sample_period_ns=sample_period_ns,
+                index=index,
+                chunk_layout=mua_config.chunk_layout,
+                compression=mua_config.compression,
+            )
+        elif mua_future is not None:
+            assert mua_config.bands is not None and band_block_id_offsets is not None
+            _write_mua_bands(
+                bands=mua_config.bands,
+                band_block_id_offsets=band_block_id_offsets,
+                oe_metadata=oe_metadata,
+                channels=mua_group,
+                envelopes=mua_future.result(),
+                dh5file=dh5file,
+                sample_period_ns=sample_period_ns,
+                index=index,
+                chunk_layout=mua_config.chunk_layout,
+                compression=mua_config.compression,
             )
 
-            scaling_factor = oe_cont.metadata.bit_volts[channel_index]
-            decimated_samples /= scaling_factor
-            decimated_samples = decimated_samples.astype(np.int16)
 
-            index = create_empty_index_array(1)
-            index[0]["time"] = np.int64(oe_cont.timestamps[0] * 1e9)
-            index[0]["offset"] = 0
-            dh5io.cont.create_cont_group_from_data_in_file(
-                file=dh5file._file,
-                cont_group_id=dh5_cont_id,
-                data=decimated_samples,
-                index=index,
-                sample_period_ns=np.int32(
-                    1.0
-                    / oe_metadata.sample_rate
-                    * 1e9
-                    * decimation_config.downsampling_factor
-                ),
-                name=f"{oe_metadata.stream_name}/{channel_name}/MUA",
-                channels=channel_info,
-                calibration=np.array(oe_metadata.bit_volts[channel_index]),
+def extract_lfp_and_mua(
+    decimation_config: DecimationConfig,
+    mua_config: ContinuousMuaConfig,
+    recording: OERecording,
+    dh5file: DH5File,
+) -> tuple[DecimationConfig, ContinuousMuaConfig]:
+    """Decimate raw data to LFP and extract continuous MUA in a single pass.
+
+    Writes the same CONT groups as `decimate_raw_data` followed by
+    `extract_continuous_mua`, but every raw channel is read only once. The
+    whole recording of the channels is read at once, so chunked decimation or
+    MUA extraction is not supported.
+    """
+    if decimation_config.chunk_size is not None:
+        raise ValueError(
+            "Combined LFP and MUA extraction does not support chunked decimation"
+        )
+    if mua_config.chunk_size is not None:
+        raise ValueError(
+            "Combined LFP and MUA extraction does not support chunked MUA extraction"
+        )
+    validate_decimation_config(decimation_config)
+    # fail before any CONT group is written
+    validate_mua_config(mua_config, recording)
+    lfp_plan = plan_lfp_channels(decimation_config, recording)
+    mua_plan = plan_mua_channels(mua_config, decimation_config, recording)
+    band_block_id_offsets = _plan_band_block_id_offsets(mua_config, mua_plan)
+
+    n_workers = decimation_config.n_workers
+    batch_channels = decimation_config.batch_channels or mua_config.batch_channels
+    with create_executor(n_workers) as executor:
+        for (oe_cont, lfp_channels), (_, mua_channels) in zip(lfp_plan, mua_plan):
+            oe_metadata = oe_cont.metadata
+            logger.info(
+                f"Extracting LFP and continuous MUA ({oe_metadata.sample_rate} -> {oe_metadata.sample_rate / decimation_config.downsampling_factor} Hz) from {oe_metadata.num_channels} channels continuous data from {oe_metadata.source_node_name} ({oe_metadata.source_node_id}) using {n_workers} worker(s)"
             )
 
-            dh5_cont_id += 1
-            global_channel_index += 1
+            index = create_start_index(oe_cont)
+
+            sample_period_ns = np.int32(
+                1.0
+                / oe_metadata.sample_rate
+                * 1e9
+                * decimation_config.downsampling_factor
+            )
+            raw_channel_indices = sorted(
+                {channel.channel_index for channel in lfp_channels + mua_channels}
+            )
+            # groups of one wave are read together and processed in parallel
+            raw_channel_groups = group_output_channels(
+                raw_channel_indices, batch_channels, n_groups=n_workers
+            )
+            for i_wave in range(0, len(raw_channel_groups), n_workers):
+                _extract_lfp_and_mua_from_channel_groups(
+                    decimation_config=decimation_config,
+                    mua_config=mua_config,
+                    oe_cont=oe_cont,
+                    raw_channel_groups=raw_channel_groups[i_wave : i_wave + n_workers],
+                    lfp_channels=lfp_channels,
+                    mua_channels=mua_channels,
+                    dh5file=dh5file,
+                    sample_period_ns=sample_period_ns,
+                    index=index,
+                    executor=executor,
+                    band_block_id_offsets=band_block_id_offsets,
+                )
 
+    dh5io.operations.add_operation_to_file(
+        dh5file._file,
+        "decimate_raw_data",
+        f"oecon_v{oecon.version.get_version_from_pyproject()}",
+    )
     dh5io.operations.add_operation_to_file(
         dh5file._file,
         "extract_continuous_mua",
         "oecon_mua_extraction",
     )
 
-    return config
+    return decimation_config, mua_config
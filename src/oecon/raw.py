@@ -1,14 +1,38 @@
+import logging
+import os
+import time
 from dataclasses import dataclass, field
+from pathlib import Path
+import h5py
 import oecon.default_mappings as default
 from open_ephys.analysis.recording import Continuous
 from open_ephys.analysis.recording import Recording
 from open_ephys.analysis.recording import ContinuousMetadata
 from dh5io import DH5File
 import dh5io
-from dhspec.cont import create_empty_index_array, create_channel_info
-from dh5io.cont import create_cont_group_from_data_in_file
+from dhspec.cont import create_channel_info
+from dh5io.cont import get_cont_groups_from_file
 import numpy as np
 
+from oecon.decimation import iter_sample_chunks, read_raw_counts
+from oecon.storage import (
+    ChunkLayout,
+    Compression,
+    create_empty_cont_group,
+    create_start_index,
+    data_dataset_options,
+    report_compression,
+)
+
+logger = logging.getLogger(__name__)
+
+# "copy" writes the samples into the DH5 file, "external" links CONT groups to
+# the Open Ephys continuous.dat files
+RAW_STORAGE_MODES = ("copy", "external")
+
+# group of the datasets stored in the Open Ephys files, one per linked stream
+EXTERNAL_RAW_GROUP = "EXTERNAL_RAW"
+
 
 @dataclass
 class RawConfig:
@@ -20,6 +44,10 @@ class RawConfig:
         default_factory=lambda: default.DEFAULT_OE_STREAM_MAPPING.copy()
     )
     included_channel_names: list[str] | None = None  # None for all
+    chunk_size: int = 2**16  # samples per block read from a continuous stream
+    storage: str = "copy"  # "copy" or "external" to link to the Open Ephys files
+    chunk_layout: ChunkLayout | None = None  # HDF5 chunks of copied data, contiguous if None
+    compression: Compression | None = None  # uncompressed if None
 
 
 def _create_cont_group_per_channel(
@@ -29,13 +57,25 @@ def _create_cont_group_per_channel(
     start_cont_id: int,
     first_global_channel_index: int,
     included_channel_names: list[str] | None = None,
+    chunk_size: int = 2**16,
+    storage: str = "copy",
+    chunk_layout: ChunkLayout | None = None,
+    compression: Compression | None = None,
 ):
+    """Write each included channel of a continuous stream to its own CONT group.
+
+    The interleaved samples are read once, in consecutive blocks of
+    `chunk_size` samples, and the columns of every block are scattered to the
+    CONT groups of their channels. With `storage="external"`, the CONT groups
+    are linked to the Open Ephys file instead.
+    """
     global_channel_index = first_global_channel_index
 
-    index = create_empty_index_array(1)
-    index[0]["time"] = np.int64(oe_continuous.timestamps[0] * 1e9)
-    index[0]["offset"] = 0
+    index = create_start_index(oe_continuous)
 
+    n_samples = oe_continuous.samples.shape[0]
+    channel_indices: list[int] = []
+    cont_groups: list[h5py.Group] = []
     assert metadata.channel_names is not None, "Channel names are not set in OE data."
     for channel_index, name in enumerate(metadata.channel_names):
         if included_channel_names is not None and name not in included_channel_names:
@@ -52,68 +92,236 @@ def _create_cont_group_per_channel(
             AmplifChan0=0,
         )
 
-        data = oe_continuous.samples[:, channel_index : channel_index + 1]
-
-        create_cont_group_from_data_in_file(
+        cont_group = create_empty_cont_group(
             file=dh5file._file,
             cont_group_id=dh5_cont_id,
-            data=data,
-            index=index,
+            n_samples=n_samples,
+            n_channels=1,
             sample_period_ns=np.int32(1.0 / metadata.sample_rate * 1e9),
+            chunk_layout=chunk_layout,
+            compression=compression if storage == "copy" else None,
             name=name,
             channels=channel_info,
             calibration=np.array(metadata.bit_volts[channel_index]),
         )
+        cont_group["INDEX"][:] = index
+        channel_indices.append(channel_index)
+        cont_groups.append(cont_group)
 
         global_channel_index += 1
 
+    if not channel_indices:
+        return
+    if storage == "external":
+        source = _create_external_source(dh5file, oe_continuous, metadata)
+        for cont_group, channel_index in zip(cont_groups, channel_indices):
+            _link_data_to_source(cont_group, source, [channel_index])
+        return
+
+    datasets = [cont_group["DATA"] for cont_group in cont_groups]
+    encode_s = np.zeros(len(datasets))
+    for start, stop in iter_sample_chunks(n_samples, chunk_size):
+        block = read_raw_counts(
+            oe_continuous, start, stop, channel_indices, dtype=np.int16
+        )
+        # channel-major, so that every channel is written from contiguous memory
+        channel_blocks = np.ascontiguousarray(block.T)
+        for i_channel, (dataset, channel_block) in enumerate(
+            zip(datasets, channel_blocks)
+        ):
+            write_start = time.perf_counter()
+            dataset[start:stop, 0] = channel_block
+            encode_s[i_channel] += time.perf_counter() - write_start
+    for cont_group, cont_group_encode_s in zip(cont_groups, encode_s):
+        report_compression(cont_group, cont_group_encode_s)
+
 
 def _create_cont_group_per_continuous_stream(
     oe_continuous: Continuous,
     dh5file: dh5io.DH5File,
     metadata: ContinuousMetadata,
     start_cont_id: int,
-    last_global_channel_index: int = 0,
+    first_global_channel_index: int = 0,
     included_channel_names: list[str] | None = None,
+    chunk_size: int = 2**16,
+    storage: str = "copy",
+    chunk_layout: ChunkLayout | None = None,
+    compression: Compression | None = None,
 ):
-    raise NotImplementedError("Grouping channels into CONT blocks is not yet supported")
-
-    # create a CONT group for the entire continuous stream
-    dh5_cont_id = start_cont_id
-
-    # TODO: This should be an array of channel info objects, one for each channel
-    # but for now, we just create one channel info object for the entire stream
-    channel_info = dh5io.cont.create_channel_info(
-        GlobalChanNumber=last_global_channel_index,
-        BoardChanNo=0,
-        ADCBitWidth=16,
-        MaxVoltageRange=10.0,
-        MinVoltageRange=10.0,
-        AmplifChan0=0,
+    """Write the included channels of a continuous stream to a single CONT group.
+
+    The CONT group is named after the stream, since a source node can record
+    several streams. Its ID `start_cont_id` is that of the first channel of the
+    stream in per-channel mode, so streams of the same range do not collide.
+    The samples are copied in chunks of `chunk_size` samples, so the stream is
+    never loaded into memory as a whole. With `storage="external"`, the CONT
+    group is linked to the Open Ephys file instead.
+    """
+    assert metadata.channel_names is not None, "Channel names are not set in OE data."
+    channel_indices = [
+        channel_index
+        for channel_index, name in enumerate(metadata.channel_names)
+        if included_channel_names is None or name in included_channel_names
+    ]
+    if not channel_indices:
+        return
+
+    # one channel info entry per channel
+    channel_info = np.concatenate(
+        [
+            np.atleast_1d(
+                create_channel_info(
+                    GlobalChanNumber=first_global_channel_index + i_channel,
+                    BoardChanNo=channel_index,
+                    ADCBitWidth=16,
+                    MaxVoltageRange=10.0,
+                    MinVoltageRange=10.0,
+                    AmplifChan0=0,
+                )
+            )
+            for i_channel, channel_index in enumerate(channel_indices)
+        ]
     )
 
-    # TODO: add streaming data if too large for memory
-    data = oe_continuous.samples
-    index = dh5io.cont.create_empty_index_array(1)
+    index = create_start_index(oe_continuous)
 
-    dh5io.cont.create_cont_group_from_data_in_file(
-        file=dh5file,
-        cont_group_id=dh5_cont_id,
-        data=data,
-        index=index,
+    n_samples = oe_continuous.samples.shape[0]
+    cont_group = create_empty_cont_group(
+        file=dh5file._file,
+        cont_group_id=start_cont_id,
+        n_samples=n_samples,
+        n_channels=len(channel_indices),
         sample_period_ns=np.int32(1.0 / metadata.sample_rate * 1e9),
-        name=metadata.source_node_name,
+        chunk_layout=chunk_layout,
+        compression=compression if storage == "copy" else None,
+        calibration=np.array(metadata.bit_volts, dtype=np.float64)[channel_indices],
         channels=channel_info,
-        calibration=metadata.bit_volts,
+        name=metadata.stream_name,
+    )
+    cont_group["INDEX"][:] = index
+    if storage == "external":
+        source = _create_external_source(dh5file, oe_continuous, metadata)
+        _link_data_to_source(cont_group, source, channel_indices)
+        return
+
+    data = cont_group["DATA"]
+    encode_s = 0.0
+    for start, stop in iter_sample_chunks(n_samples, chunk_size):
+        block = read_raw_counts(
+            oe_continuous, start, stop, channel_indices, dtype=np.int16
+        )
+        write_start = time.perf_counter()
+        data[start:stop] = block
+        encode_s += time.perf_counter() - write_start
+    report_compression(cont_group, encode_s)
+
+
+def _external_file_location(samples: np.ndarray) -> tuple[str, int]:
+    """Path and byte offset of samples memory-mapped from an int16 binary file."""
+    if (
+        not isinstance(samples, np.memmap)
+        or samples.filename is None
+        or samples.dtype != np.dtype("<i2")
+        or not samples.flags.c_contiguous
+    ):
+        raise ValueError(
+            "External raw storage requires samples memory-mapped from an Open Ephys binary continuous.dat file"
+        )
+    # views of a memmap keep the offset of the mapped file region
+    root = samples
+    while isinstance(root.base, np.memmap):
+        root = root.base
+    offset = root.offset + (samples.ctypes.data - root.ctypes.data)
+    return os.path.abspath(samples.filename), offset
+
+
+def _create_external_source(
+    dh5file: dh5io.DH5File, oe_continuous: Continuous, metadata: ContinuousMetadata
+) -> h5py.Dataset:
+    """Dataset of all samples of a stream, stored in its Open Ephys file."""
+    samples = oe_continuous.samples
+    filename, offset = _external_file_location(samples)
+    group = dh5file._file.require_group(EXTERNAL_RAW_GROUP)
+    return group.create_dataset(
+        f"{metadata.source_node_id}_{metadata.stream_name}",
+        shape=samples.shape,
+        dtype="<i2",
+        external=[(filename, offset, samples.nbytes)],
     )
 
 
+def _link_data_to_source(
+    cont_group: h5py.Group, source: h5py.Dataset, channel_indices: list[int]
+) -> None:
+    """Replace the DATA of `cont_group` by a virtual dataset of source columns."""
+    n_samples = source.shape[0]
+    layout = h5py.VirtualLayout(shape=(n_samples, len(channel_indices)), dtype="<i2")
+    # "." refers to the DH5 file itself, so the file can be moved
+    virtual_source = h5py.VirtualSource(
+        ".", source.name, shape=source.shape, dtype=source.dtype
+    )
+    for column, channel_index in enumerate(channel_indices):
+        layout[:, column] = virtual_source[:, channel_index]
+    del cont_group["DATA"]
+    cont_group.create_virtual_dataset("DATA", layout)
+
+
+def is_linked_to_external_raw_data(file: h5py.File) -> bool:
+    return EXTERNAL_RAW_GROUP in file
+
+
+def materialize_external_raw_data(
+    file: h5py.File,
+    chunk_size: int = 2**16,
+    chunk_layout: ChunkLayout | None = None,
+    compression: Compression | None = None,
+) -> None:
+    """Copy the samples of CONT groups linked to Open Ephys files into `file`.
+
+    Afterwards the file no longer depends on the Open Ephys files. DATA is
+    stored like copied raw data, see `create_empty_cont_group`, so pass the
+    `chunk_layout` and `compression` of the `RawConfig` of the conversion.
+    """
+    if not is_linked_to_external_raw_data(file):
+        return
+    for source in file[EXTERNAL_RAW_GROUP].values():
+        for filename, _, _ in source.external:
+            if not Path(filename).exists():
+                raise FileNotFoundError(f"Linked raw data file not found: {filename}")
+
+    for cont_group in get_cont_groups_from_file(file):
+        data = cont_group["DATA"]
+        if not data.is_virtual:
+            continue
+        logger.info(f"Materializing {cont_group.name} ({data.shape[1]} channels)")
+        options = data_dataset_options(
+            data.shape, cont_group.attrs["SamplePeriod"], chunk_layout, compression
+        )
+        materialized = cont_group.create_dataset(
+            "DATA_materialized", shape=data.shape, dtype=data.dtype, **options
+        )
+        encode_s = 0.0
+        for start, stop in iter_sample_chunks(data.shape[0], chunk_size):
+            block = data[start:stop]
+            write_start = time.perf_counter()
+            materialized[start:stop] = block
+            encode_s += time.perf_counter() - write_start
+        del cont_group["DATA"]
+        cont_group.move("DATA_materialized", "DATA")
+        report_compression(cont_group, encode_s)
+    del file[EXTERNAL_RAW_GROUP]
+
+
 def process_oe_raw_data(
     config: RawConfig, recording: Recording, dh5file: DH5File
 ) -> RawConfig:
     assert recording.continuous is not None, (
         "No continuous data found in the recording."
     )
+    if config.storage not in RAW_STORAGE_MODES:
+        raise ValueError(
+            f"Invalid raw storage '{config.storage}', expected one of {list(RAW_STORAGE_MODES)}"
+        )
 
     # continuous raw data
     global_channel_index = 0
@@ -144,6 +352,10 @@ def process_oe_raw_data(
                 start_cont_id=start_cont_id,
                 first_global_channel_index=global_channel_index,
                 included_channel_names=config.included_channel_names,
+                chunk_size=config.chunk_size,
+                storage=config.storage,
+                chunk_layout=config.chunk_layout,
+                compression=config.compression,
             )
             global_channel_index += nChannels
         else:
@@ -152,8 +364,14 @@ def process_oe_raw_data(
                 dh5file=dh5file,
                 metadata=metadata,
                 start_cont_id=start_cont_id,
+                first_global_channel_index=global_channel_index,
                 included_channel_names=config.included_channel_names,
+                chunk_size=config.chunk_size,
+                storage=config.storage,
+                chunk_layout=config.chunk_layout,
+                compression=config.compression,
             )
+            global_channel_index += nChannels
 
     # update included channesl in config
     config.included_channel_names = included_channel_names
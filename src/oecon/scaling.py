@@ -1,16 +1,172 @@
+from collections.abc import Callable, Iterable
+from typing import Protocol
+
 import numpy as np
 
 
-def scale_to_16_bit_range(
-    data: np.ndarray, scale_abs_max_to: int = 32765
-) -> tuple[np.ndarray, float]:
+class SampleWriter(Protocol):
+    """Destination of int16 samples, e.g. an array or an HDF5 dataset."""
+
+    def __setitem__(self, index: slice, block: np.ndarray) -> None: ...
+
+
+def _check_scale_abs_max_to(scale_abs_max_to: int) -> None:
     if scale_abs_max_to <= 0 or scale_abs_max_to > 2**16 / 2:
         raise ValueError(
             f"Integer value to be used for scaling the maximum data value to must be within the 16-bit range (0-{2**16 / 2})"
         )
 
-    max_abs_value_in_data = np.max(np.abs(data))
-    factor: float = scale_abs_max_to / max_abs_value_in_data
+
+def scale_to_16_bit_range(
+    data: np.ndarray, scale_abs_max_to: int = 32765, axis: int | None = None
+) -> tuple[np.ndarray, float | np.ndarray]:
+    """Scale `data` so that its maximum absolute value becomes `scale_abs_max_to`.
+
+    With `axis`, every slice along the other axes gets its own factor, e.g.
+    each channel of a samples x channels block with `axis=0`, and the
+    calibration is returned as an array without `axis`. Data without signal
+    is not scaled.
+
+    Returns the int16 data and the calibration (data units per bit).
+    """
+    _check_scale_abs_max_to(scale_abs_max_to)
+
+    max_abs_value_in_data = np.max(
+        np.abs(data), axis=axis, keepdims=axis is not None
+    )
+    max_abs_value_in_data = np.where(
+        max_abs_value_in_data > 0, max_abs_value_in_data, scale_abs_max_to
+    )
+    factor = scale_abs_max_to / max_abs_value_in_data
 
     scaled_data = (data * factor).astype(np.int16)
-    return scaled_data, 1 / factor
+    if axis is None:
+        return scaled_data, float(1 / factor)
+    return scaled_data, np.squeeze(1 / factor, axis=axis)
+
+
+INT16_MIN = np.iinfo(np.int16).min
+INT16_MAX = np.iinfo(np.int16).max
+
+
+def quantize_to_int16(
+    data: np.ndarray, out: np.ndarray | None = None, chunk_size: int = 2**16
+) -> tuple[np.ndarray, np.ndarray]:
+    """Convert `data` (samples x channels) to int16, clipping to the int16 range.
+
+    `data` is clipped in place, `chunk_size` samples at a time, so only the
+    int16 result (or `out`) is allocated. Values are truncated towards zero
+    like with `astype(np.int16)`.
+
+    Returns the int16 samples and the number of clipped samples per channel.
+    """
+    if out is None:
+        out = np.empty(data.shape, dtype=np.int16)
+    n_saturated = np.zeros(data.shape[1:], dtype=np.int64)
+    for start in range(0, data.shape[0], chunk_size):
+        chunk = data[start : start + chunk_size]
+        # values in (INT16_MAX, INT16_MAX + 1) are not clipped by truncation
+        n_saturated += np.count_nonzero(
+            (chunk <= INT16_MIN - 1) | (chunk >= INT16_MAX + 1), axis=0
+        )
+        np.clip(chunk, INT16_MIN, INT16_MAX, out=chunk)
+        out[start : start + chunk_size] = chunk
+    return out, n_saturated
+
+
+class AbsAmplitudeSketch:
+    """Running statistics of |x| per channel for scaling data read in chunks.
+
+    Keeps the maximum of |x| and, if `quantile` is given, a histogram of
+    log2(|x|) with `bins_per_octave` bins per factor of two. The quantile is
+    estimated by the upper edge of its bin, i.e. it is overestimated by less
+    than 2**(1 / bins_per_octave) - 1 (1.1 % by default).
+    """
+
+    def __init__(
+        self,
+        n_channels: int,
+        quantile: float | None = None,
+        bins_per_octave: int = 64,
+        min_exponent: int = -32,
+        max_exponent: int = 64,
+    ):
+        if quantile is not None and not 0 < quantile <= 1:
+            raise ValueError(f"Quantile must be within (0, 1], got {quantile}")
+        self.quantile = quantile
+        self.bins_per_octave = bins_per_octave
+        self.min_exponent = min_exponent
+        self.abs_max = np.zeros(n_channels)
+        # first bin collects all values below 2**min_exponent, including zeros
+        self.n_bins = (max_exponent - min_exponent) * bins_per_octave + 1
+        self.counts = (
+            np.zeros((n_channels, self.n_bins), dtype=np.int64)
+            if quantile is not None
+            else None
+        )
+
+    def update(self, chunk: np.ndarray) -> None:
+        """Add a chunk of samples x channels."""
+        abs_chunk = np.abs(chunk)
+        np.maximum(self.abs_max, np.max(abs_chunk, axis=0, initial=0), out=self.abs_max)
+        if self.counts is None:
+            return
+
+        with np.errstate(divide="ignore"):
+            log_bins = (np.log2(abs_chunk) - self.min_exponent) * self.bins_per_octave
+        bins = np.clip(np.floor(log_bins) + 1, 0, self.n_bins - 1).astype(np.int64)
+        # one bincount for all channels
+        bins += np.arange(self.counts.shape[0]) * self.n_bins
+        self.counts += np.bincount(bins.ravel(), minlength=self.counts.size).reshape(
+            self.counts.shape
+        )
+
+    def amplitude(self) -> np.ndarray:
+        """The maximum or quantile of |x| per channel."""
+        if self.counts is None or self.quantile is None:
+            return self.abs_max.copy()
+        cumulative_counts = np.cumsum(self.counts, axis=1)
+        n_required = np.ceil(self.quantile * cumulative_counts[:, -1:])
+        bins = np.argmax(cumulative_counts >= n_required, axis=1)
+        upper_edges = 2.0 ** (self.min_exponent + bins / self.bins_per_octave)
+        return np.minimum(upper_edges, self.abs_max)
+
+
+def scale_chunks_to_16_bit_range(
+    read_chunks: Callable[[], Iterable[np.ndarray]],
+    out: SampleWriter,
+    scale_abs_max_to: int = 32765,
+    quantile: float | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Scale a signal read in chunks (samples x channels) to the int16 range.
+
+    `read_chunks` is called twice: the first pass determines the maximum (or
+    `quantile`) of |x| per channel, the second writes the scaled int16 chunks
+    to `out`, e.g. an HDF5 dataset. Only one chunk is held in memory. Values
+    above a quantile are clipped.
+
+    Returns the calibration (data units per bit) and the number of clipped
+    samples per channel.
+    """
+    _check_scale_abs_max_to(scale_abs_max_to)
+
+    sketch = None
+    for chunk in read_chunks():
+        if sketch is None:
+            sketch = AbsAmplitudeSketch(chunk.shape[1], quantile)
+        sketch.update(chunk)
+    if sketch is None:
+        raise ValueError("No data to scale")
+
+    amplitude = sketch.amplitude()
+    # channels without signal are not scaled
+    factors = scale_abs_max_to / np.where(amplitude > 0, amplitude, scale_abs_max_to)
+
+    n_saturated = np.zeros(factors.shape, dtype=np.int64)
+    offset = 0
+    for chunk in read_chunks():
+        quantized, n_saturated_in_chunk = quantize_to_int16(chunk * factors)
+        n_saturated += n_saturated_in_chunk
+        out[offset : offset + quantized.shape[0]] = quantized
+        offset += quantized.shape[0]
+    return 1 / factors, n_saturated
@@ -0,0 +1,257 @@
+import logging
+import math
+import time
+import warnings
+from dataclasses import dataclass
+
+import dh5io.cont
+import h5py
+import numpy as np
+from dh5io.errors import DH5Warning
+from dhspec.cont import create_empty_index_array
+from open_ephys.analysis.recording import Continuous
+
+import oecon.default_mappings as default
+
+logger = logging.getLogger(__name__)
+
+CHUNK_LAYOUT_POLICIES = ("fixed", "time_window", "auto")
+
+# bytes per int16 sample
+SAMPLE_SIZE = np.dtype(np.int16).itemsize
+
+
+@dataclass
+class ChunkLayout:
+    """Chunk shape of the DATA datasets of CONT groups.
+
+    "fixed" uses `chunk_samples` x `chunk_channels`, "time_window" chunks of
+    `window_s` seconds, and "auto" chunks that cover reads of
+    `expected_read_s` seconds within `max_chunk_bytes` (h5py's guess if
+    `expected_read_s` is None). Chunks span all channels unless
+    `chunk_channels` is set.
+    """
+
+    policy: str = "auto"  # "fixed", "time_window" or "auto"
+    chunk_samples: int | None = None  # "fixed": samples per chunk
+    chunk_channels: int | None = None  # channels per chunk, all if None
+    window_s: float | None = None  # "time_window": seconds per chunk
+    expected_read_s: float | None = None  # "auto": typical duration of a read
+    max_chunk_bytes: int = 2**20  # "auto": upper limit of the chunk size
+
+    def chunk_shape(
+        self, shape: tuple[int, int], sample_rate: float
+    ) -> tuple[int, int] | bool | None:
+        """Chunk shape for a dataset of `shape` (samples x channels).
+
+        True lets h5py guess the chunk shape, None stores the dataset contiguously.
+        """
+        n_samples, n_channels = shape
+        if n_samples == 0 or n_channels == 0:
+            return None
+        chunk_channels = min(self.chunk_channels or n_channels, n_channels)
+
+        match self.policy:
+            case "fixed":
+                if self.chunk_samples is None:
+                    raise ValueError("Fixed chunk layout requires chunk_samples")
+                chunk_samples = self.chunk_samples
+            case "time_window":
+                if self.window_s is None:
+                    raise ValueError("Time window chunk layout requires window_s")
+                chunk_samples = math.ceil(self.window_s * sample_rate)
+            case "auto":
+                if self.expected_read_s is None:
+                    return True
+                chunk_samples = min(
+                    math.ceil(self.expected_read_s * sample_rate),
+                    self.max_chunk_bytes // (SAMPLE_SIZE * chunk_channels),
+                )
+            case _:
+                raise ValueError(
+                    f"Invalid chunk layout policy '{self.policy}', expected one of {list(CHUNK_LAYOUT_POLICIES)}"
+                )
+        return (max(min(chunk_samples, n_samples), 1), chunk_channels)
+
+
+# codecs built into HDF5/h5py, all others require hdf5plugin
+BUILTIN_CODECS = ("gzip", "lzf")
+PLUGIN_CODECS = ("zstd", "lz4", "blosc2", "bitshuffle")
+
+
+@dataclass
+class Compression:
+    """Lossless compression of the DATA datasets of CONT groups."""
+
+    codec: str = "gzip"  # "gzip" (deflate), "lzf" or with hdf5plugin "zstd", "lz4", "blosc2", "bitshuffle"
+    level: int | None = None  # codec default if None
+    shuffle: bool = True  # byte shuffle before compression
+
+    def dataset_options(self) -> dict:
+        """Keyword arguments of `h5py.Group.create_dataset`."""
+        match self.codec:
+            case "gzip":
+                options = {"compression": "gzip", "compression_opts": self.level or 4}
+            case "lzf":
+                options = {"compression": "lzf"}
+            case codec if codec in PLUGIN_CODECS:
+                options = dict(self._plugin_filter())
+            case _:
+                raise ValueError(
+                    f"Invalid compression codec '{self.codec}', expected one of {list(BUILTIN_CODECS + PLUGIN_CODECS)}"
+                )
+        # blosc2 and bitshuffle shuffle themselves
+        options["shuffle"] = self.shuffle and self.codec not in ("blosc2", "bitshuffle")
+        return options
+
+    def _plugin_filter(self):
+        try:
+            import hdf5plugin
+        except ImportError as e:
+            raise ImportError(
+                f"Compression codec '{self.codec}' requires the hdf5plugin package"
+            ) from e
+        match self.codec:
+            case "zstd":
+                return hdf5plugin.Zstd(clevel=self.level or 3)
+            case "lz4":
+                return hdf5plugin.LZ4()
+            case "blosc2":
+                return hdf5plugin.Blosc2(
+                    cname="zstd",
+                    clevel=self.level or 5,
+                    filters=hdf5plugin.Blosc2.SHUFFLE
+                    if self.shuffle
+                    else hdf5plugin.Blosc2.NOFILTER,
+                )
+            case "bitshuffle":
+                return hdf5plugin.Bitshuffle(cname="lz4")
+
+
+# RAW (all CONT groups of the raw stage): fast lossless,
+# downsampled signals: better ratio at lower data rates
+DEFAULT_COMPRESSION_POLICY: dict[default.ContGroups, Compression] = {
+    default.ContGroups.RAW: Compression("lzf"),
+    default.ContGroups.LFP: Compression("gzip", level=4),
+    default.ContGroups.ESA: Compression("gzip", level=4),
+}
+
+
+def create_start_index(oe_cont: Continuous) -> np.ndarray:
+    """INDEX of a CONT group with a single region starting at the first sample."""
+    index = create_empty_index_array(1)
+    # timestamps are set by the format-specific subclasses of Continuous
+    index[0]["time"] = np.int64(oe_cont.timestamps[0] * 1e9)  # type: ignore[attr-defined]
+    index[0]["offset"] = 0
+    return index
+
+
+def report_compression(cont_group: h5py.Group, encode_s: float) -> None:
+    """Log the compression ratio of the DATA of `cont_group` and its write time."""
+    data = cont_group["DATA"]
+    if data.compression is None:
+        return
+    stored_bytes = data.id.get_storage_size()
+    ratio = data.size * data.dtype.itemsize / stored_bytes if stored_bytes else 0.0
+    logger.info(
+        f"{cont_group.name}: compressed with {data.compression} by {ratio:.2f} "
+        f"({stored_bytes / 2**20:.1f} MiB) in {encode_s:.3f} s"
+    )
+
+
+def create_empty_cont_group(
+    file: h5py.File,
+    cont_group_id: int,
+    n_samples: int,
+    n_channels: int,
+    sample_period_ns: np.int32,
+    chunk_layout: ChunkLayout | None = None,
+    compression: Compression | None = None,
+    **kwargs,
+) -> h5py.Group:
+    """`dh5io.cont.create_empty_cont_group_in_file` with a chunked DATA dataset.
+
+    Without `chunk_layout` and `compression`, DATA is stored contiguously.
+    Compressed data is chunked as guessed by h5py if there is no `chunk_layout`.
+    """
+    cont_group = dh5io.cont.create_empty_cont_group_in_file(
+        file,
+        cont_group_id,
+        nSamples=n_samples,
+        nChannels=n_channels,
+        sample_period_ns=sample_period_ns,
+        **kwargs,
+    )
+    options = data_dataset_options(
+        (n_samples, n_channels), sample_period_ns, chunk_layout, compression
+    )
+    if options:
+        # DATA has not been written yet, so no space was allocated for it
+        del cont_group["DATA"]
+        cont_group.create_dataset(
+            "DATA", shape=(n_samples, n_channels), dtype=np.int16, **options
+        )
+    return cont_group
+
+
+def data_dataset_options(
+    shape: tuple[int, int],
+    sample_period_ns: np.int32,
+    chunk_layout: ChunkLayout | None = None,
+    compression: Compression | None = None,
+) -> dict:
+    """Keyword arguments of `h5py.Group.create_dataset` for a DATA dataset of
+    `shape`, empty for contiguous storage."""
+    options = {}
+    if chunk_layout is not None:
+        chunks = chunk_layout.chunk_shape(shape, sample_rate=1e9 / sample_period_ns)
+        if chunks is not None:
+            options["chunks"] = chunks
+    if compression is not None and shape[0] > 0:
+        options.update(compression.dataset_options())
+    return options
+
+
+def create_cont_group_from_data(
+    file: h5py.File,
+    cont_group_id: int,
+    data: np.ndarray,
+    index: np.ndarray,
+    sample_period_ns: np.int32,
+    chunk_layout: ChunkLayout | None = None,
+    compression: Compression | None = None,
+    **kwargs,
+) -> h5py.Group:
+    """`dh5io.cont.create_cont_group_from_data_in_file` with a chunked and
+    optionally compressed DATA dataset."""
+    if chunk_layout is None and compression is None:
+        return dh5io.cont.create_cont_group_from_data_in_file(
+            file=file,
+            cont_group_id=cont_group_id,
+            data=data,
+            index=index,
+            sample_period_ns=sample_period_ns,
+            **kwargs,
+        )
+
+    cont_group = create_empty_cont_group(
+        file,
+        cont_group_id,
+        n_samples=data.shape[0],
+        n_channels=data.shape[1],
+        sample_period_ns=sample_period_ns,
+        chunk_layout=chunk_layout,
+        compression=compression,
+        n_index_items=index.shape[0],
+        **kwargs,
+    )
+    if not data.dtype == np.int16:
+        warnings.warn(
+            f"Data was converted from {data.dtype} to numpy.int16", category=DH5Warning
+        )
+        data = data.astype(np.int16)
+    start = time.perf_counter()
+    cont_group["DATA"][:] = data
+    report_compression(cont_group, time.perf_counter() - start)
+    cont_group["INDEX"][:] = index
+    return cont_group
@@ -12,7 +12,13 @@ from open_ephys.analysis.recording import Recording
 from open_ephys.analysis.formats.BinaryRecording import BinaryRecording
 from vstim.tdr import TrialOutcome
 
-from oecon.events import EventMetadata, Messages, event_from_eventfolder
+from oecon.events import (
+    EventMetadata,
+    EventSourceIndex,
+    Messages,
+    event_from_eventfolder,
+    get_event_sources,
+)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -184,10 +190,13 @@ def parse_message(
 
 
 def find_message_source(oeinfo: dict) -> EventMetadata | None:
-    for event in oeinfo["events"]:
-        if event["source_processor"] == "Message Center":
-            return EventMetadata(**event)
-    return None
+    """Deprecated, use `get_event_sources(recording).get("Message Center")`."""
+    warnings.warn(
+        "find_message_source is deprecated, use get_event_sources(recording).get(...)",
+        DeprecationWarning,
+        stacklevel=2,
+    )
+    return EventSourceIndex(oeinfo).get("Message Center")
 
 
 def get_messages_from_recording(recording: Recording) -> Messages:
@@ -195,7 +204,7 @@ def get_messages_from_recording(recording: Recording) -> Messages:
         "Recording must be a BinaryRecording to process events."
     )
 
-    message_source = find_message_source(recording.info)
+    message_source = get_event_sources(recording).get("Message Center")
     assert message_source is not None
 
     messages = event_from_eventfolder(
@@ -0,0 +1,168 @@
+"""Mock Open Ephys recordings shared by the test modules."""
+
+from collections.abc import Sequence
+
+import numpy as np
+import pytest
+from open_ephys.analysis.recording import Continuous, ContinuousMetadata, Recording
+
+from oecon.filters import filter_design_cache
+
+
+@pytest.fixture(autouse=True)
+def filter_designs_in_memory(monkeypatch):
+    """Keep the filter designs of the tests out of any cache directory."""
+    monkeypatch.setattr(filter_design_cache, "cache_dir", None)
+
+
+class MockContinuous(Continuous):
+    """Continuous stream storing `samples` (microvolts) as int16 counts, like
+    the Open Ephys formats."""
+
+    def __init__(self, samples, metadata):
+        self.samples = np.round(samples / np.asarray(metadata.bit_volts)).astype(
+            np.int16
+        )
+        self.metadata = metadata
+        self.timestamps = np.arange(samples.shape[0]) / metadata.sample_rate
+
+    def get_samples(
+        self,
+        start_sample_index=0,
+        end_sample_index=-1,
+        selected_channels=None,
+        selected_channel_names=None,
+    ):
+        stop = None if end_sample_index == -1 else end_sample_index
+        samples = self.samples[start_sample_index:stop]
+        channel_indices = list(range(samples.shape[1]))
+        if selected_channel_names and self.metadata.channel_names:
+            # Find the indices of the selected channels
+            channel_indices = [
+                self.metadata.channel_names.index(name)
+                for name in selected_channel_names
+            ]
+        bit_volts = np.asarray(self.metadata.bit_volts)[channel_indices]
+        return samples[:, channel_indices] * bit_volts
+
+
+class MockRecording(Recording):
+    def __init__(self, continuous_data_list):
+        # Don't call super().__init__() to avoid complex initialization
+        self._continuous = continuous_data_list
+        self._events = None
+        self._spikes = None
+
+    @property
+    def continuous(self):
+        return self._continuous
+
+    @continuous.setter
+    def continuous(self, value):
+        self._continuous = value
+
+    @property
+    def events(self):
+        return self._events
+
+    @property
+    def spikes(self):
+        return self._spikes
+
+    # Implement abstract methods from Recording class
+    def load_spikes(self, experiment_id=0, recording_id=0):
+        pass
+
+    def load_events(self, experiment_id=0, recording_id=0):
+        pass
+
+    def load_continuous(self, experiment_id=0, recording_id=0):
+        pass
+
+    def load_messages(self, experiment_id=0, recording_id=0):
+        pass
+
+    @staticmethod
+    def detect_format(directory):
+        return True
+
+    def detect_recordings(self, mmap_timestamps=True):
+        pass
+
+    def read_sync_channel(self, experiment_id=0, recording_id=0):
+        pass
+
+    def read_stream_sync_channel(self, stream_name, experiment_id=0, recording_id=0):
+        pass
+
+    def __str__(self):
+        return None
+
+    def _get_experiments(self):
+        return []
+
+    def _get_recordings(self, experiment_id):
+        return []
+
+    def _get_processors(self, experiment_id, recording_id):
+        return []
+
+    def _get_streams(self, experiment_id, recording_id, processor_id):
+        return []
+
+
+class CountingSamples:
+    """Raw samples that count how many channels and values are read."""
+
+    def __init__(self, samples: np.ndarray):
+        self._samples = samples
+        self.shape = samples.shape
+        self.size = samples.size
+        self.n_read_columns = 0
+        self.n_read_values = 0
+
+    def __getitem__(self, index):
+        block = self._samples[index]
+        self.n_read_columns += block.shape[1]
+        self.n_read_values += block.size
+        return block
+
+
+def create_continuous(
+    samples: np.ndarray,
+    bit_volts: float | Sequence[float] = 0.195,
+    stream_name: str = "test_stream",
+) -> MockContinuous:
+    """Stream of `samples` (microvolts) with channels named CH1, CH2, ..."""
+    n_channels = samples.shape[1]
+    if np.isscalar(bit_volts):
+        bit_volts = [bit_volts] * n_channels
+    metadata = ContinuousMetadata(
+        channel_names=[f"CH{i}" for i in range(1, n_channels + 1)],
+        sample_rate=30000,
+        source_node_name="test_node",
+        source_node_id=100,
+        stream_name=stream_name,
+        num_channels=n_channels,
+        bit_volts=list(bit_volts),
+    )
+    return MockContinuous(samples=samples, metadata=metadata)
+
+
+def create_recording(
+    samples: np.ndarray,
+    bit_volts: float | Sequence[float] = 0.195,
+    stream_name: str = "test_stream",
+) -> MockRecording:
+    """Recording with a single stream, see `create_continuous`."""
+    return MockRecording([create_continuous(samples, bit_volts, stream_name)])
+
+
+def create_spiking_samples(n_samples: int = 60000, n_channels: int = 2) -> np.ndarray:
+    """Slow LFP plus broadband noise with bursts of spiking activity."""
+    rng = np.random.default_rng(42)
+    t = np.arange(n_samples) / 30000
+    lfp = 2000.0 * np.sin(2 * np.pi * 5 * t)
+    bursts = 1.0 + 4.0 * (np.sin(2 * np.pi * 2 * t) > 0.5)
+    noise = rng.normal(scale=30.0, size=(n_samples, n_channels))
+    return lfp[:, None] + noise * bursts[:, None]
@@ -16,7 +16,9 @@ from oecon.config import (
     load_config_from_file,
     VERSION,
 )
-from oecon.mua import ContinuousMuaConfig
+from oecon.events import EventSource
+from oecon.mua import ContinuousMuaConfig, FilterConfigBA, MuaBand
+from oecon.storage import DEFAULT_COMPRESSION_POLICY, Compression
 
 
 def make_sample_config():
@@ -99,3 +101,53 @@ def test_load_config_with_newer_version(tmp_path):
     with pytest.raises(ValueError) as excinfo:
         config_mod.load_config_from_file(config_path)
     assert "newer than supported version" in str(excinfo.value)
+
+
+def test_save_and_load_mua_filter_bank(tmp_path):
+    config = make_sample_config()
+    config.continuous_mua_config = ContinuousMuaConfig(
+        bands=[MuaBand("MUA", 300.0, 3000.0), MuaBand("gamma", 30.0, 80.0, order=2)]
+    )
+    config_path = tmp_path / "test_config_bands.json"
+    save_config_to_file(config_path, config)
+    loaded_config = load_config_from_file(config_path)
+    assert loaded_config.continuous_mua_config == config.continuous_mua_config
+
+
+def test_save_and_load_compression_policy(tmp_path):
+    config = make_sample_config()
+    config.compression_policy = DEFAULT_COMPRESSION_POLICY
+    config.decimation_config.compression = Compression("lzf", shuffle=False)
+    config.raw_config.compression = Compression("gzip", level=1)
+    config_path = tmp_path / "test_config_compression.json"
+    save_config_to_file(config_path, config)
+    loaded_config = load_config_from_file(config_path)
+    assert loaded_config.compression_policy == DEFAULT_COMPRESSION_POLICY
+    assert loaded_config.decimation_config == config.decimation_config
+    assert loaded_config.raw_config.compression == config.raw_config.compression
+
+
+def test_save_and_load_event_sources(tmp_path):
+    config = make_sample_config()
+    config.event_config = EventPreprocessingConfig(
+        sources=[
+            EventSource("NI-DAQmx", "Dev1"),
+            EventSource("NI-DAQmx", "Dev2", code_offset=100),
+            EventSource("Network Events", code_offset=1000),
+        ]
+    )
+    config_path = tmp_path / "test_config_event_sources.json"
+    save_config_to_file(config_path, config)
+    loaded_config = load_config_from_file(config_path)
+    assert loaded_config.event_config.sources == config.event_config.sources
+
+
+def test_save_and_load_mua_filter_coefficients(tmp_path):
+    config = make_sample_config()
+    config.continuous_mua_config = ContinuousMuaConfig(
+        filter_coecfficients_b_a=FilterConfigBA(b=[0.5, -0.5], a=[1.0, -0.2])
+    )
+    config_path = tmp_path / "test_config_filter.json"
+    save_config_to_file(config_path, config)
+    loaded_config = load_config_from_file(config_path)
+    assert loaded_config.continuous_mua_config == config.continuous_mua_config
@@ -5,10 +5,26 @@ import os
 import h5py
 from unittest.mock import Mock, patch
 
-from oecon.decimation import decimate_raw_data, decimate_np_array, DecimationConfig
-from open_ephys.analysis.recording import Recording, Continuous, ContinuousMetadata
+from oecon.decimation import (
+    decimate_raw_data,
+    decimate_np_array,
+    read_raw_counts,
+    design_decimation_fir,
+    polyphase_decimate,
+    plan_decimation_stages,
+    decimation_cost,
+    get_decimation_stages,
+    create_streaming_decimator,
+    DecimationConfig,
+    SATURATED_SAMPLES_ATTRIBUTE,
+    StreamingFirDecimator,
+)
+from open_ephys.analysis.recording import ContinuousMetadata
 from dh5io.create import create_dh_file
 from dh5io.cont import validate_cont_group
+from dhspec.cont import create_empty_index_array
+
+from conftest import MockContinuous, MockRecording, create_continuous, create_recording
 
 
 def create_sinusoid_signal(
@@ -55,91 +71,6 @@ def create_sinusoid_signal(
     return test_samples, t
 
 
-class MockContinuous(Continuous):
-    def __init__(self, samples, metadata):
-        self.samples = samples
-        self.metadata = metadata
-
-    def get_samples(
-        self,
-        start_sample_index=0,
-        end_sample_index=-1,
-        selected_channels=None,
-        selected_channel_names=None,
-    ):
-        if selected_channel_names and self.metadata.channel_names:
-            # Find the index of the selected channel
-            channel_idx = self.metadata.channel_names.index(selected_channel_names[0])
-            # Return samples for that channel (reshape to column vector)
-            return self.samples[:, channel_idx : channel_idx + 1]
-        return self.samples
-
-
-class MockRecording(Recording):
-    def __init__(self, continuous_data_list):
-        # Don't call super().__init__() to avoid complex initialization
-        self._continuous = continuous_data_list
-        self._events = None
-        self._spikes = None
-
-    @property
-    def continuous(self):
-        return self._continuous
-
-    @continuous.setter
-    def continuous(self, value):
-        self._continuous = value
-
-    @property
-    def events(self):
-        return self._events
-
-    @property
-    def spikes(self):
-        return self._spikes
-
-    # Implement abstract methods from Recording class
-    def load_spikes(self, experiment_id=0, recording_id=0):
-        pass
-
-    def load_events(self, experiment_id=0, recording_id=0):
-        pass
-
-    def load_continuous(self, experiment_id=0, recording_id=0):
-        pass
-
-    def load_messages(self, experiment_id=0, recording_id=0):
-        pass
-
-    @staticmethod
-    def detect_format(directory):
-        return True
-
-    def detect_recordings(self, mmap_timestamps=True):
-        pass
-
-    def read_sync_channel(self, experiment_id=0, recording_id=0):
-        pass
-
-    def read_stream_sync_channel(self, stream_name, experiment_id=0, recording_id=0):
-        pass
-
-    def __str__(self):
-        return None
-
-    def _get_experiments(self):
-        return []
-
-    def _get_recordings(self, experiment_id):
-        return []
-
-    def _get_processors(self, experiment_id, recording_id):
-        return []
-
-    def _get_streams(self, experiment_id, recording_id, processor_id):
-        return []
-
-
 class TestDecimateNpArray:
     """Tests for the decimate_np_array function"""
 
@@ -215,6 +146,425 @@ class TestDecimateNpArray:
             assert result.shape[0] == data.shape[0] // 5
 
 
+    @pytest.mark.parametrize(
+        "downsampling_factor, filter_order", [(30, 600), (10, 31), (5, None), (3, 8)]
+    )
+    def test_polyphase_matches_zero_phase_fir(self, downsampling_factor, filter_order):
+        """The polyphase engine agrees with zero-phase FIR decimation"""
+        data, t = create_sinusoid_signal(
+            n_samples=10007, n_channels=2, noise_std=0.3, seed=42
+        )
+
+        expected = decimate_np_array(
+            data=data,
+            downsampling_factor=downsampling_factor,
+            filter_order=filter_order,
+            filter_type="fir",
+            axis=0,
+            zero_phase=True,
+        )
+        result = decimate_np_array(
+            data=data,
+            downsampling_factor=downsampling_factor,
+            filter_order=filter_order,
+            filter_type="polyphase",
+            axis=0,
+            zero_phase=True,
+        )
+
+        assert result.shape == expected.shape
+        np.testing.assert_allclose(result, expected, atol=1e-12)
+
+    def test_polyphase_along_axis_1(self):
+        data, t = create_sinusoid_signal(n_samples=3000, n_channels=3, seed=42)
+        result = polyphase_decimate(
+            data.T, b=design_decimation_fir(10, 100), downsampling_factor=10, axis=1
+        )
+        expected = polyphase_decimate(
+            data, b=design_decimation_fir(10, 100), downsampling_factor=10, axis=0
+        )
+        np.testing.assert_array_equal(result, expected.T)
+
+
+class TestStreamingFirDecimator:
+    """Tests for chunk-wise decimation with StreamingFirDecimator"""
+
+    @pytest.mark.parametrize("zero_phase", [True, False])
+    @pytest.mark.parametrize("chunk_size", [1, 17, 1000, 5000])
+    def test_matches_whole_array_decimation(self, zero_phase, chunk_size):
+        """Concatenated chunk outputs equal decimation of the whole array"""
+        data, t = create_sinusoid_signal(n_samples=4567, n_channels=2, seed=42)
+
+        expected = decimate_np_array(
+            data=data,
+            downsampling_factor=30,
+            filter_order=600,
+            filter_type="fir",
+            axis=0,
+            zero_phase=zero_phase,
+        )
+
+        decimator = StreamingFirDecimator(
+            b=design_decimation_fir(30, 600),
+            downsampling_factor=30,
+            zero_phase=zero_phase,
+        )
+        chunks = [
+            decimator.push(data[start : start + chunk_size])
+            for start in range(0, data.shape[0], chunk_size)
+        ]
+        chunks.append(decimator.flush())
+        result = np.concatenate(chunks, axis=0)
+
+        assert result.shape == expected.shape
+        np.testing.assert_allclose(result, expected, atol=1e-12)
+
+    def test_flush_without_data_raises(self):
+        decimator = StreamingFirDecimator(
+            b=design_decimation_fir(10, 30), downsampling_factor=10, zero_phase=True
+        )
+        with pytest.raises(ValueError):
+            decimator.flush()
+
+
+def test_chunked_decimation_matches_whole_array(tmp_path):
+    """Chunked decimate_raw_data writes the same LFP as whole-array decimation"""
+    # the last sample starts an additional output sample
+    test_samples, t = create_sinusoid_signal(
+        n_samples=30001,
+        n_channels=2,
+        sample_rate=30000,
+        frequencies=(10, 200),
+        amplitudes=(600.0, 500.0),
+        noise_std=20.0,
+        seed=42,
+    )
+    recording = create_recording(test_samples)
+
+    whole_file = create_dh_file(tmp_path / "whole.dh5", overwrite=True, validate=False)
+    decimate_raw_data(DecimationConfig(), recording, whole_file)
+
+    chunked_file = create_dh_file(
+        tmp_path / "chunked.dh5", overwrite=True, validate=False
+    )
+    decimate_raw_data(DecimationConfig(chunk_size=4096), recording, chunked_file)
+
+    for cont_id in (2001, 2002):
+        expected = whole_file.get_cont_group_by_id(cont_id).data[:]
+        result = chunked_file.get_cont_group_by_id(cont_id).data[:]
+        assert result.shape == expected.shape == (1001, 1)
+        # rounding of float results may differ by one bit in very few samples
+        assert np.max(np.abs(result.astype(int) - expected.astype(int))) <= 1
+
+
+@pytest.mark.parametrize("chunk_size", [None, 4096])
+def test_batched_decimation_matches_per_channel(tmp_path, chunk_size):
+    """Decimating all channels of a stream together writes the same CONT blocks"""
+    test_samples = np.random.default_rng(42).normal(scale=100.0, size=(20000, 3))
+    recording = create_recording(test_samples, bit_volts=[0.195, 0.1, 0.195])
+
+    per_channel_file = create_dh_file(
+        tmp_path / "per_channel.dh5", overwrite=True, validate=False
+    )
+    decimate_raw_data(
+        DecimationConfig(chunk_size=chunk_size), recording, per_channel_file
+    )
+
+    batched_file = create_dh_file(tmp_path / "batched.dh5", overwrite=True, validate=False)
+    decimate_raw_data(
+        DecimationConfig(chunk_size=chunk_size, batch_channels=True),
+        recording,
+        batched_file,
+    )
+
+    assert per_channel_file.get_cont_group_ids() == batched_file.get_cont_group_ids()
+    for cont_id in (2001, 2002, 2003):
+        expected = per_channel_file.get_cont_group_by_id(cont_id)
+        result = batched_file.get_cont_group_by_id(cont_id)
+        np.testing.assert_array_equal(result.data[:], expected.data[:])
+        assert result.name == expected.name
+
+
+@pytest.mark.parametrize("chunk_size", [None, 4096])
+@pytest.mark.parametrize("batch_channels", [False, True])
+def test_parallel_decimation_matches_serial(tmp_path, chunk_size, batch_channels):
+    """Decimation with a process pool writes the same CONT blocks as a serial run"""
+    test_samples = np.random.default_rng(42).normal(scale=100.0, size=(20000, 5))
+    recording = create_recording(test_samples)
+
+    serial_file = create_dh_file(tmp_path / "serial.dh5", overwrite=True, validate=False)
+    decimate_raw_data(DecimationConfig(chunk_size=chunk_size), recording, serial_file)
+
+    parallel_file = create_dh_file(
+        tmp_path / "parallel.dh5", overwrite=True, validate=False
+    )
+    decimate_raw_data(
+        DecimationConfig(
+            chunk_size=chunk_size, batch_channels=batch_channels, n_workers=2
+        ),
+        recording,
+        parallel_file,
+    )
+
+    assert serial_file.get_cont_group_ids() == parallel_file.get_cont_group_ids()
+    for cont_id in serial_file.get_cont_group_ids():
+        expected = serial_file.get_cont_group_by_id(cont_id)
+        result = parallel_file.get_cont_group_by_id(cont_id)
+        np.testing.assert_array_equal(result.data[:], expected.data[:])
+        assert result.name == expected.name
+
+
+def test_multistage_plan_is_stored_in_config(tmp_path):
+    test_samples = np.random.default_rng(42).normal(scale=100.0, size=(9000, 1))
+    recording = create_recording(test_samples)
+    dh5file = create_dh_file(tmp_path / "multistage.dh5", overwrite=True, validate=False)
+
+    config = decimate_raw_data(
+        DecimationConfig(multistage=True, chunk_size=2000), recording, dh5file
+    )
+
+    assert config.stage_factors is not None
+    assert np.prod(config.stage_factors) == 30
+    assert config.stage_filter_orders is not None
+    assert len(config.stage_filter_orders) == len(config.stage_factors)
+    assert dh5file.get_cont_group_by_id(2001).data.shape == (300, 1)
+
+
+@pytest.mark.parametrize("chunk_size", [None, 4096])
+@pytest.mark.parametrize("ftype", ["fir", "polyphase"])
+def test_float32_decimation_matches_float64(tmp_path, chunk_size, ftype):
+    """Filtering in single precision changes the int16 LFP by at most one bit"""
+    test_samples, t = create_sinusoid_signal(
+        n_samples=60000,
+        n_channels=2,
+        sample_rate=30000,
+        frequencies=(10, 200),
+        amplitudes=(3000.0, 500.0),
+        noise_std=50.0,
+        seed=42,
+    )
+    recording = create_recording(test_samples)
+
+    files = {}
+    for precision in ("float64", "float32"):
+        files[precision] = create_dh_file(
+            tmp_path / f"{precision}.dh5", overwrite=True, validate=False
+        )
+        decimate_raw_data(
+            DecimationConfig(chunk_size=chunk_size, ftype=ftype, precision=precision),
+            recording,
+            files[precision],
+        )
+
+    for cont_id in (2001, 2002):
+        expected = files["float64"].get_cont_group_by_id(cont_id).data[:].astype(int)
+        result = files["float32"].get_cont_group_by_id(cont_id).data[:].astype(int)
+        assert np.max(np.abs(result - expected)) <= 1
+        assert np.mean(result != expected) < 0.01
+
+
+def test_invalid_precision_raises():
+    with pytest.raises(ValueError, match="precision"):
+        decimate_raw_data(DecimationConfig(precision="float16"), MockRecording([]), Mock())
+
+
+def test_read_raw_counts_matches_scaled_samples():
+    test_samples = np.random.default_rng(42).normal(scale=100.0, size=(1000, 3))
+    bit_volts = np.array([0.195, 0.1, 0.05])
+    continuous = create_continuous(test_samples, bit_volts=bit_volts)
+
+    for channel_indices in ([0, 1, 2], [1, 2], [0, 2]):
+        counts = read_raw_counts(continuous, 10, 900, channel_indices)
+        microvolts = continuous.get_samples(
+            10, 900, selected_channel_names=[f"CH{i + 1}" for i in channel_indices]
+        )
+        assert counts.dtype == np.float64
+        np.testing.assert_allclose(
+            counts * bit_volts[channel_indices], microvolts
+        )
+
+    counts = read_raw_counts(continuous, 0, 100, [1], dtype=np.float32)
+    assert counts.dtype == np.float32
+    assert counts.shape == (100, 1)
+
+
+@pytest.mark.parametrize("chunk_size", [None, 4096])
+def test_decimation_of_raw_counts_matches_microvolts(tmp_path, chunk_size):
+    """Filtering raw counts gives the same LFP as filtering microvolts"""
+    test_samples = np.random.default_rng(42).normal(scale=300.0, size=(20000, 2))
+    bit_volts = np.array([0.195, 0.1])
+    continuous = create_continuous(test_samples, bit_volts=bit_volts)
+    dh5file = create_dh_file(tmp_path / "counts.dh5", overwrite=True, validate=False)
+    decimate_raw_data(
+        DecimationConfig(chunk_size=chunk_size), MockRecording([continuous]), dh5file
+    )
+
+    microvolts = continuous.get_samples()
+    expected = decimate_np_array(microvolts, 30, 600, "fir", axis=0, zero_phase=True)
+    expected = (expected / bit_volts).astype(int)
+    for column, cont_id in enumerate((2001, 2002)):
+        cont_group = dh5file.get_cont_group_by_id(cont_id)
+        result = cont_group.data[:, 0].astype(int)
+        assert np.max(np.abs(result - expected[:, column])) <= 1
+        assert cont_group.calibration == pytest.approx(bit_volts[column])
+
+
+@pytest.mark.parametrize("chunk_size", [None, 4096])
+def test_saturated_samples_are_clipped_and_counted(tmp_path, chunk_size):
+    """Overshoot of a full-scale square wave is clipped instead of wrapped"""
+    n_samples = 30000
+    full_scale = np.where(np.arange(n_samples) % 6000 < 3000, 32700, -32700)
+    bit_volts = 0.195
+    test_samples = np.column_stack([full_scale * bit_volts, full_scale * bit_volts / 4])
+    recording = create_recording(test_samples, bit_volts=bit_volts)
+    dh5file = create_dh_file(tmp_path / "saturated.dh5", overwrite=True, validate=False)
+
+    decimate_raw_data(DecimationConfig(chunk_size=chunk_size), recording, dh5file)
+
+    counts = recording.continuous[0].samples[:, :1].astype(np.float64)
+    expected = decimate_np_array(counts, 30, 600, "fir", axis=0, zero_phase=True)
+    expected_n_saturated = np.count_nonzero((expected < -32768) | (expected >= 32768))
+    assert expected_n_saturated > 0
+
+    saturated = dh5file._file["CONT2001"]
+    np.testing.assert_array_equal(
+        saturated.attrs[SATURATED_SAMPLES_ATTRIBUTE], [expected_n_saturated]
+    )
+    np.testing.assert_array_equal(
+        saturated["DATA"][:], np.clip(expected, -32768, 32767).astype(np.int16)
+    )
+    np.testing.assert_array_equal(
+        dh5file._file["CONT2002"].attrs[SATURATED_SAMPLES_ATTRIBUTE], [0]
+    )
+
+
+@pytest.mark.parametrize("batch_channels", [False, True])
+@pytest.mark.parametrize("scale_quantile", [None, 0.999])
+def test_chunked_scaling_matches_whole_array(tmp_path, scale_quantile, batch_channels):
+    """scale_max_abs_to scales each channel to the int16 range, also chunked"""
+    test_samples = np.random.default_rng(42).normal(
+        scale=[100.0, 1000.0], size=(30000, 2)
+    )
+    recording = create_recording(test_samples, bit_volts=[0.195, 0.1])
+
+    files = {}
+    for chunk_size in (None, 2048):
+        files[chunk_size] = create_dh_file(
+            tmp_path / f"scaled_{chunk_size}.dh5", overwrite=True, validate=False
+        )
+        decimate_raw_data(
+            DecimationConfig(
+                chunk_size=chunk_size,
+                scale_max_abs_to=30000,
+                scale_quantile=scale_quantile,
+                batch_channels=batch_channels,
+            ),
+            recording,
+            files[chunk_size],
+        )
+
+    for cont_id in (2001, 2002):
+        expected = files[None].get_cont_group_by_id(cont_id)
+        result = files[2048].get_cont_group_by_id(cont_id)
+        assert np.max(np.abs(expected.data[:].astype(int))) >= 29000
+        assert np.max(np.abs(result.data[:].astype(int))) >= 29000
+        assert result.data.shape == expected.data.shape
+        assert result.calibration == pytest.approx(expected.calibration, rel=1e-6)
+        np.testing.assert_allclose(
+            result.calibrated_data[:], expected.calibrated_data[:], atol=0.1
+        )
+
+
+def test_chunked_decimation_requires_fir():
+    recording = MockRecording([])
+    with pytest.raises(ValueError, match="ftype='fir'"):
+        decimate_raw_data(
+            DecimationConfig(chunk_size=1000, ftype="iir"), recording, Mock()
+        )
+
+
+class TestMultistageDecimation:
+    """Tests for cascaded decimation stages"""
+
+    def test_plan_reduces_cost(self):
+        stages = plan_decimation_stages(downsampling_factor=30, filter_order=600)
+
+        assert len(stages) > 1
+        assert np.prod([stage.factor for stage in stages]) == 30
+        assert decimation_cost(stages) < 601 / 2
+        assert all(stage.filter_order % 2 == 0 for stage in stages)
+
+    def test_plan_keeps_single_stage_for_prime_factor(self):
+        stages = plan_decimation_stages(downsampling_factor=7, filter_order=100)
+        assert [(stage.factor, stage.filter_order) for stage in stages] == [(7, 100)]
+
+    def test_plan_with_given_factors(self):
+        stages = plan_decimation_stages(30, 600, stage_factors=[2, 3, 5])
+        assert [stage.factor for stage in stages] == [2, 3, 5]
+
+        with pytest.raises(ValueError):
+            plan_decimation_stages(30, 600, stage_factors=[2, 3])
+
+    def test_multistage_matches_single_stage_in_passband(self):
+        """Both variants keep the LFP band and suppress frequencies above it"""
+        data, t = create_sinusoid_signal(
+            n_samples=60000,
+            n_channels=1,
+            frequencies=(10, 200),
+            amplitudes=(1.0, 0.5),
+            noise_std=0.0,
+        )
+        stopband_data, t = create_sinusoid_signal(
+            n_samples=60000,
+            n_channels=1,
+            frequencies=(2000, 7000),
+            amplitudes=(1.0, 1.0),
+            noise_std=0.0,
+        )
+        stages = plan_decimation_stages(30, 600)
+
+        kwargs = dict(
+            downsampling_factor=30,
+            filter_order=600,
+            filter_type="fir",
+            axis=0,
+            zero_phase=True,
+        )
+        single = decimate_np_array(data=data, **kwargs)
+        multi = decimate_np_array(data=data, stages=stages, **kwargs)
+        assert multi.shape == single.shape
+        # ignore edge effects
+        np.testing.assert_allclose(multi[50:-50], single[50:-50], atol=2e-3)
+
+        suppressed = decimate_np_array(data=stopband_data, stages=stages, **kwargs)
+        assert np.max(np.abs(suppressed[50:-50])) < 1e-2
+
+    def test_streaming_cascade_matches_whole_array(self):
+        data, t = create_sinusoid_signal(n_samples=12345, n_channels=2, seed=42)
+        config = DecimationConfig(multistage=True)
+
+        expected = decimate_np_array(
+            data=data,
+            downsampling_factor=30,
+            filter_order=600,
+            filter_type="fir",
+            axis=0,
+            zero_phase=True,
+            stages=get_decimation_stages(config),
+        )
+
+        decimator = create_streaming_decimator(config)
+        chunks = [
+            decimator.push(data[start : start + 1000])
+            for start in range(0, data.shape[0], 1000)
+        ]
+        chunks.append(decimator.flush())
+        result = np.concatenate(chunks, axis=0)
+
+        assert result.shape == expected.shape
+        np.testing.assert_allclose(result, expected, atol=1e-12)
+
+
 def test_decimation_config_with_real_dh5file(plt):
     """Test DecimationConfig integration with a real temporary DH5File"""
     # Create a temporary file for the DH5 file
@@ -318,7 +668,7 @@ class TestDecimateRawDataIntegration:
         """Test basic functionality of decimate_raw_data"""
         # Setup mocks
         mock_version.return_value = "1.0.0"
-        mock_index_array.return_value = np.array([0])
+        mock_index_array.side_effect = create_empty_index_array
         mock_channel_info.return_value = {"test": "channel_info"}
 
         # Create test data with two sinusoids and noise
@@ -387,7 +737,7 @@ class TestDecimateRawDataIntegration:
         """Test decimate_raw_data with specific channel selection"""
         # Setup mocks
         mock_version.return_value = "1.0.0"
-        mock_index_array.return_value = np.array([0])
+        mock_index_array.side_effect = create_empty_index_array
         mock_channel_info.return_value = {"test": "channel_info"}
 
         # Create test data with two sinusoids and noise
@@ -467,7 +817,7 @@ class TestDecimateRawDataIntegration:
         """Test decimate_raw_data with multiple continuous streams"""
         # Setup mocks
         mock_version.return_value = "1.0.0"
-        mock_index_array.return_value = np.array([0])
+        mock_index_array.side_effect = create_empty_index_array
         mock_channel_info.return_value = {"test": "channel_info"}
 
         # Create test data for two streams with sinusoids and noise
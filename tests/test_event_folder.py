@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from oecon.events import Event, EventMetadata, Messages
+
+
+def event_metadata() -> EventMetadata:
+    return EventMetadata(
+        channel_name="",
+        folder_name="test_folder",
+        identifier="",
+        sample_rate=1000.0,
+        stream_name="PXIe-6341",
+        type="",
+        description="",
+        source_processor="PXIe-6341",
+    )
+
+
+def write_event_folder(folder, **columns):
+    folder.mkdir()
+    for name, values in columns.items():
+        np.save(folder / f"{name}.npy", values)
+    return folder
+
+
+@pytest.mark.parametrize("mmap_mode", ["r", None])
+def test_event_from_folder(tmp_path, mmap_mode):
+    columns = dict(
+        full_words=np.array([1, 3, 4], dtype=np.uint64),
+        timestamps=np.array([0.5, 1.0, 1.5]),
+        states=np.array([1, 2, -1], dtype=np.int16),
+        sample_numbers=np.array([10, 20, 30], dtype=np.int64),
+    )
+    folder = write_event_folder(tmp_path / "TTL", **columns)
+
+    event = Event.from_folder(folder, event_metadata(), mmap_mode=mmap_mode)
+
+    assert len(event) == 3
+    for name, values in columns.items():
+        column = getattr(event, name)
+        assert isinstance(column, np.memmap) == (mmap_mode is not None)
+        np.testing.assert_array_equal(column, values)
+        assert column.dtype == values.dtype
+
+
+def test_empty_event_folder(tmp_path):
+    folder = write_event_folder(
+        tmp_path / "TTL",
+        full_words=np.array([], dtype=np.uint64),
+        timestamps=np.array([]),
+        states=np.array([], dtype=np.int16),
+        sample_numbers=np.array([], dtype=np.int64),
+    )
+    assert len(Event.from_folder(folder, event_metadata())) == 0
+
+
+def test_messages_from_folder_are_memory_mapped(tmp_path):
+    folder = write_event_folder(
+        tmp_path / "MESSAGES",
+        text=np.array([b"TRIAL 1", b"TRIAL 2"]),
+        sample_numbers=np.array([10, 20], dtype=np.int64),
+        timestamps=np.array([0.5, 1.0]),
+    )
+
+    messages = Messages.from_folder(folder, event_metadata())
+
+    assert isinstance(messages.text, np.memmap)
+    assert [message["text"] for message in messages] == ["TRIAL 1", "TRIAL 2"]
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from oecon.events import is_monotonic, merge_event_streams
+
+
+def reference_merge(streams):
+    timestamps_ns = np.concatenate([t for t, _ in streams]).astype(np.int64)
+    event_codes = np.concatenate([c for _, c in streams]).astype(np.int32)
+    order = np.argsort(timestamps_ns, kind="stable")
+    return timestamps_ns[order], event_codes[order]
+
+
+def random_stream(rng, n_events, code):
+    # coarse timestamps, so that streams share simultaneous events
+    timestamps_ns = np.sort(rng.integers(0, n_events * 10, n_events)) * 1000
+    return timestamps_ns, np.full(n_events, code)
+
+
+@pytest.mark.parametrize("n_streams", [1, 2, 5])
+def test_merge_matches_sort_of_all_events(n_streams):
+    rng = np.random.default_rng(42)
+    streams = [random_stream(rng, 1000 + 10 * i, i) for i in range(n_streams)]
+
+    timestamps_ns, event_codes = merge_event_streams(streams)
+
+    expected_timestamps_ns, expected_event_codes = reference_merge(streams)
+    assert timestamps_ns.dtype == np.int64
+    assert event_codes.dtype == np.int32
+    assert is_monotonic(timestamps_ns)
+    np.testing.assert_array_equal(timestamps_ns, expected_timestamps_ns)
+    # simultaneous events keep the order of the streams
+    np.testing.assert_array_equal(event_codes, expected_event_codes)
+
+
+def test_merge_empty_streams():
+    timestamps_ns, event_codes = merge_event_streams([])
+    assert timestamps_ns.size == 0 and event_codes.size == 0
+
+    stream = (np.array([1, 2, 2, 5]), np.array([10, 11, 12, 13]))
+    empty = (np.array([], dtype=np.int64), np.array([], dtype=np.int32))
+    timestamps_ns, event_codes = merge_event_streams([empty, stream, empty])
+    np.testing.assert_array_equal(timestamps_ns, stream[0])
+    np.testing.assert_array_equal(event_codes, stream[1])
+
+
+def test_merge_sorts_unsorted_stream():
+    unsorted = (np.array([30, 10, 20]), np.array([3, 1, 2]))
+    timestamps_ns, event_codes = merge_event_streams(
+        [unsorted, (np.array([15, 25]), np.array([4, 5]))]
+    )
+    np.testing.assert_array_equal(timestamps_ns, [10, 15, 20, 25, 30])
+    np.testing.assert_array_equal(event_codes, [1, 4, 2, 5, 3])
+
+
+def test_is_monotonic():
+    assert is_monotonic(np.array([], dtype=np.int64))
+    assert is_monotonic(np.array([1, 1, 2]))
+    assert not is_monotonic(np.array([1, 3, 2]))
@@ -0,0 +1,134 @@
+import json
+
+import numpy as np
+import pytest
+from dh5io.create import create_dh_file
+from open_ephys.analysis.formats.BinaryRecording import BinaryRecording
+
+from oecon.events import (
+    EventPreprocessingConfig,
+    EventSource,
+    EventSourceIndex,
+    find_ev02_source,
+    find_marker_source,
+    get_event_sources,
+    process_oe_events,
+)
+from oecon.trialmap import find_message_source
+
+
+def event_info(source_processor: str, stream_name: str, folder_name: str) -> dict:
+    return dict(
+        channel_name="",
+        folder_name=folder_name,
+        identifier="",
+        sample_rate=1000.0,
+        stream_name=stream_name,
+        type="",
+        description="",
+        source_processor=source_processor,
+    )
+
+
+def write_events(folder, sample_numbers, states, full_words):
+    folder.mkdir(parents=True)
+    sample_numbers = np.asarray(sample_numbers, dtype=np.int64)
+    np.save(folder / "sample_numbers.npy", sample_numbers)
+    np.save(folder / "timestamps.npy", sample_numbers / 1000.0)
+    np.save(folder / "states.npy", np.asarray(states, dtype=np.int16))
+    np.save(folder / "full_words.npy", np.asarray(full_words, dtype=np.uint64))
+
+
+def create_recording(directory, ni_streams=("Dev1", "Dev2")) -> BinaryRecording:
+    """Recording with TTLs of two NI cards and network events."""
+    events = [
+        event_info("NI-DAQmx", ni_streams[0], f"NI-DAQmx-100.{ni_streams[0]}/TTL"),
+        event_info("NI-DAQmx", ni_streams[1], f"NI-DAQmx-100.{ni_streams[1]}/TTL"),
+        event_info("Network Events", "Dev1", "Network_Events-101.Dev1/TEXT_group_1"),
+        event_info("Message Center", "messages", "MessageCenter"),
+    ]
+    write_events(directory / "events" / events[0]["folder_name"], [1, 5], [1, -1], [1, 0])
+    write_events(directory / "events" / events[1]["folder_name"], [2, 6], [2, -2], [2, 0])
+    write_events(
+        directory / "events" / events[2]["folder_name"], [3, 3, 4], [1, 2, -1], [1, 3, 2]
+    )
+    info = {"GUI version": "0.6.7", "continuous": [], "events": events, "spikes": []}
+    (directory / "structure.oebin").write_text(json.dumps(info))
+    return BinaryRecording(str(directory))
+
+
+def read_ev02(dh5file):
+    ev02 = dh5file._file["EV02"]
+    return ev02["time"], ev02["event"], dict(ev02.attrs)
+
+
+def test_index_finds_sources_by_processor_and_stream(tmp_path):
+    recording = create_recording(tmp_path / "recording")
+    sources = get_event_sources(recording)
+
+    assert get_event_sources(recording) is sources
+    assert [s.stream_name for s in sources.find("NI-DAQmx")] == ["Dev1", "Dev2"]
+    assert sources.get("NI-DAQmx", "Dev2").folder_name == "NI-DAQmx-100.Dev2/TTL"
+    assert sources.find("NI-DAQmx", "Dev3") == []
+    assert sources.get("Acquisition Board") is None
+    assert sources.get("Message Center").folder_name == "MessageCenter"
+    assert isinstance(sources, EventSourceIndex)
+
+
+def test_routes_sources_into_code_ranges(tmp_path):
+    recording = create_recording(tmp_path / "recording")
+    dh5file = create_dh_file(tmp_path / "events.dh5", overwrite=True, validate=False)
+    config = EventPreprocessingConfig(
+        network_events_code_name_map={"START": 1},
+        ttl_line_names={"photodiode": 1},
+        sources=[
+            EventSource("NI-DAQmx", "Dev1"),
+            EventSource("NI-DAQmx", "Dev2", code_offset=100),
+            EventSource("Network Events", code_offset=1000),
+        ],
+    )
+
+    process_oe_events(config, recording, dh5file)
+
+    times, codes, attrs = read_ev02(dh5file)
+    np.testing.assert_array_equal(times, np.array([1, 2, 3, 4, 5, 6]) * 1_000_000)
+    np.testing.assert_array_equal(codes, [1, 102, 1003, 1002, -1, 98])
+    assert attrs["Dev1/photodiode"] == 1
+    assert attrs["Dev2/photodiode_falling"] == 99
+    assert attrs["START"] == 1001
+
+
+def test_default_sources_are_pxie_ttl_and_network_events(tmp_path):
+    recording = create_recording(tmp_path / "recording", ("PXIe-6341", "Dev2"))
+    dh5file = create_dh_file(tmp_path / "events.dh5", overwrite=True, validate=False)
+
+    process_oe_events(
+        EventPreprocessingConfig(network_events_offset=500), recording, dh5file
+    )
+
+    _, codes, _ = read_ev02(dh5file)
+    np.testing.assert_array_equal(codes, [1, 503, 502, -1])
+
+
+def test_ttl_sources_with_shared_offsets_raise(tmp_path):
+    recording = create_recording(tmp_path / "recording")
+    dh5file = create_dh_file(tmp_path / "events.dh5", overwrite=True, validate=False)
+
+    with pytest.raises(ValueError, match="code_offset"):
+        process_oe_events(
+            EventPreprocessingConfig(sources=[EventSource("NI-DAQmx")]),
+            recording,
+            dh5file,
+        )
+
+
+def test_deprecated_source_lookups_use_the_index(tmp_path):
+    recording = create_recording(tmp_path / "recording", ("PXIe-6341", "Dev2"))
+    sources = get_event_sources(recording)
+
+    with pytest.deprecated_call():
+        assert find_ev02_source(recording.info) == sources.get("NI-DAQmx", "PXIe-6341")
+    with pytest.deprecated_call():
+        assert find_marker_source(recording.info) == sources.get("Network Events")
+    with pytest.deprecated_call():
+        assert find_message_source(recording.info) == sources.get("Message Center")
@@ -0,0 +1,153 @@
+import numpy as np
+import pytest
+import scipy.signal as signal
+
+from oecon.decimation import decimate_np_array
+from oecon.filters import (
+    FILTER_CACHE_DIR_ENV,
+    FilterDesignCache,
+    FilterSpec,
+    StreamingSosFiltFilt,
+    cache_dir_from_environment,
+    impulse_response_length,
+)
+
+
+def test_designs_match_scipy():
+    (b,) = FilterSpec("fir", 60, (1 / 3,)).design()
+    np.testing.assert_array_equal(b, signal.firwin(61, 1 / 3, window="hamming"))
+
+    (sos,) = FilterSpec("iir", 8, (0.8 / 3,)).design()
+    np.testing.assert_array_equal(sos, signal.cheby1(8, 0.05, 0.8 / 3, output="sos"))
+
+    b, a = FilterSpec(
+        "butter", 4, (300.0,), sample_rate=30000.0, btype="highpass"
+    ).design()
+    b_ref, a_ref = signal.butter(4, 300.0, btype="highpass", fs=30000.0)
+    np.testing.assert_array_equal(b, b_ref)
+    np.testing.assert_array_equal(a, a_ref)
+
+
+def test_unknown_filter_type_raises():
+    with pytest.raises(ValueError):
+        FilterSpec("kaiser", 10, (0.5,)).design()
+
+
+def test_cache_hits_and_read_only_coefficients():
+    cache = FilterDesignCache()
+    spec = FilterSpec("fir", 600, (1 / 30,))
+
+    first = cache.get(spec)
+    second = cache.get(FilterSpec("fir", 600, (1 / 30,)))
+
+    assert first is second
+    assert (cache.hits, cache.misses) == (1, 1)
+    with pytest.raises(ValueError):
+        first[0][0] = 1.0
+
+
+def test_cache_evicts_least_recently_used():
+    cache = FilterDesignCache(maxsize=2)
+    specs = [FilterSpec("fir", order, (0.1,)) for order in (10, 20, 30)]
+    cache.get(specs[0])
+    cache.get(specs[1])
+    cache.get(specs[0])
+    cache.get(specs[2])
+
+    cache.get(specs[0])
+    assert cache.hits == 2
+    cache.get(specs[1])
+    assert cache.misses == 4
+
+
+def test_cache_persists_designs_to_disk(tmp_path):
+    spec = FilterSpec("butter", 4, (300.0,), sample_rate=30000.0, btype="highpass")
+    designed = FilterDesignCache(cache_dir=tmp_path).get(spec)
+    assert len(list(tmp_path.glob("*.npz"))) == 1
+
+    loaded = FilterDesignCache(cache_dir=tmp_path).get(spec)
+    for expected, actual in zip(designed, loaded):
+        np.testing.assert_array_equal(expected, actual)
+
+
+def test_cache_dir_from_environment(tmp_path, monkeypatch):
+    monkeypatch.delenv(FILTER_CACHE_DIR_ENV, raising=False)
+    assert cache_dir_from_environment() is None
+
+    monkeypatch.setenv(FILTER_CACHE_DIR_ENV, str(tmp_path))
+    assert cache_dir_from_environment() == tmp_path
+
+    monkeypatch.setenv(FILTER_CACHE_DIR_ENV, "")
+    assert cache_dir_from_environment() is None
+
+
+def test_corrupt_cache_file_is_redesigned(tmp_path):
+    spec = FilterSpec("fir", 30, (0.1,))
+    cache = FilterDesignCache(cache_dir=tmp_path)
+    (tmp_path / f"{spec.cache_key()}.npz").write_bytes(b"not a npz file")
+
+    (b,) = cache.get(spec)
+    np.testing.assert_array_equal(b, signal.firwin(31, 0.1, window="hamming"))
+
+
+@pytest.mark.parametrize("ftype", ["fir", "iir"])
+@pytest.mark.parametrize("zero_phase", [True, False])
+@pytest.mark.parametrize("axis", [0, 1])
+def test_decimate_np_array_matches_scipy_decimate(ftype, zero_phase, axis):
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(3001, 2)).astype(np.float32)
+    if axis == 1:
+        data = data.T
+
+    expected = signal.decimate(data, 10, ftype=ftype, axis=axis, zero_phase=zero_phase)
+    actual = decimate_np_array(data, 10, None, ftype, axis, zero_phase)
+
+    assert actual.dtype == expected.dtype
+    np.testing.assert_array_equal(actual, expected)
+
+
+class TestStreamingSosFiltFilt:
+    sos = signal.butter(4, 300.0, btype="highpass", fs=30000.0, output="sos")
+
+    @pytest.mark.parametrize("chunk_size", [16, 1000, 4096, 50000])
+    def test_matches_sosfiltfilt(self, chunk_size):
+        rng = np.random.default_rng(42)
+        data = rng.normal(scale=100.0, size=(50000, 2)) + 1000.0
+        expected = signal.sosfiltfilt(self.sos, data, axis=0)
+
+        highpass = StreamingSosFiltFilt(self.sos)
+        chunks = [
+            highpass.push(data[start : start + chunk_size])
+            for start in range(0, data.shape[0], chunk_size)
+        ]
+        chunks.append(highpass.flush())
+        result = np.concatenate(chunks, axis=0)
+
+        assert result.shape == expected.shape
+        np.testing.assert_allclose(result, expected, rtol=0, atol=1e-6)
+
+    def test_keeps_single_precision(self):
+        data = np.random.default_rng(42).normal(size=(10000, 1)).astype(np.float32)
+        highpass = StreamingSosFiltFilt(self.sos)
+        result = np.concatenate([highpass.push(data), highpass.flush()])
+        assert result.dtype == np.float32
+        np.testing.assert_allclose(
+            result, signal.sosfiltfilt(self.sos, data, axis=0), atol=1e-4
+        )
+
+    def test_first_chunk_must_be_longer_than_padding(self):
+        highpass = StreamingSosFiltFilt(self.sos)
+        with pytest.raises(ValueError, match="padlen"):
+            highpass.push(np.zeros((highpass.padlen, 1)))
+
+    def test_flush_without_data_raises(self):
+        with pytest.raises(ValueError):
+            StreamingSosFiltFilt(self.sos).flush()
+
+    def test_impulse_response_has_decayed_after_overlap(self):
+        n = impulse_response_length(self.sos, tolerance=1e-10)
+        impulse = np.zeros(2 * n)
+        impulse[0] = 1.0
+        response = signal.sosfilt(self.sos, impulse)
+        assert np.max(np.abs(response[n:])) < 1e-10
+        assert np.max(np.abs(response[: n // 2])) > 1e-10
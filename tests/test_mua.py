@@ -0,0 +1,343 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+import scipy.signal as signal
+from dh5io import DH5File
+from dh5io.create import create_dh_file
+
+import oecon.convert_open_ephys_to_dh5 as convert_module
+import oecon.mua
+from oecon.config import OpenEphysToDhConfig
+from oecon.decimation import DecimationConfig, decimate_raw_data
+from oecon.mua import (
+    ContinuousMuaConfig,
+    MuaBand,
+    compute_mua,
+    compute_mua_bands,
+    compute_mua_bands_in_chunks,
+    compute_mua_in_chunks,
+    extract_continuous_mua,
+    extract_lfp_and_mua,
+)
+
+from conftest import (
+    CountingSamples,
+    MockRecording,
+    create_recording,
+    create_spiking_samples,
+)
+
+
+@pytest.mark.parametrize("batch_channels", [False, True])
+def test_float32_mua_matches_float64(tmp_path, batch_channels):
+    """Filtering in single precision changes the int16 MUA by at most one bit"""
+    recording = create_recording(create_spiking_samples())
+
+    files = {}
+    for precision in ("float64", "float32"):
+        files[precision] = create_dh_file(
+            tmp_path / f"{precision}.dh5", overwrite=True, validate=False
+        )
+        extract_continuous_mua(
+            ContinuousMuaConfig(batch_channels=batch_channels, precision=precision),
+            DecimationConfig(),
+            recording,
+            files[precision],
+        )
+
+    for cont_id in files["float64"].get_cont_group_ids():
+        expected = files["float64"].get_cont_group_by_id(cont_id).data[:].astype(int)
+        result = files["float32"].get_cont_group_by_id(cont_id).data[:].astype(int)
+        assert expected.max() > 100
+        assert np.max(np.abs(result - expected)) <= 1
+        assert np.mean(result != expected) < 0.01
+
+
+@pytest.mark.parametrize(
+    "batch_channels, n_workers", [(False, 1), (True, 1), (False, 2), (True, 2)]
+)
+def test_fused_lfp_and_mua_matches_separate_stages(tmp_path, batch_channels, n_workers):
+    """A single pass writes the same LFP and MUA blocks as the two stages"""
+    recording = create_recording(
+        create_spiking_samples(n_samples=30000, n_channels=4)
+    )
+
+    def configs():
+        return (
+            DecimationConfig(
+                included_channel_names=["CH1", "CH2", "CH4"],
+                batch_channels=batch_channels,
+                n_workers=n_workers,
+            ),
+            ContinuousMuaConfig(included_channel_names=["CH2", "CH3", "CH4"]),
+        )
+
+    separate_file = create_dh_file(
+        tmp_path / "separate.dh5", overwrite=True, validate=False
+    )
+    decimation_config, mua_config = configs()
+    decimation_config = decimate_raw_data(decimation_config, recording, separate_file)
+    mua_config = extract_continuous_mua(
+        mua_config, decimation_config, recording, separate_file
+    )
+
+    oe_cont = recording.continuous[0]
+    oe_cont.samples = CountingSamples(oe_cont.samples)
+    fused_file = create_dh_file(tmp_path / "fused.dh5", overwrite=True, validate=False)
+    fused_decimation_config, fused_mua_config = extract_lfp_and_mua(
+        *configs(), recording, fused_file
+    )
+
+    # every raw channel is read exactly once
+    assert oe_cont.samples.n_read_columns == 4
+    assert fused_file.get_cont_group_ids() == separate_file.get_cont_group_ids()
+    assert fused_file.get_cont_group_ids() == [2001, 2002, 2003, 4001, 4002, 4003]
+    for cont_id in separate_file.get_cont_group_ids():
+        expected = separate_file.get_cont_group_by_id(cont_id)
+        result = fused_file.get_cont_group_by_id(cont_id)
+        np.testing.assert_array_equal(result.data[:], expected.data[:])
+        assert result.name == expected.name
+        np.testing.assert_array_equal(
+            result.calibrated_data[:], expected.calibrated_data[:]
+        )
+    assert fused_decimation_config == decimation_config
+    np.testing.assert_array_equal(
+        fused_mua_config.filter_coecfficients_b_a.b, mua_config.filter_coecfficients_b_a.b
+    )
+    assert fused_mua_config.included_channel_names == mua_config.included_channel_names
+
+
+@pytest.mark.parametrize(
+    "decimation_chunk_size, mua_chunk_size", [(1000, None), (None, 1000)]
+)
+def test_fused_lfp_and_mua_rejects_chunked_stages(decimation_chunk_size, mua_chunk_size):
+    with pytest.raises(ValueError, match="chunked"):
+        extract_lfp_and_mua(
+            DecimationConfig(chunk_size=decimation_chunk_size),
+            ContinuousMuaConfig(chunk_size=mua_chunk_size),
+            MockRecording([]),
+            None,
+        )
+
+
+def test_chunked_highpass_matches_whole_recording(tmp_path):
+    """The chunked SOS high-pass changes the int16 MUA by at most one bit"""
+    recording = create_recording(create_spiking_samples(n_samples=60001))
+
+    files = {}
+    for chunk_size in (None, 4096):
+        files[chunk_size] = create_dh_file(
+            tmp_path / f"mua_{chunk_size}.dh5", overwrite=True, validate=False
+        )
+        extract_continuous_mua(
+            ContinuousMuaConfig(chunk_size=chunk_size),
+            DecimationConfig(),
+            recording,
+            files[chunk_size],
+        )
+
+    for cont_id in (4001, 4002):
+        expected = files[None].get_cont_group_by_id(cont_id).data[:].astype(int)
+        result = files[4096].get_cont_group_by_id(cont_id).data[:].astype(int)
+        assert result.shape == expected.shape == (2001, 1)
+        assert np.max(np.abs(result - expected)) <= 1
+
+
+def test_conversion_with_chunked_mua_does_not_fuse_stages(tmp_path, monkeypatch):
+    """The fused stage reads whole channels, so chunked MUA keeps its own stage"""
+    recording = create_recording(create_spiking_samples())
+    recording.directory = str(tmp_path)
+    monkeypatch.chdir(tmp_path)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("LFP and MUA must not be fused")
+
+    chunked_mua_calls = []
+
+    def count_chunked_mua(*args, **kwargs):
+        chunked_mua_calls.append(kwargs["n_samples"])
+        return compute_mua_bands_in_chunks(*args, **kwargs)
+
+    monkeypatch.setattr(convert_module, "extract_lfp_and_mua", fail)
+    monkeypatch.setattr(oecon.mua, "compute_mua_bands_in_chunks", count_chunked_mua)
+    convert_module.convert_open_ephys_recording_to_dh5(
+        recording,
+        "session",
+        config=OpenEphysToDhConfig(
+            raw_config=None,
+            decimation_config=DecimationConfig(),
+            event_config=None,
+            trialmap_config=None,
+            spike_cutting_config=None,
+            continuous_mua_config=ContinuousMuaConfig(chunk_size=8192),
+        ),
+    )
+
+    assert chunked_mua_calls == [60000, 60000]
+    dh5file = DH5File(tmp_path / "session_0.dh5", mode="r")
+    assert dh5file.get_cont_group_ids() == [2001, 2002, 4001, 4002]
+
+
+def test_too_small_mua_chunks_raise_before_any_stage(tmp_path, monkeypatch):
+    """Chunks shorter than the overlap of the gamma band fail up front"""
+    recording = create_recording(create_spiking_samples())
+    recording.directory = str(tmp_path)
+    monkeypatch.chdir(tmp_path)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("No stage must run")
+
+    monkeypatch.setattr(convert_module, "decimate_raw_data", fail)
+    with pytest.raises(ValueError, match="'gamma' filter at 30000 Hz, got 4096"):
+        convert_module.convert_open_ephys_recording_to_dh5(
+            recording,
+            "session",
+            config=OpenEphysToDhConfig(
+                raw_config=None,
+                decimation_config=DecimationConfig(),
+                event_config=None,
+                trialmap_config=None,
+                spike_cutting_config=None,
+                continuous_mua_config=ContinuousMuaConfig(
+                    bands=[MuaBand("MUA", 300.0), MuaBand("gamma", 30.0, 80.0)],
+                    chunk_size=4096,
+                ),
+            ),
+        )
+
+
+def chunks_of(samples: np.ndarray, chunk_size: int):
+    for start in range(0, samples.shape[0], chunk_size):
+        yield samples[start : start + chunk_size]
+
+
+@pytest.mark.parametrize("ftype", ["fir", "polyphase", "iir"])
+def test_mua_in_chunks_matches_whole_array(ftype):
+    oe_cont = create_recording(create_spiking_samples()).continuous[0]
+    samples = oe_cont.samples.astype(np.float64)
+    b, a = signal.butter(4, 300.0, btype="highpass", fs=30000.0)
+    decimation_config = DecimationConfig(
+        ftype=ftype, filter_order=8 if ftype == "iir" else 600
+    )
+
+    expected = compute_mua(samples, b, a, decimation_config)
+    result = compute_mua_in_chunks(
+        chunks_of(samples, 4096),
+        signal.tf2sos(b, a),
+        decimation_config,
+        n_samples=samples.shape[0],
+    )
+
+    assert result.shape == expected.shape
+    np.testing.assert_allclose(result, expected, rtol=0, atol=1e-6)
+
+
+def test_mua_in_chunks_allocates_no_full_rate_array():
+    n_samples = 600000
+    samples = np.random.default_rng(42).normal(scale=100.0, size=(n_samples, 1))
+    sos = signal.butter(4, 300.0, btype="highpass", fs=30000.0, output="sos")
+
+    tracemalloc.start()
+    compute_mua_in_chunks(chunks_of(samples, 30000), sos, DecimationConfig(), n_samples)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert peak < samples.nbytes / 2
+
+
+def test_mua_matches_filtfilt_with_two_full_length_arrays():
+    n_samples = 600000
+    b, a = signal.butter(4, 300.0, btype="highpass", fs=30000.0)
+    decimation_config = DecimationConfig()
+
+    def read_samples():
+        return np.random.default_rng(42).normal(scale=100.0, size=(n_samples, 2))
+
+    expected = compute_mua_bands(
+        read_samples(), [signal.tf2sos(b, a)], decimation_config
+    )[0]
+    tracemalloc.start()
+    result = compute_mua(read_samples(), b, a, decimation_config)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    np.testing.assert_allclose(result, expected, rtol=0, atol=1e-6)
+    assert peak < 2.2 * read_samples().nbytes
+
+
+@pytest.mark.parametrize("chunk_size", [None, 25000])
+def test_filter_bank_writes_each_band_from_one_read(tmp_path, chunk_size):
+    recording = create_recording(create_spiking_samples())
+    bands = [
+        MuaBand("MUA", 300.0),
+        MuaBand("MUA_500_5000", 500.0, 5000.0),
+        MuaBand("gamma", 30.0, 80.0, start_block_id=4501),
+    ]
+
+    single_band_file = create_dh_file(
+        tmp_path / "single.dh5", overwrite=True, validate=False
+    )
+    extract_continuous_mua(
+        ContinuousMuaConfig(chunk_size=chunk_size),
+        DecimationConfig(),
+        recording,
+        single_band_file,
+    )
+
+    oe_cont = recording.continuous[0]
+    oe_cont.samples = CountingSamples(oe_cont.samples)
+    bank_file = create_dh_file(tmp_path / "bank.dh5", overwrite=True, validate=False)
+    extract_continuous_mua(
+        ContinuousMuaConfig(bands=bands, batch_channels=True, chunk_size=chunk_size),
+        DecimationConfig(),
+        recording,
+        bank_file,
+    )
+
+    assert oe_cont.samples.n_read_values == oe_cont.samples.size
+    assert bank_file.get_cont_group_ids() == [4001, 4002, 4003, 4004, 4501, 4502]
+    assert bank_file.get_cont_group_by_id(4004).name == "test_stream/CH2/MUA_500_5000"
+    assert bank_file.get_cont_group_by_id(4501).name == "test_stream/CH1/gamma"
+    for cont_id in (4001, 4002):
+        expected = single_band_file.get_cont_group_by_id(cont_id)
+        result = bank_file.get_cont_group_by_id(cont_id)
+        assert result.name == expected.name
+        assert np.max(np.abs(result.data[:].astype(int) - expected.data[:])) <= 1
+
+
+def test_fused_filter_bank_matches_separate_stage(tmp_path):
+    recording = create_recording(create_spiking_samples(n_samples=30000))
+
+    def mua_config():
+        return ContinuousMuaConfig(
+            bands=[MuaBand("MUA", 300.0, 3000.0), MuaBand("gamma", 30.0, 80.0)]
+        )
+
+    separate_file = create_dh_file(
+        tmp_path / "separate.dh5", overwrite=True, validate=False
+    )
+    extract_continuous_mua(mua_config(), DecimationConfig(), recording, separate_file)
+    fused_file = create_dh_file(tmp_path / "fused.dh5", overwrite=True, validate=False)
+    extract_lfp_and_mua(DecimationConfig(), mua_config(), recording, fused_file)
+
+    for cont_id in (4001, 4002, 4003, 4004):
+        np.testing.assert_array_equal(
+            fused_file.get_cont_group_by_id(cont_id).data[:],
+            separate_file.get_cont_group_by_id(cont_id).data[:],
+        )
+
+
+def test_overlapping_band_block_ids_raise(tmp_path):
+    config = ContinuousMuaConfig(
+        bands=[MuaBand("MUA", 300.0), MuaBand("gamma", 30.0, 80.0, start_block_id=4002)]
+    )
+    dh5file = create_dh_file(tmp_path / "bank.dh5", overwrite=True, validate=False)
+    with pytest.raises(ValueError, match="overlap"):
+        extract_continuous_mua(
+            config,
+            DecimationConfig(),
+            create_recording(create_spiking_samples()),
+            dh5file,
+        )
+    assert dh5file.get_cont_group_ids() == []
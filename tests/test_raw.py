@@ -0,0 +1,225 @@
+import h5py
+import numpy as np
+import pytest
+from dh5io.cont import get_cont_groups_from_file, validate_cont_group
+from dh5io.create import create_dh_file
+
+from oecon.raw import (
+    RawConfig,
+    is_linked_to_external_raw_data,
+    materialize_external_raw_data,
+    process_oe_raw_data,
+)
+from oecon.storage import ChunkLayout, Compression
+
+from conftest import (
+    CountingSamples,
+    MockRecording,
+    create_continuous,
+    create_recording,
+)
+
+
+def create_raw_recording(n_samples: int = 10000, n_channels: int = 4) -> MockRecording:
+    rng = np.random.default_rng(42)
+    samples = rng.normal(scale=500.0, size=(n_samples, n_channels))
+    # a different gain per channel to check the calibration of each CONT group
+    bit_volts = [0.195 * (i + 1) for i in range(n_channels)]
+    # a stream name of the default processor mapping
+    return create_recording(samples, bit_volts, stream_name="example_data")
+
+
+@pytest.mark.parametrize(
+    "included_channel_names, chunk_size",
+    [(None, 1000), (None, 2**16), (["CH2", "CH4"], 999)],
+)
+def test_stream_is_written_to_a_single_cont_group(
+    tmp_path, included_channel_names, chunk_size
+):
+    recording = create_raw_recording()
+    oe_cont = recording.continuous[0]
+    dh5file = create_dh_file(tmp_path / "raw.dh5", overwrite=True, validate=False)
+
+    process_oe_raw_data(
+        RawConfig(
+            split_channels_into_cont_blocks=False,
+            included_channel_names=included_channel_names,
+            chunk_size=chunk_size,
+        ),
+        recording,
+        dh5file,
+    )
+
+    channel_indices = [0, 1, 2, 3] if included_channel_names is None else [1, 3]
+    assert dh5file.get_cont_group_ids() == [1]
+    cont_group = dh5file._file["CONT1"]
+    validate_cont_group(cont_group)
+    np.testing.assert_array_equal(
+        cont_group["DATA"][:], oe_cont.samples[:, channel_indices]
+    )
+    np.testing.assert_array_equal(
+        cont_group.attrs["Calibration"],
+        np.asarray(oe_cont.metadata.bit_volts)[channel_indices],
+    )
+    channels = cont_group.attrs["Channels"]
+    assert list(channels["BoardChanNo"]) == channel_indices
+    assert list(channels["GlobalChanNumber"]) == list(range(len(channel_indices)))
+    assert cont_group["INDEX"][0]["offset"] == 0
+
+
+def test_streams_are_named_and_numbered_like_their_first_channel(tmp_path):
+    samples = np.random.default_rng(42).normal(scale=500.0, size=(1000, 4))
+    recording = MockRecording(
+        [
+            create_continuous(samples, stream_name="PXIe-6341"),
+            create_continuous(samples[:, :2], stream_name="example_data"),
+        ]
+    )
+    files = {}
+    for split_channels_into_cont_blocks in (True, False):
+        files[split_channels_into_cont_blocks] = create_dh_file(
+            tmp_path / f"raw_{split_channels_into_cont_blocks}.dh5",
+            overwrite=True,
+            validate=False,
+        )
+        process_oe_raw_data(
+            RawConfig(split_channels_into_cont_blocks=split_channels_into_cont_blocks),
+            recording,
+            files[split_channels_into_cont_blocks],
+        )
+
+    assert files[True].get_cont_group_ids() == [1, 2, 3, 4, 5, 6]
+    assert files[False].get_cont_group_ids() == [1, 5]
+    assert files[False].get_cont_group_by_id(1).name == "PXIe-6341"
+    assert files[False].get_cont_group_by_id(5).name == "example_data"
+    channels = files[False]._file["CONT5"].attrs["Channels"]
+    assert list(channels["GlobalChanNumber"]) == [4, 5]
+
+
+@pytest.mark.parametrize(
+    "included_channel_names, chunk_size",
+    [(None, 1000), (None, 2**16), (["CH2", "CH4"], 999)],
+)
+def test_channels_are_written_from_one_sequential_read(
+    tmp_path, included_channel_names, chunk_size
+):
+    recording = create_raw_recording()
+    oe_cont = recording.continuous[0]
+    raw_samples = oe_cont.samples
+    oe_cont.samples = CountingSamples(raw_samples)
+    dh5file = create_dh_file(tmp_path / "raw.dh5", overwrite=True, validate=False)
+
+    process_oe_raw_data(
+        RawConfig(included_channel_names=included_channel_names, chunk_size=chunk_size),
+        recording,
+        dh5file,
+    )
+
+    channel_indices = [0, 1, 2, 3] if included_channel_names is None else [1, 3]
+    # every included sample is read exactly once
+    assert oe_cont.samples.n_read_values == raw_samples.shape[0] * len(channel_indices)
+    assert dh5file.get_cont_group_ids() == [i + 1 for i in channel_indices]
+    for global_channel_index, channel_index in enumerate(channel_indices):
+        cont_group = dh5file._file[f"CONT{channel_index + 1}"]
+        np.testing.assert_array_equal(
+            cont_group["DATA"][:], raw_samples[:, channel_index : channel_index + 1]
+        )
+        assert cont_group.attrs["Name"] == f"CH{channel_index + 1}"
+        assert (
+            cont_group.attrs["Calibration"] == oe_cont.metadata.bit_volts[channel_index]
+        )
+        assert cont_group.attrs["Channels"]["GlobalChanNumber"] == global_channel_index
+
+
+def create_binary_recording(tmp_path, n_samples: int = 10000, n_channels: int = 4):
+    """Recording with samples memory-mapped from a continuous.dat, like the
+    Open Ephys binary format."""
+    recording = create_raw_recording(n_samples, n_channels)
+    oe_cont = recording.continuous[0]
+    dat_path = tmp_path / "continuous.dat"
+    oe_cont.samples.tofile(dat_path)
+    data = np.memmap(dat_path, mode="r", dtype="int16")
+    oe_cont.samples = data.reshape((len(data) // n_channels, n_channels))
+    return recording
+
+
+@pytest.mark.parametrize("split_channels_into_cont_blocks", [True, False])
+@pytest.mark.parametrize("included_channel_names", [None, ["CH2", "CH4"]])
+def test_external_storage_links_and_materializes_raw_data(
+    tmp_path, split_channels_into_cont_blocks, included_channel_names
+):
+    recording = create_binary_recording(tmp_path, n_samples=100000)
+    samples = np.array(recording.continuous[0].samples)
+    channel_indices = [0, 1, 2, 3] if included_channel_names is None else [1, 3]
+    dh5_path = tmp_path / "linked.dh5"
+    dh5file = create_dh_file(dh5_path, overwrite=True, validate=False)
+
+    process_oe_raw_data(
+        RawConfig(
+            split_channels_into_cont_blocks=split_channels_into_cont_blocks,
+            included_channel_names=included_channel_names,
+            storage="external",
+        ),
+        recording,
+        dh5file,
+    )
+
+    def read_data(file: h5py.File) -> np.ndarray:
+        return np.concatenate(
+            [cont_group["DATA"][:] for cont_group in get_cont_groups_from_file(file)],
+            axis=1,
+        )
+
+    file = dh5file._file
+    assert all(
+        cont_group["DATA"].is_virtual for cont_group in get_cont_groups_from_file(file)
+    )
+    np.testing.assert_array_equal(read_data(file), samples[:, channel_indices])
+    # the samples are not copied into the DH5 file
+    file.flush()
+    assert dh5_path.stat().st_size < samples.nbytes / 4
+
+    materialize_external_raw_data(file, chunk_size=999)
+    assert not is_linked_to_external_raw_data(file)
+    del recording
+    (tmp_path / "continuous.dat").unlink()
+    assert not any(
+        cont_group["DATA"].is_virtual for cont_group in get_cont_groups_from_file(file)
+    )
+    np.testing.assert_array_equal(read_data(file), samples[:, channel_indices])
+
+
+def test_materialized_raw_data_is_chunked_and_compressed(tmp_path):
+    recording = create_binary_recording(tmp_path, n_samples=10000)
+    samples = np.array(recording.continuous[0].samples)
+    dh5file = create_dh_file(tmp_path / "linked.dh5", overwrite=True, validate=False)
+    process_oe_raw_data(
+        RawConfig(split_channels_into_cont_blocks=False, storage="external"),
+        recording,
+        dh5file,
+    )
+
+    materialize_external_raw_data(
+        dh5file._file,
+        chunk_layout=ChunkLayout("fixed", chunk_samples=1000),
+        compression=Compression("gzip"),
+    )
+
+    (cont_group,) = get_cont_groups_from_file(dh5file._file)
+    data = cont_group["DATA"]
+    assert data.chunks == (1000, 4)
+    assert data.compression == "gzip"
+    np.testing.assert_array_equal(data[:], samples)
+
+
+def test_external_storage_requires_memory_mapped_samples(tmp_path):
+    dh5file = create_dh_file(tmp_path / "linked.dh5", overwrite=True, validate=False)
+    with pytest.raises(ValueError, match="memory-mapped"):
+        process_oe_raw_data(
+            RawConfig(storage="external"), create_raw_recording(), dh5file
+        )
+
+
+def test_invalid_raw_storage_raises(tmp_path):
+    with pytest.raises(ValueError, match="storage"):
+        process_oe_raw_data(RawConfig(storage="symlink"), create_raw_recording(), None)
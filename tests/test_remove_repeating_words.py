@@ -37,3 +37,68 @@ def test_remove_repeating_words():
     assert isinstance(full_word_datat, FullWordEvent)
     assert len(full_word_datat) == 5
     assert np.array_equal(full_word_datat.full_words, np.array([1, 3, 4, 128, 129]))
+
+
+def make_event(full_words, sample_numbers) -> Event:
+    metadata = EventMetadata(
+        folder_name="test_folder",
+        source_processor="Network Events",
+        stream_name="PXIe-6341",
+        identifier="",
+        sample_rate=1000.0,
+        channel_name="",
+        type="",
+        description="",
+    )
+    sample_numbers = np.asarray(sample_numbers)
+    return Event(
+        metadata=metadata,
+        full_words=np.asarray(full_words),
+        timestamps=sample_numbers / metadata.sample_rate,
+        states=np.ones(len(sample_numbers), dtype=np.int16),
+        sample_numbers=sample_numbers,
+    )
+
+
+def test_recurring_words_in_different_samples_are_kept():
+    full_word_data = remove_repeating_simultaneous_words(
+        make_event([4, 4, 0, 4, 4, 4], [3, 5, 6, 6, 8, 8])
+    )
+    np.testing.assert_array_equal(full_word_data.full_words, [4, 4, 4, 4])
+    np.testing.assert_array_equal(full_word_data.sample_numbers, [3, 5, 6, 8])
+    np.testing.assert_array_equal(full_word_data.timestamps, [0.003, 0.005, 0.006, 0.008])
+
+
+def test_keeps_unsigned_full_words():
+    full_words = np.array([2**63, 2**63 + 1, 1], dtype=np.uint64)
+    full_word_data = remove_repeating_simultaneous_words(
+        make_event(full_words, [1, 1, 2])
+    )
+    assert full_word_data.full_words.dtype == np.uint64
+    np.testing.assert_array_equal(full_word_data.full_words, full_words[1:])
+
+
+def test_empty_event():
+    full_word_data = remove_repeating_simultaneous_words(make_event([], []))
+    assert len(full_word_data) == 0
+
+
+def test_ten_million_events():
+    rng = np.random.default_rng(42)
+    n_samples = 2_300_000
+    # every sample sets 1 to 8 lines, one event per changed line
+    lines_per_sample = rng.integers(1, 9, n_samples)
+    sample_numbers = np.repeat(np.arange(n_samples) * 10, lines_per_sample)
+    words = rng.integers(0, 256, n_samples)
+    full_words = np.repeat(words, lines_per_sample)
+    full_words[np.cumsum(lines_per_sample) - lines_per_sample] = 0  # partial words
+    assert len(sample_numbers) > 10_000_000
+
+    full_word_data = remove_repeating_simultaneous_words(
+        make_event(full_words, sample_numbers)
+    )
+
+    np.testing.assert_array_equal(full_word_data.sample_numbers, np.arange(n_samples) * 10)
+    np.testing.assert_array_equal(
+        full_word_data.full_words, np.where(lines_per_sample > 1, words, 0)
+    )
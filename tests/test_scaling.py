@@ -1,4 +1,10 @@
-from oecon.scaling import scale_to_16_bit_range
+from oecon.scaling import (
+    AbsAmplitudeSketch,
+    quantize_to_int16,
+    scale_chunks_to_16_bit_range,
+    scale_to_16_bit_range,
+)
+import h5py
 import numpy as np
 import pytest
 
@@ -19,6 +25,28 @@ def test_scale_to_16_bit_range():
     assert np.array_equal(scaled_data, expected_scaled_data)
 
 
+def test_scale_to_16_bit_range_per_channel():
+    np.random.seed(42)
+    data = np.random.normal(scale=[0.01, 1.0, 1000.0], size=(1000, 3))
+    data[:, 1] = 0.0
+
+    scaled_data, calibration = scale_to_16_bit_range(data, axis=0)
+
+    assert scaled_data.dtype == np.int16
+    assert calibration.shape == (3,)
+    np.testing.assert_array_equal(np.max(np.abs(scaled_data), axis=0), [32765, 0, 32765])
+    for channel in (0, 2):
+        expected, factor = scale_to_16_bit_range(data[:, channel])
+        np.testing.assert_array_equal(scaled_data[:, channel], expected)
+        assert calibration[channel] == pytest.approx(factor)
+    assert calibration[1] == 1.0
+
+    # channels along the first axis
+    scaled_transposed, calibration_transposed = scale_to_16_bit_range(data.T, axis=1)
+    np.testing.assert_array_equal(scaled_transposed, scaled_data.T)
+    np.testing.assert_array_equal(calibration_transposed, calibration)
+
+
 def test_scale_to_16_bit_range_errors():
     # Test with an invalid scale_abs_max_to value
     data = np.random.rand(100) * 37
@@ -28,3 +56,94 @@ def test_scale_to_16_bit_range_errors():
     # Test with a negative scale_abs_max_to value
     with pytest.raises(ValueError) as exc_info:
         scale_to_16_bit_range(data, scale_abs_max_to=-10)
+
+
+def test_quantize_to_int16_clips_and_counts_saturation():
+    data = np.array(
+        [[0.0, 1.7], [32767.9, -2.5], [32768.0, -32768.9], [1e6, -32769.0]]
+    )
+
+    quantized, n_saturated = quantize_to_int16(data.copy(), chunk_size=3)
+
+    assert quantized.dtype == np.int16
+    np.testing.assert_array_equal(
+        quantized, [[0, 1], [32767, -2], [32767, -32768], [32767, -32768]]
+    )
+    np.testing.assert_array_equal(n_saturated, [2, 1])
+
+
+def test_quantize_to_int16_matches_astype_in_range():
+    np.random.seed(42)
+    data = np.random.normal(scale=5000.0, size=(10000, 3))
+
+    quantized, n_saturated = quantize_to_int16(data.copy(), chunk_size=1000)
+
+    np.testing.assert_array_equal(quantized, data.astype(np.int16))
+    np.testing.assert_array_equal(n_saturated, [0, 0, 0])
+
+
+def test_abs_amplitude_sketch():
+    np.random.seed(42)
+    data = np.random.standard_t(df=3, size=(100000, 2)) * [1.0, 1000.0]
+    data[:10, 0] = 0.0
+
+    sketch = AbsAmplitudeSketch(n_channels=2, quantile=0.999)
+    for start in range(0, data.shape[0], 7000):
+        sketch.update(data[start : start + 7000])
+
+    np.testing.assert_array_equal(sketch.abs_max, np.max(np.abs(data), axis=0))
+    expected = np.quantile(np.abs(data), 0.999, axis=0)
+    amplitude = sketch.amplitude()
+    assert np.all(amplitude >= expected)
+    assert np.all(amplitude <= expected * 2 ** (1 / 64))
+
+    with pytest.raises(ValueError):
+        AbsAmplitudeSketch(n_channels=1, quantile=1.5)
+
+
+def chunks_of(data, chunk_size):
+    return lambda: (
+        data[start : start + chunk_size] for start in range(0, len(data), chunk_size)
+    )
+
+
+def test_scale_chunks_matches_scale_to_16_bit_range():
+    np.random.seed(42)
+    data = np.random.normal(scale=37.0, size=(10000, 1))
+    expected, factor = scale_to_16_bit_range(data)
+
+    out = np.zeros(data.shape, dtype=np.int16)
+    calibration, n_saturated = scale_chunks_to_16_bit_range(chunks_of(data, 1000), out)
+
+    np.testing.assert_array_equal(out, expected)
+    assert calibration[0] == pytest.approx(factor)
+    np.testing.assert_array_equal(n_saturated, [0])
+
+
+def test_scale_chunks_to_hdf5_dataset_with_quantile(tmp_path):
+    np.random.seed(42)
+    data = np.random.normal(scale=[1.0, 100.0], size=(20000, 2))
+    data[[5, 500], 1] = 10000.0  # outliers
+
+    with h5py.File(tmp_path / "scaled.h5", "w") as file:
+        dataset = file.create_dataset("DATA", shape=data.shape, dtype=np.int16)
+        calibration, n_saturated = scale_chunks_to_16_bit_range(
+            chunks_of(data, 3000), dataset, scale_abs_max_to=30000, quantile=0.999
+        )
+        scaled = dataset[:]
+
+    # the outliers do not determine the scaling, but are clipped
+    assert np.all(n_saturated >= [0, 2])
+    assert np.all(n_saturated <= 0.001 * len(data) + 2)
+    np.testing.assert_array_equal(scaled[[5, 500], 1], [32767, 32767])
+    inside = np.abs(data) * (1 / calibration) < 32767
+    np.testing.assert_allclose(scaled[inside], (data / calibration)[inside], atol=1)
+
+
+def test_scale_chunks_without_signal():
+    out = np.ones((100, 1), dtype=np.int16)
+    calibration, n_saturated = scale_chunks_to_16_bit_range(
+        chunks_of(np.zeros((100, 1)), 30), out
+    )
+    np.testing.assert_array_equal(calibration, [1.0])
+    np.testing.assert_array_equal(out, 0)
@@ -0,0 +1,179 @@
+import importlib.util
+import logging
+
+import numpy as np
+import pytest
+from dh5io.create import create_dh_file
+
+from oecon.config import OpenEphysToDhConfig, apply_compression_policy
+from oecon.decimation import DecimationConfig, decimate_raw_data
+from oecon.default_mappings import ContGroups
+from oecon.mua import ContinuousMuaConfig, extract_continuous_mua
+from oecon.raw import RawConfig, process_oe_raw_data
+from oecon.storage import DEFAULT_COMPRESSION_POLICY, ChunkLayout, Compression
+
+from conftest import create_recording, create_spiking_samples
+
+
+@pytest.mark.parametrize(
+    "layout, expected",
+    [
+        (ChunkLayout("fixed", chunk_samples=4096), (4096, 32)),
+        (ChunkLayout("fixed", chunk_samples=4096, chunk_channels=8), (4096, 8)),
+        (ChunkLayout("time_window", window_s=0.5), (500, 32)),
+        (ChunkLayout("auto", expected_read_s=2.0), (2000, 32)),
+        # limited to max_chunk_bytes
+        (ChunkLayout("auto", expected_read_s=60.0), (2**20 // 64, 32)),
+        (ChunkLayout("auto"), True),
+        # never larger than the dataset
+        (ChunkLayout("time_window", window_s=3600.0), (100000, 32)),
+    ],
+)
+def test_chunk_shape(layout, expected):
+    assert layout.chunk_shape((100000, 32), sample_rate=1000.0) == expected
+
+
+def test_empty_dataset_is_not_chunked():
+    assert ChunkLayout("fixed", chunk_samples=10).chunk_shape((0, 1), 1000.0) is None
+
+
+@pytest.mark.parametrize(
+    "layout",
+    [ChunkLayout("fixed"), ChunkLayout("time_window"), ChunkLayout("blocks")],
+)
+def test_invalid_chunk_layout_raises(layout):
+    with pytest.raises(ValueError):
+        layout.chunk_shape((1000, 1), 1000.0)
+
+
+@pytest.mark.parametrize("decimation_chunk_size", [None, 4096])
+def test_cont_groups_are_written_with_chunk_layout(tmp_path, decimation_chunk_size):
+    recording = create_recording(create_spiking_samples(n_channels=3))
+    raw_layout = ChunkLayout("fixed", chunk_samples=1000)
+    lfp_layout = ChunkLayout("time_window", window_s=0.5)
+    mua_layout = ChunkLayout("auto", expected_read_s=0.1)
+
+    files = {}
+    for name, layouts in (
+        ("contiguous", (None, None, None)),
+        ("chunked", (raw_layout, lfp_layout, mua_layout)),
+    ):
+        files[name] = create_dh_file(
+            tmp_path / f"{name}.dh5", overwrite=True, validate=False
+        )
+        process_oe_raw_data(
+            RawConfig(
+                oe_processor_cont_group_map={"test_stream": "RAW"},
+                split_channels_into_cont_blocks=False,
+                chunk_layout=layouts[0],
+            ),
+            recording,
+            files[name],
+        )
+        decimation_config = decimate_raw_data(
+            DecimationConfig(chunk_size=decimation_chunk_size, chunk_layout=layouts[1]),
+            recording,
+            files[name],
+        )
+        extract_continuous_mua(
+            ContinuousMuaConfig(chunk_layout=layouts[2]),
+            decimation_config,
+            recording,
+            files[name],
+        )
+
+    contiguous, chunked = files["contiguous"]._file, files["chunked"]._file
+    assert chunked["CONT1/DATA"].chunks == (1000, 3)
+    assert chunked["CONT2001/DATA"].chunks == (500, 1)
+    assert chunked["CONT4001/DATA"].chunks == (100, 1)
+    for cont_id in files["contiguous"].get_cont_group_ids():
+        assert contiguous[f"CONT{cont_id}/DATA"].chunks is None
+        np.testing.assert_array_equal(
+            chunked[f"CONT{cont_id}/DATA"][:], contiguous[f"CONT{cont_id}/DATA"][:]
+        )
+
+
+def test_compression_dataset_options():
+    assert Compression("gzip").dataset_options() == {
+        "compression": "gzip",
+        "compression_opts": 4,
+        "shuffle": True,
+    }
+    assert Compression("lzf", shuffle=False).dataset_options() == {
+        "compression": "lzf",
+        "shuffle": False,
+    }
+    with pytest.raises(ValueError):
+        Compression("rar").dataset_options()
+
+
+def test_plugin_codecs_require_hdf5plugin():
+    if importlib.util.find_spec("hdf5plugin") is None:
+        with pytest.raises(ImportError, match="hdf5plugin"):
+            Compression("zstd").dataset_options()
+    else:
+        assert "compression" in Compression("zstd").dataset_options()
+
+
+@pytest.mark.parametrize("decimation_chunk_size", [None, 4096])
+def test_cont_groups_are_compressed_per_range(tmp_path, caplog, decimation_chunk_size):
+    recording = create_recording(create_spiking_samples(n_channels=3))
+    policy = {
+        ContGroups.RAW: Compression("lzf"),
+        ContGroups.LFP: Compression("gzip", level=6),
+        ContGroups.ESA: Compression("gzip", level=1),
+    }
+
+    files = {}
+    for name, compression_policy in (("uncompressed", None), ("compressed", policy)):
+        config = OpenEphysToDhConfig(
+            raw_config=RawConfig(oe_processor_cont_group_map={"test_stream": "RAW"}),
+            decimation_config=DecimationConfig(chunk_size=decimation_chunk_size),
+            event_config=None,
+            trialmap_config=None,
+            spike_cutting_config=None,
+            continuous_mua_config=ContinuousMuaConfig(),
+            compression_policy=compression_policy,
+        )
+        apply_compression_policy(config)
+        files[name] = create_dh_file(
+            tmp_path / f"{name}.dh5", overwrite=True, validate=False
+        )
+        with caplog.at_level(logging.INFO, logger="oecon.storage"):
+            process_oe_raw_data(config.raw_config, recording, files[name])
+            decimation_config = decimate_raw_data(
+                config.decimation_config, recording, files[name]
+            )
+            extract_continuous_mua(
+                config.continuous_mua_config, decimation_config, recording, files[name]
+            )
+
+    uncompressed, compressed = files["uncompressed"]._file, files["compressed"]._file
+    assert compressed["CONT1/DATA"].compression == "lzf"
+    assert compressed["CONT2001/DATA"].compression_opts == 6
+    assert compressed["CONT4001/DATA"].compression_opts == 1
+    assert "/CONT2001: compressed with gzip by" in caplog.text
+    for cont_id in files["uncompressed"].get_cont_group_ids():
+        assert uncompressed[f"CONT{cont_id}/DATA"].compression is None
+        np.testing.assert_array_equal(
+            compressed[f"CONT{cont_id}/DATA"][:], uncompressed[f"CONT{cont_id}/DATA"][:]
+        )
+    for cont_id in (1, 2001, 4001):
+        data = compressed[f"CONT{cont_id}/DATA"]
+        assert data.id.get_storage_size() < data.size * data.dtype.itemsize
+
+
+def test_stage_compression_overrides_policy():
+    config = OpenEphysToDhConfig(
+        raw_config=RawConfig(),
+        decimation_config=DecimationConfig(compression=Compression("lzf")),
+        event_config=None,
+        trialmap_config=None,
+        spike_cutting_config=None,
+        continuous_mua_config=ContinuousMuaConfig(),
+        compression_policy=DEFAULT_COMPRESSION_POLICY,
+    )
+    apply_compression_policy(config)
+    assert config.raw_config.compression == Compression("lzf")
+    assert config.decimation_config.compression == Compression("lzf")
+    assert config.continuous_mua_config.compression == Compression("gzip", level=4)
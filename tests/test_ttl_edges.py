@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from oecon.events import Event, EventMetadata, decode_ttl_edges
+
+
+def make_ttl_event(states, initial_state: int = 0) -> Event:
+    states = np.asarray(states, dtype=np.int16)
+    sample_numbers = np.arange(len(states), dtype=np.int64) * 10
+    return Event(
+        metadata=EventMetadata(
+            channel_name="",
+            folder_name="TTL",
+            identifier="",
+            sample_rate=30000.0,
+            stream_name="PXIe-6341",
+            type="",
+            description="",
+            source_processor="NI-DAQmx",
+            initial_state=initial_state,
+        ),
+        full_words=np.zeros(len(states), dtype=np.uint64),
+        timestamps=sample_numbers / 30000.0,
+        states=states,
+        sample_numbers=sample_numbers,
+    )
+
+
+def reference_words(states, initial_state):
+    word = initial_state
+    words = []
+    for state in states:
+        bit = 1 << (abs(int(state)) - 1)
+        word = word | bit if state > 0 else word & ~bit
+        words.append(word)
+    return words
+
+
+def test_decodes_edges_and_words():
+    edges = decode_ttl_edges(make_ttl_event([1, 3, -1, 2, -3, -2], initial_state=0))
+
+    np.testing.assert_array_equal(edges.lines, [0, 2, 0, 1, 2, 1])
+    np.testing.assert_array_equal(edges.rising, [1, 1, 0, 1, 0, 0])
+    np.testing.assert_array_equal(edges.words(), [0b001, 0b101, 0b100, 0b110, 0b010, 0])
+    np.testing.assert_array_equal(edges.event_codes(), [1, 3, -1, 2, -3, -2])
+
+
+def test_repeated_edges_and_initial_state():
+    # line 2 starts high, line 1 is set twice
+    states = [-2, 1, 1, -1, 2]
+    edges = decode_ttl_edges(make_ttl_event(states, initial_state=0b10))
+    np.testing.assert_array_equal(edges.words(), [0b00, 0b01, 0b01, 0b00, 0b10])
+
+
+def test_matches_reference_for_16_lines():
+    rng = np.random.default_rng(42)
+    lines = rng.integers(1, 17, 5000)
+    states = np.where(rng.random(5000) > 0.5, lines, -lines)
+
+    edges = decode_ttl_edges(make_ttl_event(states, initial_state=0x0F0F))
+
+    np.testing.assert_array_equal(edges.words(), reference_words(states, 0x0F0F))
+    np.testing.assert_array_equal(edges.event_codes(), states)
+
+
+def test_line_table():
+    edges = decode_ttl_edges(make_ttl_event([1, 2, -1, -2, 1]))
+    line = edges.line(0)
+    np.testing.assert_array_equal(line.rising, [True, False, True])
+    np.testing.assert_array_equal(line.sample_numbers, [0, 20, 40])
+    np.testing.assert_array_equal(line.words(), [0b01, 0b00, 0b01])
+
+
+def test_empty_stream():
+    edges = decode_ttl_edges(make_ttl_event([]))
+    assert len(edges) == 0
+    assert edges.words().size == 0
+
+
+def test_zero_state_raises():
+    with pytest.raises(ValueError, match="non-zero"):
+        decode_ttl_edges(make_ttl_event([1, 0, -1]))